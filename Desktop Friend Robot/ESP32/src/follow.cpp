@@ -14,17 +14,25 @@ static unsigned long lastMovementTime = 0;
 static bool servosAttached = false;
 static const unsigned long DETACH_DELAY = 1000;
 
+void setPanTarget(float angle) {
+  panTarget = constrain(angle, (float)Body_MIN, (float)Body_MAX);
+}
+
+void setHeadTarget(float angle) {
+  headTarget = constrain(angle, (float)Head_MIN, (float)Head_MAX);
+}
+
 void parsePanCommand(String s) {
   s.trim();
   if (s.length() > 0) {
-    panTarget = constrain(s.toFloat(), (float)Body_MIN, (float)Body_MAX);
+    setPanTarget(s.toFloat());
   }
 }
 
 void parseHeadCommand(String s) {
   s.trim();
   if (s.length() > 0) {
-    headTarget = constrain(s.toFloat(), (float)Head_MIN, (float)Head_MAX);
+    setHeadTarget(s.toFloat());
   }
 }
 
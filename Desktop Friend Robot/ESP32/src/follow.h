@@ -4,6 +4,8 @@
 #include <Arduino.h>
 #include "servo.h"
 
+void setPanTarget(float angle);
+void setHeadTarget(float angle);
 void parsePanCommand(String s);
 void parseHeadCommand(String s);
 void updateTracking();
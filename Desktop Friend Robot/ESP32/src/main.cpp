@@ -7,6 +7,7 @@
 #include "radar.h"
 #include "follow.h"
 #include "haptic.h"
+#include "protocol.h"
 
 const unsigned long LOOP_MS = 25;
 const int BOOT_PIN = 15;
@@ -27,6 +28,84 @@ void taskLight(void *pvParameters) {
   }
 }
 
+static void runPose(const char *pose) {
+  Serial.print("Executing pose: ");
+  Serial.println(pose);
+  if (!executePose(pose)) {
+    Serial.print("Unknown pose: ");
+    Serial.println(pose);
+  }
+}
+
+static void setHaptic(bool on) {
+  setHapticEnabled(on);
+  Serial.println(on ? "Haptic enabled" : "Haptic disabled");
+}
+
+void handleTextCommand(String &command) {
+  if (command.startsWith("Servo: ")) {
+    String pose = command.substring(7);
+    runPose(pose.c_str());
+  } else if (command.startsWith("Light: ")) {
+    handleSerialCommand(command.substring(7));
+  } else if (command.startsWith("LightBase: ")) {
+    handleBaseSerialCommand(command.substring(11));
+  } else if (command.startsWith("Haptic: ")) {
+    String arg = command.substring(8);
+    arg.trim();
+    setHaptic(arg == "1");
+  } else if (command.startsWith("Body: ")) {
+    String arg = command.substring(6);
+    parsePanCommand(arg);
+  } else if (command.startsWith("Head: ")) {
+    String arg = command.substring(6);
+    parseHeadCommand(arg);
+  } else if (command == "Proto: bin1") {
+    Serial.println("Proto: bin1 OK");
+    setBinaryOutput(true);
+  } else if (command == "Proto: text") {
+    setBinaryOutput(false);
+    Serial.println("Proto: text OK");
+  }
+}
+
+void handleFrame(uint8_t type, const uint8_t *payload, uint8_t len) {
+  char text[FRAME_MAX_PAYLOAD + 1];
+  switch (type) {
+    case T_SERVO:
+      memcpy(text, payload, len);
+      text[len] = '\0';
+      runPose(text);
+      break;
+    case T_LIGHT:
+    case T_LIGHTBASE:
+      memcpy(text, payload, len);
+      text[len] = '\0';
+      if (type == T_LIGHT) {
+        handleSerialCommand(String(text));
+      } else {
+        handleBaseSerialCommand(String(text));
+      }
+      break;
+    case T_HAPTIC:
+      if (len == 1) setHaptic(payload[0] == 1);
+      break;
+    case T_BODY:
+    case T_HEAD:
+      if (len == 2) {
+        float angle = (int16_t)(payload[0] | (payload[1] << 8)) / 10.0f;
+        if (type == T_BODY) {
+          setPanTarget(angle);
+        } else {
+          setHeadTarget(angle);
+        }
+      }
+      break;
+    default:
+      break;
+  }
+}
+
 void taskServo(void *pvParameters) {
   while (true) {
     static int lastBootPinState = LOW;
@@ -37,40 +116,7 @@ void taskServo(void *pvParameters) {
     }
     lastBootPinState = bootPinState;
 
-    while (Serial.available() > 0) {
-      String command = Serial.readStringUntil('\n');
-      command.trim();
-
-      if (command.startsWith("Servo: ")) {
-        String pose = command.substring(7);
-        Serial.print("Executing pose: ");
-        Serial.println(pose);
-        if (!executePose(pose.c_str())) {
-          Serial.print("Unknown pose: ");
-          Serial.println(pose);
-        }
-      } else if (command.startsWith("Light: ")) {
-        handleSerialCommand(command.substring(7));
-      } else if (command.startsWith("LightBase: ")) {
-        handleBaseSerialCommand(command.substring(11));
-      } else if (command.startsWith("Haptic: ")) {
-        String arg = command.substring(8);
-        arg.trim();
-        if (arg == "1") {
-          setHapticEnabled(true);
-          Serial.println("Haptic enabled");
-        } else {
-          setHapticEnabled(false);
-          Serial.println("Haptic disabled");
-        }
-      } else if (command.startsWith("Body: ")) {
-        String arg = command.substring(6);
-        parsePanCommand(arg);
-      } else if (command.startsWith("Head: ")) {
-        String arg = command.substring(6);
-        parseHeadCommand(arg);
-      }
-    }
+    pollSerialInput(handleTextCommand, handleFrame);
 
     if (!bootSequenceComplete && bootCommandTime != 0 && (millis() - bootCommandTime >= 1000)) {
       handleSerialCommand("Hex(B5B5B5) Brightness(100) Fade(0)");
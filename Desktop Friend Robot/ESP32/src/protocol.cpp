@@ -0,0 +1,66 @@
+#include "protocol.h"
+
+static volatile bool binaryOutput = false;
+
+static String textLine;
+static uint8_t frameBuf[3 + FRAME_MAX_PAYLOAD + 1];
+static int framePos = -1;
+static int frameNeed = 0;
+
+void setBinaryOutput(bool on) {
+  binaryOutput = on;
+}
+
+bool isBinaryOutput() {
+  return binaryOutput;
+}
+
+uint8_t crc8(const uint8_t *data, size_t len) {
+  uint8_t crc = 0;
+  for (size_t i = 0; i < len; i++) {
+    crc ^= data[i];
+    for (int b = 0; b < 8; b++) {
+      crc = (crc & 0x80) ? (uint8_t)((crc << 1) ^ 0x07) : (uint8_t)(crc << 1);
+    }
+  }
+  return crc;
+}
+
+void sendFrame(uint8_t type, const uint8_t *payload, uint8_t len) {
+  uint8_t out[3 + FRAME_MAX_PAYLOAD + 1];
+  out[0] = FRAME_SYNC;
+  out[1] = type;
+  out[2] = len;
+  memcpy(out + 3, payload, len);
+  out[3 + len] = crc8(out + 1, len + 2);
+  Serial.write(out, len + 4);
+}
+
+void pollSerialInput(TextHandler onText, FrameHandler onFrame) {
+  while (Serial.available() > 0) {
+    uint8_t c = (uint8_t)Serial.read();
+
+    if (framePos >= 0) {
+      frameBuf[framePos++] = c;
+      if (framePos == 3) {
+        frameNeed = 3 + frameBuf[2] + 1;
+      }
+      if (framePos >= 3 && framePos == frameNeed) {
+        if (crc8(frameBuf + 1, frameNeed - 2) == frameBuf[frameNeed - 1]) {
+          onFrame(frameBuf[1], frameBuf + 3, frameBuf[2]);
+        }
+        framePos = -1;
+      }
+    } else if (c == FRAME_SYNC) {
+      frameBuf[0] = c;
+      framePos = 1;
+      frameNeed = 0;
+    } else if (c == '\n') {
+      textLine.trim();
+      onText(textLine);
+      textLine = "";
+    } else if (textLine.length() < 256) {
+      textLine += (char)c;
+    }
+  }
+}
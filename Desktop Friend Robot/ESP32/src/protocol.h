@@ -0,0 +1,27 @@
+#ifndef PROTOCOL_H
+#define PROTOCOL_H
+#include <Arduino.h>
+
+const uint8_t FRAME_SYNC = 0xA5;
+const uint8_t FRAME_MAX_PAYLOAD = 255;
+
+const uint8_t T_SERVO = 0x01;
+const uint8_t T_LIGHT = 0x02;
+const uint8_t T_LIGHTBASE = 0x03;
+const uint8_t T_HAPTIC = 0x04;
+const uint8_t T_BODY = 0x05;
+const uint8_t T_HEAD = 0x06;
+const uint8_t T_SLEEP = 0x07;
+const uint8_t T_TOUCH = 0x10;
+const uint8_t T_RADAR = 0x11;
+
+typedef void (*TextHandler)(String &line);
+typedef void (*FrameHandler)(uint8_t type, const uint8_t *payload, uint8_t len);
+
+void setBinaryOutput(bool on);
+bool isBinaryOutput();
+uint8_t crc8(const uint8_t *data, size_t len);
+void sendFrame(uint8_t type, const uint8_t *payload, uint8_t len);
+void pollSerialInput(TextHandler onText, FrameHandler onFrame);
+
+#endif
@@ -1,4 +1,5 @@
 #include "radar.h"
+#include "protocol.h"
 
 static int lastRadarState = -1;
 static bool firstCheckDone = false;
@@ -36,7 +37,12 @@ void readSerialData() {
         int currentState = (range <= 10) ? 1 : 0;
 
         if (currentState != lastRadarState) {
-          Serial.println("Radar: " + String(currentState));
+          if (isBinaryOutput()) {
+            uint8_t state = (uint8_t)currentState;
+            sendFrame(T_RADAR, &state, 1);
+          } else {
+            Serial.println("Radar: " + String(currentState));
+          }
           lastRadarState = currentState;
           firstCheckDone = true;
         }
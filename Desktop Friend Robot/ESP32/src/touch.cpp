@@ -1,4 +1,5 @@
 #include "touch.h"
+#include "protocol.h"
 #include <string.h>
 
 static int L_Body_touchThreshold, L_Body_baselineValue;
@@ -78,19 +79,26 @@ void taskTouch(void *pvParameters) {
 
     TouchStates currentTouchStates = getAllTouchStates();
     if (memcmp(&currentTouchStates, &lastTouchStates, sizeof(TouchStates)) != 0) {
-      Serial.print("Touch: ");
-      Serial.print("L_BODY=");
-      Serial.print(currentTouchStates.L_Body ? "1" : "0");
-      Serial.print(", R_BODY=");
-      Serial.print(currentTouchStates.R_Body ? "1" : "0");
-      Serial.print(", F_BODY=");
-      Serial.print(currentTouchStates.F_Body ? "1" : "0");
-      Serial.print(", B_BODY=");
-      Serial.print(currentTouchStates.B_Body ? "1" : "0");
-      Serial.print(", L_HEAD=");
-      Serial.print(currentTouchStates.L_Head ? "1" : "0");
-      Serial.print(", R_HEAD=");
-      Serial.println(currentTouchStates.R_Head ? "1" : "0");
+      if (isBinaryOutput()) {
+        uint8_t mask = (currentTouchStates.L_Body ? 0x01 : 0) | (currentTouchStates.R_Body ? 0x02 : 0) |
+                       (currentTouchStates.F_Body ? 0x04 : 0) | (currentTouchStates.B_Body ? 0x08 : 0) |
+                       (currentTouchStates.L_Head ? 0x10 : 0) | (currentTouchStates.R_Head ? 0x20 : 0);
+        sendFrame(T_TOUCH, &mask, 1);
+      } else {
+        Serial.print("Touch: ");
+        Serial.print("L_BODY=");
+        Serial.print(currentTouchStates.L_Body ? "1" : "0");
+        Serial.print(", R_BODY=");
+        Serial.print(currentTouchStates.R_Body ? "1" : "0");
+        Serial.print(", F_BODY=");
+        Serial.print(currentTouchStates.F_Body ? "1" : "0");
+        Serial.print(", B_BODY=");
+        Serial.print(currentTouchStates.B_Body ? "1" : "0");
+        Serial.print(", L_HEAD=");
+        Serial.print(currentTouchStates.L_Head ? "1" : "0");
+        Serial.print(", R_HEAD=");
+        Serial.println(currentTouchStates.R_Head ? "1" : "0");
+      }
     }
 
     lastTouchStates = currentTouchStates;
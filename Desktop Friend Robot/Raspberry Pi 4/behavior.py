@@ -0,0 +1,135 @@
+import threading
+
+ANY_STATE = "*"
+
+
+class Region:
+    __slots__ = ("name", "states", "state", "timeouts", "timer", "token")
+
+    def __init__(self, name, states, initial, timeouts):
+        self.name = name
+        self.states = states
+        self.state = initial
+        self.timeouts = timeouts
+        self.timer = None
+        self.token = 0
+
+
+class StateMachine:
+    def __init__(self, spec, actions, guards, scheduler, context):
+        self.scheduler = scheduler
+        self.context = context
+        self.lock = threading.RLock()
+        self.regions = []
+        self.by_name = {}
+        self.table = {}
+        self.events = 0
+        self.transitions = 0
+        self.ignored = 0
+        self.compile(spec, actions, guards)
+
+    def compile(self, spec, actions, guards):
+        def lookup(names, kind, name):
+            if name not in names:
+                raise ValueError(f"Unknown {kind} {name!r}")
+            return names[name]
+
+        for index, (name, region_spec) in enumerate(spec.items()):
+            states = tuple(region_spec["states"])
+            initial = region_spec.get("initial", states[0])
+            known = dict.fromkeys(states + (ANY_STATE,))
+            lookup(dict.fromkeys(states), "state", initial)
+            timeouts = {}
+            for state, (delay, event) in region_spec.get("timeouts", {}).items():
+                lookup(dict.fromkeys(states), "state", state)
+                timeouts[state] = (delay, event)
+            region = Region(name, states, initial, timeouts)
+            self.regions.append(region)
+            self.by_name[name] = region
+
+            rows = {}
+            for source, event, guard, target, names in region_spec["transitions"]:
+                lookup(known, "state", source)
+                if target is not None:
+                    lookup(known, "state", target)
+                compiled = (
+                    lookup(guards, "guard", guard) if guard else None,
+                    target,
+                    tuple(lookup(actions, "action", a) for a in names),
+                )
+                sources = states if source == ANY_STATE else (source,)
+                for state in sources:
+                    rows.setdefault(event, {}).setdefault(state, []).append((source == ANY_STATE, compiled))
+            for event, by_state in rows.items():
+                frozen = {}
+                for state, entries in by_state.items():
+                    entries.sort(key=lambda entry: entry[0])
+                    frozen[state] = tuple(compiled for _, compiled in entries)
+                self.table.setdefault(event, []).append((index, frozen))
+
+        for region in self.regions:
+            if region.state in region.timeouts:
+                self.enter(region)
+
+    def in_state(self, region, *states):
+        return self.by_name[region].state in states
+
+    def state(self):
+        return {region.name: region.state for region in self.regions}
+
+    def dispatch(self, event):
+        with self.lock:
+            self.send(event)
+
+    def send(self, event):
+        self.events += 1
+        handled = False
+        for index, by_state in self.table.get(event, ()):
+            region = self.regions[index]
+            for guard, target, actions in by_state.get(region.state, ()):
+                if guard is None or guard(self.context):
+                    self.transition(region, target, actions)
+                    handled = True
+                    break
+        if not handled:
+            self.ignored += 1
+
+    def transition(self, region, target, actions):
+        self.transitions += 1
+        if target is not None:
+            self.exit(region)
+            region.state = target
+            self.enter(region)
+        for action in actions:
+            action(self.context)
+
+    def exit(self, region):
+        if region.timer is not None:
+            region.timer.cancel()
+            region.timer = None
+
+    def enter(self, region):
+        timeout = region.timeouts.get(region.state)
+        if timeout is None:
+            return
+        delay, event = timeout
+        region.token += 1
+        token = region.token
+
+        def expire():
+            with self.lock:
+                if region.token != token or region.timer is None:
+                    return
+                region.timer = None
+                self.send(event)
+        region.timer = self.scheduler.call_later(delay, expire)
+
+    def stop(self):
+        with self.lock:
+            for region in self.regions:
+                self.exit(region)
+
+    def stats(self):
+        with self.lock:
+            return {"events": self.events, "transitions": self.transitions, "ignored": self.ignored,
+                    "state": self.state()}
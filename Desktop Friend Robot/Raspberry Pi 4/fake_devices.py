@@ -0,0 +1,237 @@
+import os
+import tty
+import math
+import time
+import select
+import threading
+import numpy as np
+from screen_frames import DISPLAY_W, DISPLAY_H, to_rgb565
+
+SPI_BAUDRATE = 32000000
+
+
+class FakeDisplay:
+    def __init__(self, width=DISPLAY_W, height=DISPLAY_H, baudrate=0):
+        self.width = width
+        self.height = height
+        self.baudrate = baudrate
+        self.frames = 0
+        self.blocks = 0
+        self.bytes_sent = 0
+        self.last_frame_time = None
+
+    def image(self, img):
+        if img.size != (self.width, self.height):
+            raise ValueError(f"Image must be {self.width}x{self.height}, got {img.size}")
+        pixels = bytearray(to_rgb565(img))
+        self._block(0, 0, self.width - 1, self.height - 1, pixels)
+
+    def _block(self, x0, y0, x1, y1, data):
+        nbytes = 5 + 5 + 1 + memoryview(data).nbytes
+        self.blocks += 1
+        self.bytes_sent += nbytes
+        if self.baudrate:
+            time.sleep(nbytes * 8 / self.baudrate)
+        if x0 == 0 and y0 == 0 and x1 == self.width - 1 and y1 == self.height - 1:
+            self.frames += 1
+        self.last_frame_time = time.monotonic()
+
+    def reset_counters(self):
+        self.frames = 0
+        self.blocks = 0
+        self.bytes_sent = 0
+
+
+class FakeSerial:
+    def __init__(self):
+        self.writes = 0
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.writes += 1
+        self.bytes_written += len(data)
+        return len(data)
+
+
+class FakeMessage:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload.encode("utf-8") if isinstance(payload, str) else payload
+
+
+class FakeClient:
+    def __init__(self):
+        self.published = []
+        self.subscriptions = set()
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.published.append((time.monotonic(), topic, payload))
+
+    def subscribe(self, topic, *args, **kwargs):
+        self.subscriptions.add(topic)
+
+    def unsubscribe(self, topic, *args, **kwargs):
+        self.subscriptions.discard(topic)
+
+
+class FakeESP32:
+    def __init__(self, baudrate=0):
+        self.baudrate = baudrate
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.sent = []
+        self.received = []
+        self.raw = bytearray()
+        self.bytes_received = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._read_loop, daemon=True)
+        self.thread.start()
+
+    def send_line(self, line):
+        self.sent.append((time.monotonic(), line))
+        os.write(self.master, f"{line}\n".encode("utf-8"))
+
+    def send_bytes(self, data):
+        self.sent.append((time.monotonic(), data))
+        os.write(self.master, data)
+
+    def _read_loop(self):
+        buf = bytearray()
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master, 64 if self.baudrate else 4096)
+            except OSError:
+                break
+            if self.baudrate:
+                time.sleep(len(data) * 10 / self.baudrate)
+            now = time.monotonic()
+            self.bytes_received += len(data)
+            self.raw += data
+            buf += data
+            while True:
+                end = buf.find(b"\n")
+                if end < 0:
+                    break
+                self.received.append((now, bytes(buf[:end])))
+                del buf[:end + 1]
+
+    def close(self):
+        self.running = False
+        self.thread.join(timeout=1)
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class FakeCamera:
+    def __init__(self, width=640, height=480, fps=30.0, period=6.0, person_w=120, person_h=300, step=None, yuv=False):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.period = period
+        self.person_w = person_w
+        self.person_h = person_h
+        self.step = step
+        self.yuv = yuv
+        self.frames = 0
+        self.sensor_frame = 0
+        self.started_at = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self.sensor_frame = 0
+
+    def stop(self):
+        pass
+
+    def person_box(self, t):
+        cx = self.width / 2 + self.width * 0.35 * math.sin(2 * math.pi * t / self.period)
+        x0 = int(cx - self.person_w / 2)
+        y0 = (self.height - self.person_h) // 2
+        return x0, y0, x0 + self.person_w, y0 + self.person_h
+
+    def capture(self):
+        if self.started_at is None:
+            self.start()
+        if self.fps:
+            period = 1.0 / self.fps
+            self.sensor_frame = max(self.sensor_frame, int((time.monotonic() - self.started_at) / period)) + 1
+            delay = self.started_at + self.sensor_frame * period - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        frame = np.full((self.height, self.width, 3), 40, dtype=np.uint8)
+        t = self.frames * self.step if self.step else time.monotonic() - self.started_at
+        x0, y0, x1, y1 = self.person_box(t)
+        frame[y0:y1, max(0, x0):max(0, x1)] = 200
+        self.frames += 1
+        if self.yuv:
+            import cv2
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420)
+        return frame
+
+
+class VideoCamera:
+    def __init__(self, path, fps=30.0, loop=True):
+        import cv2
+        self.fps = fps
+        self.loop = loop
+        self.video = []
+        cap = cv2.VideoCapture(path)
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            self.video.append(frame)
+        cap.release()
+        if not self.video:
+            raise ValueError(f"No frames in {path}")
+        self.frames = 0
+        self.next_frame = None
+
+    def start(self):
+        self.next_frame = time.monotonic()
+
+    def stop(self):
+        pass
+
+    def capture(self):
+        if self.next_frame is None:
+            self.start()
+        if self.fps:
+            delay = self.next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_frame = max(self.next_frame + 1.0 / self.fps, time.monotonic())
+        if self.frames >= len(self.video) and not self.loop:
+            raise EOFError("End of video")
+        frame = self.video[self.frames % len(self.video)].copy()
+        self.frames += 1
+        return frame
+
+
+class StubDetector:
+    def __init__(self, latency=0.05, busy=False):
+        self.latency = latency
+        self.busy = busy
+        self.calls = 0
+
+    def detect(self, frame):
+        start = time.monotonic()
+        mask = frame[..., 1] > 128
+        cols = np.flatnonzero(mask.any(axis=0))
+        rows = np.flatnonzero(mask.any(axis=1))
+        dets = np.empty((0, 6), dtype=np.float32)
+        if cols.size and rows.size:
+            dets = np.array([[cols[0], rows[0], cols[-1] + 1, rows[-1] + 1, 0.9, 0]], dtype=np.float32)
+        if self.busy:
+            while time.monotonic() - start < self.latency:
+                pass
+        else:
+            delay = self.latency - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+        self.calls += 1
+        return dets
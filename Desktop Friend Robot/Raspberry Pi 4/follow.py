@@ -5,16 +5,20 @@ import signal
 import argparse
 import threading
 import numpy as np
-from ultralytics import YOLO
-from picamera2 import Picamera2
 import paho.mqtt.client as mqtt
+from follow_pipeline import FollowPipeline
+from follow_governor import CPU_BUDGET, GOVERNOR_RATES, RateGovernor
+from follow_people import PersonTracker, iou_matrix
 
 MODEL_PATH = "yolov8n.onnx"
+BACKENDS = ("ultralytics", "onnx")
 FRAME_W, FRAME_H = 640, 480
 MODEL_W, MODEL_H = 128, 128
+LORES_W, LORES_H = 160, 120
 
 CROP_BOTTOM = 50
 CROP_RIGHT = 90
+CROP_W, CROP_H = FRAME_W - CROP_RIGHT, FRAME_H - CROP_BOTTOM
 
 PAN_MIN, PAN_MAX = 0, 180
 PAN_NEUTRAL = 90
@@ -32,8 +36,18 @@ MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
 MQTT_TOPIC_FOLLOW = "/follow"
 MQTT_TOPIC_SERVO = "/servo"
+MQTT_TOPIC_SLEEP = "/sleep"
+MQTT_TOPIC_RADAR = "/radar"
 
+PAN_MIN_DELTA = 1.0
+PAN_MAX_RATE = 15.0
+PAN_SETTLE_TIME = 0.2
+
+PERSON_CLASS = 0
 PERSON_CONF_THRESH = 0.2
+PERSON_FORGET_TIME = 0.8
+WINDOW_NAME = "YOLO Smooth Stable 1D Tracking"
+
 def clamp(val, min_val, max_val):
     return max(min_val, min(max_val, val))
 
@@ -45,12 +59,328 @@ def publish_wave(client, topic):
 
 def has_display_env():
     return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+def crop_frame(frame):
+    h, w = frame.shape[:2]
+    return frame[0:h - CROP_BOTTOM * h // FRAME_H, 0:w - CROP_RIGHT * w // FRAME_W]
+
+class Preprocessor:
+    def __init__(self, keep_frame=False):
+        self.keep_frame = keep_frame
+        self.out = np.empty((MODEL_H, MODEL_W, 3), dtype=np.uint8)
+        self.bgr = None
+
+    def __call__(self, frame):
+        if frame.ndim == 2:
+            h, w = frame.shape[0] * 2 // 3, frame.shape[1]
+            if self.bgr is None or self.bgr.shape[:2] != (h, w):
+                self.bgr = np.empty((h, w, 3), dtype=np.uint8)
+            cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_I420, dst=self.bgr)
+            frame = self.bgr
+        frame = crop_frame(frame)
+        cv2.resize(frame, (MODEL_W, MODEL_H), dst=self.out)
+        return (frame if self.keep_frame else None), self.out
+
+def largest_person(dets, conf_thresh=PERSON_CONF_THRESH):
+    if len(dets) == 0:
+        return None
+    persons = dets[(dets[:, 5] == PERSON_CLASS) & (dets[:, 4] >= conf_thresh)]
+    if len(persons) == 0:
+        return None
+    areas = (persons[:, 2] - persons[:, 0]) * (persons[:, 3] - persons[:, 1])
+    return persons[areas.argmax()]
+
+def primary_person(dets, primary_box, conf_thresh=PERSON_CONF_THRESH):
+    if primary_box is None:
+        return largest_person(dets, conf_thresh)
+    if len(dets) == 0:
+        return None
+    persons = dets[(dets[:, 5] == PERSON_CLASS) & (dets[:, 4] >= conf_thresh)]
+    if len(persons) == 0:
+        return None
+    box = primary_box / np.array((CROP_W / MODEL_W, CROP_H / MODEL_H) * 2, dtype=np.float32)
+    overlap = iou_matrix(box[None, :], persons[:, :4])[0]
+    if overlap.max() <= 0:
+        return largest_person(dets, conf_thresh)
+    return persons[overlap.argmax()]
+
+def person_boxes(dets, scale_x, scale_y, conf_thresh=PERSON_CONF_THRESH):
+    if len(dets) == 0:
+        return np.empty((0, 4), dtype=np.float32)
+    persons = dets[(dets[:, 5] == PERSON_CLASS) & (dets[:, 4] >= conf_thresh), :4]
+    return persons * np.array((scale_x, scale_y, scale_x, scale_y), dtype=np.float32)
+
+class YoloDetector:
+    def __init__(self, path=MODEL_PATH):
+        from ultralytics import YOLO
+        self.model = YOLO(path, task="detect")
+
+    def detect(self, frame_resized):
+        return self.model(frame_resized)[0].boxes.data.cpu().numpy()
+
+class PicameraSource:
+    def __init__(self, size=(FRAME_W, FRAME_H), lores=None):
+        from picamera2 import Picamera2
+        self.picam2 = Picamera2()
+        self.stream = "main"
+        streams = {"main": {"size": size, "format": "RGB888"}}
+        if lores:
+            streams["lores"] = {"size": lores, "format": "YUV420"}
+            self.stream = "lores"
+        cam_config = self.picam2.create_preview_configuration(**streams)
+        self.picam2.configure(cam_config)
+
+    def start(self):
+        self.picam2.start()
+
+    def capture(self):
+        return self.picam2.capture_array(self.stream)
+
+    def stop(self):
+        self.picam2.stop()
+
+def make_detector(backend, path=MODEL_PATH, keyframe_interval=1, select=largest_person):
+    if backend == "onnx":
+        from follow_onnx import OnnxDetector
+        detector = OnnxDetector(path, PERSON_CONF_THRESH)
+    else:
+        detector = YoloDetector(path)
+    if keyframe_interval > 1:
+        from follow_track import RoiTracker
+        detector = RoiTracker(detector, select, keyframe_interval)
+    return detector
+
+def make_infer(detector, preprocess=None):
+    preprocess = preprocess or Preprocessor()
+    def infer(frame):
+        frame, frame_resized = preprocess(frame)
+        return frame, detector.detect(frame_resized)
+    return infer
+
+class PanPublisher:
+    def __init__(self, client, topic, min_delta=PAN_MIN_DELTA, max_rate=PAN_MAX_RATE,
+                 settle_time=PAN_SETTLE_TIME, clock=time.monotonic):
+        self.client = client
+        self.topic = topic
+        self.min_delta = min_delta
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.settle_time = settle_time
+        self.clock = clock
+        self.last_angle = None
+        self.last_sent = 0.0
+        self.pending = None
+        self.published = 0
+        self.settles = 0
+        self.suppressed_same = 0
+        self.suppressed_delta = 0
+        self.suppressed_rate = 0
+
+    def send(self, angle, now):
+        publish_follow(self.client, angle, self.topic)
+        self.last_angle = angle
+        self.last_sent = now
+        self.pending = None
+        self.published += 1
+
+    def update(self, angle):
+        angle = round(angle, 1)
+        now = self.clock()
+        if angle == self.last_angle:
+            self.pending = None
+            self.suppressed_same += 1
+        elif self.last_angle is not None and abs(angle - self.last_angle) < self.min_delta:
+            self.pending = angle
+            self.suppressed_delta += 1
+        elif now - self.last_sent < self.min_interval:
+            self.pending = angle
+            self.suppressed_rate += 1
+        else:
+            self.send(angle, now)
+
+    def tick(self):
+        if self.pending is None:
+            return
+        now = self.clock()
+        if now - self.last_sent >= max(self.min_interval, self.settle_time):
+            self.send(self.pending, now)
+            self.settles += 1
+
+    def stats(self):
+        return {
+            "published": self.published,
+            "settles": self.settles,
+            "suppressed_same": self.suppressed_same,
+            "suppressed_delta": self.suppressed_delta,
+            "suppressed_rate": self.suppressed_rate,
+        }
+
+class FollowController:
+    def __init__(self, client, topic, sleeping, gui=False, clock=time.time, pan=None, tracker=None):
+        self.client = client
+        self.topic = topic
+        self.sleeping = sleeping
+        self.gui = gui
+        self.clock = clock
+        self.pan = pan or PanPublisher(client, topic)
+        self.tracker = tracker or PersonTracker(max_age=PERSON_FORGET_TIME, clock=clock)
+        self.primary_box = None
+        self.stop_requested = False
+        self.window_ok = False
+        self.pan_angle = PAN_NEUTRAL
+        self.person_state = {
+            "detected_before": False,
+            "in_deadzone": False,
+            "has_waved_for_current_target": False,
+            "last_seen_time": None,
+            "target_id": None
+        }
+
+    def reset_person(self):
+        self.person_state["detected_before"] = False
+        self.person_state["in_deadzone"] = False
+        self.person_state["has_waved_for_current_target"] = False
+        self.person_state["last_seen_time"] = None
+        self.person_state["target_id"] = None
+        self.primary_box = None
+        self.tracker.reset()
+
+    def handle(self, result):
+        frame, dets = result
+        person_state = self.person_state
+        curr_w, curr_h = CROP_W, CROP_H
+
+        target = self.tracker.update(person_boxes(dets, curr_w / MODEL_W, curr_h / MODEL_H))
+        self.primary_box = None if target is None else target.box
+        seen = target is not None and target.visible
+        if seen:
+            x1, y1, x2, y2 = target.box.astype(int).tolist()
+
+            cx = (x1 + x2) // 2
+            cy = (y1 + y2) // 2
+
+            if self.gui and frame is not None:
+                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                cv2.circle(frame, (cx, cy), 4, (0, 0, 255), -1)
+
+            err_x = cx - curr_w // 2
+            velocity = 0 if abs(err_x) < DEADZONE_PIX else clamp(-err_x * KP_PAN, -MAX_STEP_DEG, MAX_STEP_DEG)
+            self.pan_angle = SMOOTH_ALPHA * self.pan_angle + (1 - SMOOTH_ALPHA) * clamp(self.pan_angle + velocity, PAN_LIMIT_MIN, PAN_LIMIT_MAX)
+            self.pan.update(self.pan_angle)
+
+            currently_in_deadzone = abs(err_x) < DEADZONE_PIX
+
+            if not self.sleeping.is_set():
+                if currently_in_deadzone and not target.waved:
+                    print(f"Centered on person #{target.id}! Publishing wave command...")
+                    publish_wave(self.client, MQTT_TOPIC_SERVO)
+                    target.waved = True
+
+            person_state["has_waved_for_current_target"] = target.waved
+            person_state["target_id"] = target.id
+            person_state["detected_before"] = True
+            person_state["in_deadzone"] = currently_in_deadzone
+            person_state["last_seen_time"] = self.clock()
+        else:
+            if person_state["detected_before"]:
+                time_since_last_seen = self.clock() - person_state["last_seen_time"] if person_state["last_seen_time"] else 999
+
+                if time_since_last_seen > PERSON_FORGET_TIME:
+                    print(f"No person detected for {PERSON_FORGET_TIME}s. Reset - waiting for next detection...")
+                    self.reset_person()
+            else:
+                person_state["last_seen_time"] = None
+
+        self.pan.tick()
+        if self.gui and frame is not None:
+            self.show(frame, seen)
+        return seen
+
+    def show(self, frame, seen):
+        person_state = self.person_state
+        try:
+            if not self.window_ok:
+                cv2.namedWindow(WINDOW_NAME, cv2.WINDOW_NORMAL)
+                self.window_ok = True
+
+            if person_state["in_deadzone"] and seen:
+                status = "Centered"
+            elif person_state["detected_before"] and seen:
+                status = f"Tracking #{person_state['target_id']}"
+            elif person_state["detected_before"] and not seen:
+                time_since = self.clock() - person_state["last_seen_time"] if person_state["last_seen_time"] else 0
+                status = f"Lost ({PERSON_FORGET_TIME - time_since:.1f}s)"
+            else:
+                status = "Waiting"
+
+            cv2.putText(frame, f"Pan:{self.pan_angle:.1f} [{status}]", (6, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+            cv2.imshow(WINDOW_NAME, frame)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                self.stop_requested = True
+        except cv2.error as e:
+            print(f"Disabling UI (OpenCV error: {e})")
+            self.gui = False
+            try:
+                cv2.destroyAllWindows()
+            except Exception:
+                pass
+
+class FollowState:
+    def __init__(self, controller, sleeping, governor=None):
+        self.controller = controller
+        self.sleeping = sleeping
+        self.governor = governor
+
+def on_connect(c, userdata, flags, rc, properties=None):
+    for sub_topic in (MQTT_TOPIC_SLEEP, MQTT_TOPIC_RADAR):
+        try:
+            c.subscribe(sub_topic)
+            print(f"Subscribed to {sub_topic}")
+        except Exception as e:
+            print(f"Subscribe {sub_topic} failed: {e}")
+
+def on_message(c, userdata: FollowState, msg):
+    st = userdata
+    payload = msg.payload.decode("utf-8", errors="ignore").strip().lower()
+    if msg.topic == MQTT_TOPIC_RADAR:
+        if st.governor and payload.startswith("radar:"):
+            st.governor.set_radar(payload.split(":", 1)[1].strip() == "1")
+    elif msg.topic == MQTT_TOPIC_SLEEP:
+        if payload.startswith("sleep:"):
+            payload = payload.split(":", 1)[1].strip()
+        if payload == "1":
+            st.sleeping.set()
+            st.controller.reset_person()
+            if st.governor:
+                st.governor.set_sleeping(True)
+            print("Sleep=1 -> pause wave")
+        elif payload == "0":
+            st.sleeping.clear()
+            st.controller.reset_person()
+            if st.governor:
+                st.governor.set_sleeping(False)
+            print("Sleep=0 -> resume wave")
+
 def main():
     parser = argparse.ArgumentParser(description="Publish follow angle to MQTT.")
     parser.add_argument("--gui", choices=["auto", "on", "off"], default="auto", help="Enable OpenCV UI.")
     parser.add_argument("--topic", default=MQTT_TOPIC_FOLLOW, help="MQTT topic to publish to.")
     parser.add_argument("--broker", default=MQTT_BROKER, help="MQTT broker host.")
     parser.add_argument("--port", type=int, default=MQTT_PORT, help="MQTT broker port.")
+    parser.add_argument("--model", default=MODEL_PATH, help="YOLO model file.")
+    parser.add_argument("--backend", choices=BACKENDS, default="ultralytics",
+                        help="Run the model through ultralytics or directly through ONNX Runtime.")
+    parser.add_argument("--keyframe-interval", type=int, default=1,
+                        help="Run full detection every N frames and track the target in between (1 = detect every frame).")
+    parser.add_argument("--pan-min-delta", type=float, default=PAN_MIN_DELTA,
+                        help="Only publish a new pan angle once it moved at least this many degrees.")
+    parser.add_argument("--pan-max-rate", type=float, default=PAN_MAX_RATE,
+                        help="Max pan messages per second (0 = unlimited).")
+    parser.add_argument("--governor", action=argparse.BooleanOptionalAction, default=True,
+                        help="Lower the detection rate while idle or asleep.")
+    parser.add_argument("--cpu-budget", type=float, default=CPU_BUDGET,
+                        help="Max share of one CPU core spent on inference (0 = no cap).")
+    parser.add_argument("--idle-fps", type=float, default=GOVERNOR_RATES["idle"], help="Detection rate with nobody around.")
+    parser.add_argument("--sleep-fps", type=float, default=GOVERNOR_RATES["sleep"], help="Detection rate while asleep.")
     args = parser.parse_args()
 
     gui = has_display_env() if args.gui == "auto" else (args.gui == "on")
@@ -63,42 +393,13 @@ def main():
     signal.signal(signal.SIGTERM, _handle_stop)
 
     sleeping = threading.Event()
-    person_state = {
-        "detected_before": False,
-        "in_deadzone": False,
-        "has_waved_for_current_target": False,
-        "last_seen_time": None
-    }
-
-    PERSON_FORGET_TIME = 0.8
-
     client = mqtt.Client()
-    def on_connect(c, userdata, flags, rc):
-        try:
-            c.subscribe("/sleep")
-            print("Subscribed to /sleep")
-        except Exception as e:
-            print(f"Subscribe /sleep failed: {e}")
-
-    def on_message(c, userdata, msg):
-        payload = msg.payload.decode("utf-8", errors="ignore").strip().lower()
-        if msg.topic == "/sleep":
-            if payload.startswith("sleep:"):
-                payload = payload.split(":", 1)[1].strip()
-            if payload == "1":
-                sleeping.set()
-                person_state["detected_before"] = False
-                person_state["in_deadzone"] = False
-                person_state["has_waved_for_current_target"] = False
-                person_state["last_seen_time"] = None
-                print("Sleep=1 -> pause wave")
-            elif payload == "0":
-                sleeping.clear()
-                person_state["detected_before"] = False
-                person_state["in_deadzone"] = False
-                person_state["has_waved_for_current_target"] = False
-                person_state["last_seen_time"] = None
-                print("Sleep=0 -> resume wave")
+    pan = PanPublisher(client, topic, args.pan_min_delta, args.pan_max_rate)
+    controller = FollowController(client, topic, sleeping, gui, pan=pan)
+    governor = None
+    if args.governor:
+        governor = RateGovernor({"idle": args.idle_fps, "sleep": args.sleep_fps}, args.cpu_budget)
+    client.user_data_set(FollowState(controller, sleeping, governor))
 
     client.on_connect = on_connect
     client.on_message = on_message
@@ -111,21 +412,18 @@ def main():
         return
 
     try:
-        model = YOLO(MODEL_PATH, task="detect")
+        detector = make_detector(args.backend, args.model, args.keyframe_interval,
+                                 lambda dets: primary_person(dets, controller.primary_box))
     except Exception as e:
         print(f"Model load failed: {e}")
         client.loop_stop()
         client.disconnect()
         return
 
-    print("Using Raspberry Pi Camera (Picamera2)...")
-    picam2 = Picamera2()
-    cam_config = picam2.create_preview_configuration(
-        main={"size": (FRAME_W, FRAME_H), "format": "RGB888"}
-    )
-    picam2.configure(cam_config)
+    print(f"Using Raspberry Pi Camera (Picamera2), {'full-res' if gui else f'lores {LORES_W}x{LORES_H}'} capture...")
+    camera = PicameraSource(lores=None if gui else (LORES_W, LORES_H))
     try:
-        picam2.start()
+        camera.start()
     except Exception as e:
         print(f"Camera start failed: {e}")
         client.loop_stop()
@@ -137,109 +435,31 @@ def main():
     else:
         print("UI: disabled (headless).")
 
-    pan_angle = PAN_NEUTRAL
-    window_ok = False
-    person_detected_before = False
+    def control(result):
+        if controller.handle(result) and governor:
+            governor.saw_person()
+        if controller.stop_requested:
+            stop_event.set()
 
+    infer = make_infer(detector, Preprocessor(keep_frame=gui))
+    pipeline = FollowPipeline(camera.capture, infer, control, stop_event=stop_event, governor=governor)
     try:
-        while not stop_event.is_set():
-            frame = picam2.capture_array()
-
-            h, w = frame.shape[:2]
-            frame = frame[0:h - CROP_BOTTOM, 0:w - CROP_RIGHT]
-            curr_h, curr_w = frame.shape[:2]
-
-            frame_resized = cv2.resize(frame, (MODEL_W, MODEL_H))
-            results = model(frame_resized)
-
-            boxes = []
-            for det in results[0].boxes:
-                cls = int(det.cls.cpu().numpy()) if hasattr(det, "cls") else int(det.cls)
-                conf = float(det.conf.cpu().numpy()) if hasattr(det, "conf") else float(det.conf)
-                if cls == 0 and conf >= PERSON_CONF_THRESH:
-                    xyxy = det.xyxy[0].cpu().numpy()
-                    boxes.append(xyxy)
-
-            if boxes:
-                boxes_sorted = sorted(boxes, key=lambda b: (b[2]-b[0])*(b[3]-b[1]), reverse=True)
-                x1, y1, x2, y2 = boxes_sorted[0]
-
-                scale_x = curr_w / MODEL_W
-                scale_y = curr_h / MODEL_H
-                x1, x2, y1, y2 = int(x1 * scale_x), int(x2 * scale_x), int(y1 * scale_y), int(y2 * scale_y)
-
-                cx = (x1 + x2) // 2
-                cy = (y1 + y2) // 2
-
-                if gui:
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                    cv2.circle(frame, (cx, cy), 4, (0, 0, 255), -1)
-
-                err_x = cx - curr_w // 2
-                velocity = 0 if abs(err_x) < DEADZONE_PIX else clamp(-err_x * KP_PAN, -MAX_STEP_DEG, MAX_STEP_DEG)
-                pan_angle = SMOOTH_ALPHA * pan_angle + (1 - SMOOTH_ALPHA) * clamp(pan_angle + velocity, PAN_LIMIT_MIN, PAN_LIMIT_MAX)
-                publish_follow(client, pan_angle, topic)
-
-                currently_in_deadzone = abs(err_x) < DEADZONE_PIX
-                
-                if not sleeping.is_set():
-                    if currently_in_deadzone and not person_state["has_waved_for_current_target"]:
-                        print("Centered on person! Publishing wave command...")
-                        publish_wave(client, MQTT_TOPIC_SERVO)
-                        person_state["has_waved_for_current_target"] = True
-                
-                person_state["detected_before"] = True
-                person_state["in_deadzone"] = currently_in_deadzone
-                person_state["last_seen_time"] = time.time()
-            else:
-                if person_state["detected_before"]:
-                    time_since_last_seen = time.time() - person_state["last_seen_time"] if person_state["last_seen_time"] else 999
-                    
-                    if time_since_last_seen > PERSON_FORGET_TIME:
-                        print(f"No person detected for {PERSON_FORGET_TIME}s. Reset - waiting for next detection...")
-                        person_state["detected_before"] = False
-                        person_state["in_deadzone"] = False
-                        person_state["has_waved_for_current_target"] = False
-                        person_state["last_seen_time"] = None
-                else:
-                    person_state["last_seen_time"] = None
-
-            if gui:
-                try:
-                    if not window_ok:
-                        cv2.namedWindow("YOLO Smooth Stable 1D Tracking", cv2.WINDOW_NORMAL)
-                        window_ok = True
-                    
-                    if person_state["in_deadzone"] and boxes:
-                        status = "Centered"
-                    elif person_state["detected_before"] and boxes:
-                        status = "Tracking"
-                    elif person_state["detected_before"] and not boxes:
-                        time_since = time.time() - person_state["last_seen_time"] if person_state["last_seen_time"] else 0
-                        status = f"Lost ({PERSON_FORGET_TIME - time_since:.1f}s)"
-                    else:
-                        status = "Waiting"
-                    
-                    cv2.putText(frame, f"Pan:{pan_angle:.1f} [{status}]", (6, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-                    cv2.imshow("YOLO Smooth Stable 1D Tracking", frame)
-                    if cv2.waitKey(1) & 0xFF == ord('q'):
-                        stop_event.set()
-                except cv2.error as e:
-                    print(f"Disabling UI (OpenCV error: {e})")
-                    gui = False
-                    try:
-                        cv2.destroyAllWindows()
-                    except Exception:
-                        pass
-            else:
-                time.sleep(0.005)
+        pipeline.run()
     finally:
+        pipeline.stop()
+        print(f"Pipeline stats: {pipeline.stats()}")
+        if hasattr(detector, "stats"):
+            print(f"Tracker stats: {detector.stats()}")
+        if governor:
+            print(f"Governor stats: {governor.stats()}")
+        print(f"Pan publish stats: {pan.stats()}")
+        print(f"Person tracker stats: {controller.tracker.stats()}")
         try:
-            picam2.stop()
+            camera.stop()
         except Exception:
             pass
         try:
-            if gui:
+            if controller.gui:
                 cv2.destroyAllWindows()
         except Exception:
             pass
@@ -247,4 +467,4 @@ def main():
         client.disconnect()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,673 @@
+#!/usr/bin/env python3
+import io
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+import tracemalloc
+import subprocess
+import contextlib
+import cv2
+import numpy as np
+from follow import (
+    BACKENDS,
+    MODEL_PATH,
+    MODEL_W,
+    MODEL_H,
+    PAN_MAX_RATE,
+    PAN_MIN_DELTA,
+    PERSON_CONF_THRESH,
+    CROP_W,
+    CROP_H,
+    LORES_W,
+    LORES_H,
+    FollowController,
+    PanPublisher,
+    Preprocessor,
+    crop_frame,
+    largest_person,
+    make_detector,
+    make_infer,
+    person_boxes,
+    primary_person,
+    publish_follow,
+)
+from follow_pipeline import FollowPipeline
+from follow_track import RoiTracker
+from follow_people import PersonTracker
+from follow_governor import CPU_BUDGET, GOVERNOR_RATES, GOVERNOR_STATES, RateGovernor
+from fake_devices import FakeCamera, FakeClient, StubDetector, VideoCamera
+from metrics import summarize_ms
+
+
+def make_controller():
+    client = FakeClient()
+    return client, FollowController(client, "/follow", threading.Event())
+
+
+def run_serial(camera, infer, control, duration):
+    latencies = []
+    handled = 0
+    t_start = time.monotonic()
+    while time.monotonic() - t_start < duration:
+        frame = camera.capture()
+        captured_at = time.monotonic()
+        control(infer(frame))
+        latencies.append(time.monotonic() - captured_at)
+        handled += 1
+    return handled, latencies, {}
+
+
+def run_pipelined(camera, infer, control, duration):
+    pipeline = FollowPipeline(camera.capture, infer, control)
+    timer = threading.Timer(duration, pipeline.stop_event.set)
+    timer.start()
+    pipeline.run()
+    pipeline.stop()
+    return pipeline.handled, list(pipeline.latencies), pipeline.stats()
+
+
+def bench_pipeline(args):
+    print(f"follow.py capture -> inference -> publish: camera {args.camera_fps} fps, "
+          f"stub model {args.model_ms} ms, {args.duration} s per mode")
+    for mode, runner in (("serial", run_serial), ("pipelined", run_pipelined)):
+        camera = FakeCamera(fps=args.camera_fps)
+        detector = StubDetector(args.model_ms / 1000)
+        client, controller = make_controller()
+        camera.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            handled, latencies, stats = runner(camera, make_infer(detector), controller.handle, args.duration)
+        published = sum(1 for _, topic, _ in client.published if topic == "/follow")
+        print(f"  {mode}:")
+        print(f"    {handled / args.duration:5.1f} results/s, camera frames {camera.frames} of "
+              f"{camera.sensor_frame} from the sensor, "
+              f"inferences {detector.calls}, /follow published {published}")
+        print(f"    capture -> publish {summarize_ms(latencies)}")
+        if stats:
+            print(f"    pipeline stats: {stats}")
+
+
+BACKEND_MODULES = {"ultralytics": "ultralytics", "onnx": "follow_onnx"}
+
+
+def import_time(module):
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if out.returncode != 0:
+        return None
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def model_frames(count):
+    camera = FakeCamera(fps=0, step=0.05)
+    return [cv2.resize(crop_frame(camera.capture()), (MODEL_W, MODEL_H)) for _ in range(count)]
+
+
+def bench_backend(args):
+    frames = model_frames(args.frames)
+    print(f"Detector backends on {args.model}: {args.frames} synthetic {MODEL_W}x{MODEL_H} frames")
+    for backend in BACKENDS:
+        seconds = import_time(BACKEND_MODULES[backend])
+        print(f"  {backend}:")
+        if seconds is None:
+            print("    not importable here -> skipped")
+            continue
+        print(f"    import {seconds * 1000:.0f} ms (fresh interpreter)")
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            detector = make_detector(backend, args.model)
+            for frame in frames[:5]:
+                detector.detect(frame)
+        print(f"    load + warm-up {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+        latencies = []
+        found = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            for frame in frames:
+                t0 = time.perf_counter()
+                found += len(detector.detect(frame))
+                latencies.append(time.perf_counter() - t0)
+        print(f"    detect {summarize_ms(latencies)}, {found / len(frames):.2f} persons/frame")
+
+        tracemalloc.start()
+        peaks = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for frame in frames[:args.alloc_frames]:
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+                detector.detect(frame)
+                peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+        print(f"    transient Python/NumPy memory per frame {sum(peaks) / len(peaks) / 1024:.1f} KiB "
+              f"(max {max(peaks) / 1024:.1f} KiB), {blocks} blocks still live")
+
+
+class TensorLike:
+    def __init__(self, value):
+        self.value = value
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.value
+
+
+class BoxLike:
+    def __init__(self, row):
+        self.cls = TensorLike(row[5])
+        self.conf = TensorLike(row[4])
+        self.xyxy = [TensorLike(row[:4])]
+
+
+class ResultLike:
+    def __init__(self, dets):
+        self.boxes = [BoxLike(row) for row in dets]
+
+
+def legacy_target(results, curr_w, curr_h):
+    boxes = []
+    for det in results[0].boxes:
+        cls = int(det.cls.cpu().numpy()) if hasattr(det, "cls") else int(det.cls)
+        conf = float(det.conf.cpu().numpy()) if hasattr(det, "conf") else float(det.conf)
+        if cls == 0 and conf >= PERSON_CONF_THRESH:
+            xyxy = det.xyxy[0].cpu().numpy()
+            boxes.append(xyxy)
+    if not boxes:
+        return None
+    boxes_sorted = sorted(boxes, key=lambda b: (b[2]-b[0])*(b[3]-b[1]), reverse=True)
+    x1, y1, x2, y2 = boxes_sorted[0]
+    scale_x = curr_w / MODEL_W
+    scale_y = curr_h / MODEL_H
+    return int(x1 * scale_x), int(y1 * scale_y), int(x2 * scale_x), int(y2 * scale_y)
+
+
+def synthetic_dets(count, rng):
+    dets = np.empty((count, 6), dtype=np.float32)
+    for row in dets:
+        x, y = rng.uniform(0, MODEL_W - 8), rng.uniform(0, MODEL_H - 8)
+        row[:] = (x, y, x + rng.uniform(4, MODEL_W - x), y + rng.uniform(4, MODEL_H - y),
+                  rng.uniform(0.05, 0.95), 0 if rng.random() < 0.3 else rng.randrange(1, 80))
+    return dets
+
+
+def per_frame_us(fn, frames, repeat):
+    t0 = time.perf_counter()
+    for i in range(repeat):
+        fn(frames[i % len(frames)])
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+def bench_postprocess(args):
+    rng = random.Random(args.seed)
+    scale_x, scale_y = CROP_W / MODEL_W, CROP_H / MODEL_H
+    print(f"Detections -> pan target, {args.repeat} frames per size "
+          f"(legacy loop runs on lightweight stand-ins, real ultralytics Boxes cost more)")
+    print("  person_boxes runs on every result, primary_person on every ROI keyframe")
+    ok = True
+    for count in args.sizes:
+        frames = [synthetic_dets(count, rng) for _ in range(8)]
+        results = [[ResultLike(dets)] for dets in frames]
+        tracker = PersonTracker()
+        for dets, res in zip(frames, results):
+            expected = legacy_target(res, CROP_W, CROP_H)
+            boxes = person_boxes(dets, scale_x, scale_y)
+            largest = None
+            if len(boxes):
+                largest = boxes[((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])).argmax()].astype(int)
+            picked = primary_person(dets, None)
+            if (largest is None) != (expected is None) or (picked is None) != (expected is None):
+                ok = False
+            elif largest is not None and max(abs(a - b) for a, b in zip(largest.tolist(), expected)) > 1:
+                ok = False
+            elif picked is not None and not np.array_equal(picked, largest_person(dets)):
+                ok = False
+        for dets in frames:
+            if tracker.update(person_boxes(dets, scale_x, scale_y)) is not None:
+                break
+
+        legacy_us = per_frame_us(lambda res: legacy_target(res, CROP_W, CROP_H), results, args.repeat)
+        boxes_us = per_frame_us(lambda dets: person_boxes(dets, scale_x, scale_y), frames, args.repeat)
+        primary_box = None if tracker.primary is None else tracker.primary.box
+        primary_us = per_frame_us(lambda dets: primary_person(dets, primary_box), frames, args.repeat)
+        print(f"  {count:4d} boxes: loop {legacy_us:8.1f} us/frame, person_boxes {boxes_us:6.1f} us/frame "
+              f"({legacy_us / boxes_us:5.1f}x), primary_person {primary_us:6.1f} us/frame")
+    print("PASS" if ok else "FAIL: person_boxes or primary_person disagrees with the loop")
+    if not ok:
+        sys.exit(1)
+
+
+def tracking_source(args):
+    if args.video:
+        return VideoCamera(args.video, fps=0)
+    return FakeCamera(fps=0, step=1 / 30)
+
+
+def run_tracking(args, interval):
+    camera = tracking_source(args)
+    if args.backend == "stub":
+        detector = StubDetector(args.stub_ms / 1000, busy=True)
+    else:
+        detector = make_detector(args.backend, args.model)
+    if interval > 1:
+        detector = RoiTracker(detector, largest_person, interval)
+    infer = make_infer(detector)
+
+    centers = []
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(args.frames):
+            _, dets = infer(camera.capture())
+            person = largest_person(dets)
+            centers.append(None if person is None else (person[0] + person[2]) / 2)
+    wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+    stats = detector.stats() if interval > 1 else {"keyframes": args.frames}
+    return centers, wall, cpu, stats
+
+
+def bench_tracking(args):
+    print(f"ROI tracking on {args.video or 'synthetic video'}: {args.frames} frames, "
+          f"detector {args.backend}{f' ({args.stub_ms} ms busy)' if args.backend == 'stub' else ''}")
+    reference = None
+    for interval in args.intervals:
+        centers, wall, cpu, stats = run_tracking(args, interval)
+        if reference is None:
+            reference = centers
+        errors = [abs(a - b) for a, b in zip(centers, reference) if a is not None and b is not None]
+        mean_error = sum(errors) / len(errors) if errors else 0.0
+        print(f"  every {interval:2d}: {args.frames / wall:6.1f} fps, CPU {cpu / args.frames * 1000:6.2f} ms/frame "
+              f"({cpu / wall * 100:5.1f}% of one core), {stats}, "
+              f"target x off by {mean_error:.1f} px vs first run ({MODEL_W} px wide)")
+
+
+GOVERNOR_TIMELINE = [
+    "20:radar=1",
+    "23:person=1",
+    "43:person=0",
+    "45:radar=0",
+    "60:sleep=1",
+    "70:person=1",
+    "80:person=0",
+    "120:sleep=0",
+    "125:person=1",
+    "140:person=0",
+]
+
+
+def parse_events(events):
+    parsed = []
+    for event in events:
+        at, _, rest = event.partition(":")
+        kind, _, value = rest.partition("=")
+        parsed.append((float(at), kind, value == "1"))
+    return sorted(parsed)
+
+
+def simulate_governor(governor, events, end, infer_s):
+    now = [0.0]
+    governor.clock = lambda: now[0]
+    person = False
+    pending = None
+    ramps = []
+    cpu = 0.0
+    i = 0
+    while now[0] < end:
+        due = governor.due(now[0])
+        next_event = events[i][0] if i < len(events) else end
+        if next_event <= max(now[0], due):
+            now[0] = max(now[0], next_event)
+            if i >= len(events):
+                break
+            _, kind, value = events[i]
+            i += 1
+            if kind == "person":
+                person = value
+            elif kind == "radar":
+                governor.set_radar(value)
+            elif kind == "sleep":
+                governor.set_sleeping(value)
+            if (kind in ("person", "radar") and value) or (kind == "sleep" and not value):
+                pending = (f"{kind}={int(value)}", now[0], governor.current)
+            continue
+
+        now[0] = max(now[0], due)
+        governor.start_frame()
+        start = now[0]
+        now[0] += infer_s
+        cpu += infer_s
+        governor.record(infer_s)
+        if pending and (pending[0] != "person=1" or person):
+            ramps.append((pending[0], pending[1], start, pending[2]))
+            pending = None
+        if person:
+            governor.saw_person()
+    return ramps, cpu
+
+
+def bench_governor(args):
+    events = parse_events(args.events)
+    infer_s = args.infer_ms / 1000
+    rates = {"idle": args.idle_fps, "sleep": args.sleep_fps, "presence": args.presence_fps}
+    governor = RateGovernor(rates, args.cpu_budget)
+    ramps, cpu = simulate_governor(governor, events, args.duration, infer_s)
+    stats = governor.stats()
+
+    print(f"Governor simulation: {args.duration:.0f} s scripted timeline, {args.infer_ms} ms inference, "
+          f"CPU budget {args.cpu_budget}")
+    ok = True
+    for state in GOVERNOR_STATES:
+        seconds = governor.time_in[state]
+        fps = stats[f"{state}_fps"]
+        share = governor.frames[state] * infer_s / seconds if seconds else 0.0
+        limit = governor.rates[state]
+        print(f"  {state:<9} {seconds:6.1f} s  {fps:6.2f} fps  CPU {share * 100:5.1f}%"
+              f"{f'  (cap {limit} fps)' if limit else ''}")
+        if limit and fps > limit * 1.02:
+            ok = False
+            print(f"    FAIL: {state} ran above {limit} fps")
+        if args.cpu_budget and share > args.cpu_budget * 1.02:
+            ok = False
+            print(f"    FAIL: {state} used more than the CPU budget")
+
+    for name, at, first, state_before in ramps:
+        delay = first - at
+        allowed = infer_s if name != "person=1" else governor.interval(state_before) + infer_s
+        print(f"  {name:<9} at {at:6.1f} s -> first frame after {delay * 1000:6.1f} ms (allowed {allowed * 1000:.1f} ms)")
+        if delay > allowed + 1e-9:
+            ok = False
+            print("    FAIL: ramp-up too slow")
+
+    flat_out = args.duration
+    print(f"  inference CPU {cpu:.1f} s vs {flat_out:.1f} s running flat-out ({cpu / flat_out * 100:.0f}%)")
+    print("PASS" if ok else "FAIL")
+    if not ok:
+        sys.exit(1)
+
+
+class LegacyPan:
+    def __init__(self, client, topic):
+        self.client = client
+        self.topic = topic
+
+    def update(self, angle):
+        publish_follow(self.client, angle, self.topic)
+
+    def tick(self):
+        pass
+
+    def stats(self):
+        return {}
+
+
+def record_session(seconds, fps):
+    camera = FakeCamera(fps=0, step=1 / fps, period=8.0)
+    infer = make_infer(StubDetector(0))
+    session = []
+    for i in range(int(seconds * fps)):
+        _, dets = infer(camera.capture())
+        session.append({"t": i / fps, "dets": dets.tolist()})
+    return session
+
+
+def load_session(args):
+    if args.session:
+        with open(args.session) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    session = record_session(args.duration, args.fps)
+    if args.record:
+        with open(args.record, "w") as f:
+            for entry in session:
+                f.write(json.dumps(entry) + "\n")
+    return session
+
+
+def replay_pan(session, make_pan):
+    now = [0.0]
+    client = FakeClient()
+    pan = make_pan(client, lambda: now[0])
+    controller = FollowController(client, "/follow", threading.Event(), clock=lambda: now[0], pan=pan)
+    lag = 0.0
+    seen = 0
+    last = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        for entry in session:
+            now[0] = entry["t"]
+            controller.handle((None, np.asarray(entry["dets"], dtype=np.float32).reshape(-1, 6)))
+            for _, topic, payload in client.published[seen:]:
+                if topic == "/follow":
+                    last = float(payload.split(":")[1])
+            seen = len(client.published)
+            if last is not None:
+                lag = max(lag, abs(last - controller.pan_angle))
+    now[0] += 1.0
+    pan.tick()
+    payloads = [p for _, topic, p in client.published if topic == "/follow"]
+    return payloads, controller.pan_angle, lag, pan.stats()
+
+
+def bench_pan(args):
+    session = load_session(args)
+    duration = session[-1]["t"] - session[0]["t"] if len(session) > 1 else 1.0
+    print(f"Pan publishing over a {duration:.0f} s tracking session ({len(session)} frames)")
+    ok = True
+    modes = (
+        ("every frame", lambda client, clock: LegacyPan(client, "/follow")),
+        ("change-only", lambda client, clock: PanPublisher(client, "/follow", args.min_delta, args.max_rate, clock=clock)),
+    )
+    for name, make_pan in modes:
+        payloads, final, lag, stats = replay_pan(session, make_pan)
+        serial_bytes = sum(len(p) + 1 for p in payloads)
+        print(f"  {name:<12} {len(payloads) / duration:6.1f} msg/s to the broker, "
+              f"{serial_bytes / duration:7.1f} B/s on the serial link, max lag {lag:.1f} deg")
+        if stats:
+            print(f"    {stats}")
+        if payloads and payloads[-1] != f"Body: {final:.1f}":
+            ok = False
+            print(f"    FAIL: last message {payloads[-1]!r} but final angle is {final:.1f}")
+    print("PASS" if ok else "FAIL")
+    if not ok:
+        sys.exit(1)
+
+
+def legacy_preprocess(frame):
+    frame = crop_frame(frame)
+    return frame, cv2.resize(frame, (MODEL_W, MODEL_H))
+
+
+def bench_preprocess(args):
+    modes = (
+        ("640x480 crop + resize", FakeCamera(fps=0, step=0.05), legacy_preprocess),
+        ("640x480 preallocated", FakeCamera(fps=0, step=0.05), Preprocessor()),
+        (f"lores {LORES_W}x{LORES_H} YUV420", FakeCamera(LORES_W, LORES_H, fps=0, step=0.05,
+                                                        person_w=30, person_h=75, yuv=True), Preprocessor()),
+    )
+    print(f"Capture -> model input ({MODEL_W}x{MODEL_H}), {args.frames} frames per path, "
+          f"best of {args.repeats} interleaved runs")
+    paths = []
+    for name, camera, preprocess in modes:
+        frames = [camera.capture() for _ in range(8)]
+        for frame in frames:
+            preprocess(frame)
+        paths.append((name, frames, preprocess))
+
+    best = [float("inf")] * len(paths)
+    for _ in range(args.repeats):
+        for index, (name, frames, preprocess) in enumerate(paths):
+            t0 = time.perf_counter()
+            for i in range(args.frames):
+                preprocess(frames[i % 8])
+            best[index] = min(best[index], (time.perf_counter() - t0) / args.frames)
+
+    for (name, frames, preprocess), per_frame in zip(paths, best):
+        tracemalloc.start()
+        allocated = []
+        for i in range(args.alloc_frames):
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            preprocess(frames[i % 8])
+            allocated.append(tracemalloc.get_traced_memory()[1] - base)
+        tracemalloc.stop()
+        print(f"  {name:<24} capture buffer {frames[0].nbytes / 1024:7.1f} KiB, "
+              f"preprocess {per_frame * 1e6:7.1f} us/frame, "
+              f"allocations {sum(allocated) / len(allocated) / 1024:6.1f} KiB/frame")
+
+
+def people_session(count, seconds, fps, miss_rate, rng):
+    people = []
+    for _ in range(count):
+        people.append({
+            "cx": rng.uniform(0.3, 0.7) * CROP_W,
+            "amp": rng.uniform(0.15, 0.35) * CROP_W,
+            "period": rng.uniform(6, 14),
+            "phase": rng.uniform(0, 2 * math.pi),
+            "w": rng.uniform(90, 110),
+            "h": rng.uniform(230, 270),
+            "depth": rng.uniform(0.05, 0.2),
+        })
+    frames = []
+    for i in range(int(seconds * fps)):
+        t = i / fps
+        boxes, ids = [], []
+        for pid, p in enumerate(people):
+            if rng.random() < miss_rate:
+                continue
+            cx = p["cx"] + p["amp"] * math.sin(2 * math.pi * t / p["period"] + p["phase"])
+            scale = 1 + p["depth"] * math.sin(2 * math.pi * t / (p["period"] * 1.7) + p["phase"])
+            w, h = p["w"] * scale, p["h"] * scale
+            cy = CROP_H / 2
+            boxes.append([cx - w / 2 + rng.gauss(0, 3), cy - h / 2 + rng.gauss(0, 3),
+                          cx + w / 2 + rng.gauss(0, 3), cy + h / 2 + rng.gauss(0, 3)])
+            ids.append(pid)
+        frames.append((t, np.array(boxes, dtype=np.float32).reshape(-1, 4), ids))
+    return frames
+
+
+def count_switches(chosen):
+    switches = 0
+    last = None
+    for pid in chosen:
+        if pid is None:
+            continue
+        if last is not None and pid != last:
+            switches += 1
+        last = pid
+    return switches
+
+
+def bench_people(args):
+    rng = random.Random(args.seed)
+    frames = people_session(args.people, args.duration, args.fps, args.miss_rate, rng)
+    minutes = args.duration / 60
+
+    legacy, legacy_times = [], []
+    for _, boxes, ids in frames:
+        t0 = time.perf_counter()
+        if len(boxes):
+            areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+            legacy.append(ids[int(areas.argmax())])
+        else:
+            legacy.append(None)
+        legacy_times.append(time.perf_counter() - t0)
+
+    now = [0.0]
+    tracker = PersonTracker(clock=lambda: now[0])
+    tracked, tracked_times = [], []
+    for t, boxes, ids in frames:
+        now[0] = t
+        t0 = time.perf_counter()
+        primary = tracker.update(boxes)
+        tracked_times.append(time.perf_counter() - t0)
+        if primary is not None and primary.visible:
+            tracked.append(ids[int(np.flatnonzero(np.all(boxes == primary.box, axis=1))[0])])
+        else:
+            tracked.append(None)
+
+    legacy_switches = count_switches(legacy)
+    tracked_switches = count_switches(tracked)
+    print(f"Multi-person replay: {args.people} people, {args.duration:.0f} s at {args.fps} fps, "
+          f"{args.miss_rate * 100:.0f}% missed detections")
+    print(f"  largest box   {legacy_switches / minutes:6.1f} target switches/min, cost {summarize_ms(legacy_times)}")
+    print(f"  tracker       {tracked_switches / minutes:6.1f} target switches/min, cost {summarize_ms(tracked_times)}")
+    print(f"    {tracker.stats()}")
+    ok = tracked_switches <= legacy_switches
+    print("PASS" if ok else "FAIL: tracker switched targets more often than the largest-box rule")
+    if not ok:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="follow.py benchmarks with a fake camera and stub detector.")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("pipeline", help="Frames/sec and capture-to-publish latency, serial loop versus threaded pipeline.")
+    p.add_argument("--camera-fps", type=float, default=30.0, help="Frame rate of the fake camera.")
+    p.add_argument("--model-ms", type=float, default=60.0, help="Latency of the stub detector per frame.")
+    p.add_argument("--duration", type=float, default=5.0, help="Seconds per mode.")
+    p.set_defaults(func=bench_pipeline)
+
+    p = sub.add_parser("backend", help="Import time, per-frame latency and allocations: ultralytics versus ONNX Runtime.")
+    p.add_argument("--model", default=MODEL_PATH, help="ONNX model used by both backends.")
+    p.add_argument("--frames", type=int, default=200)
+    p.add_argument("--alloc-frames", type=int, default=50, help="Frames traced with tracemalloc.")
+    p.set_defaults(func=bench_backend)
+
+    p = sub.add_parser("postprocess", help="Per-frame cost of picking the pan target from 1-300 detections.")
+    p.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 50, 100, 300])
+    p.add_argument("--repeat", type=int, default=2000)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_postprocess)
+
+    p = sub.add_parser("tracking", help="Effective fps and CPU with full detection every N frames and tracking in between.")
+    p.add_argument("--video", help="Recorded video to replay; defaults to the synthetic fake camera.")
+    p.add_argument("--frames", type=int, default=300)
+    p.add_argument("--intervals", type=int, nargs="+", default=[1, 3, 5, 10])
+    p.add_argument("--backend", choices=("stub",) + BACKENDS, default="stub")
+    p.add_argument("--model", default=MODEL_PATH)
+    p.add_argument("--stub-ms", type=float, default=80.0, help="CPU time burned by the stub detector per call.")
+    p.set_defaults(func=bench_tracking)
+
+    p = sub.add_parser("governor", help="Simulate the inference rate governor over a scripted presence timeline.")
+    p.add_argument("--events", nargs="+", default=GOVERNOR_TIMELINE,
+                   help="Timeline entries 'SECONDS:person|radar|sleep=0|1'.")
+    p.add_argument("--duration", type=float, default=160.0)
+    p.add_argument("--infer-ms", type=float, default=60.0)
+    p.add_argument("--cpu-budget", type=float, default=CPU_BUDGET)
+    p.add_argument("--idle-fps", type=float, default=GOVERNOR_RATES["idle"])
+    p.add_argument("--presence-fps", type=float, default=GOVERNOR_RATES["presence"])
+    p.add_argument("--sleep-fps", type=float, default=GOVERNOR_RATES["sleep"])
+    p.set_defaults(func=bench_governor)
+
+    p = sub.add_parser("pan", help="Broker messages/sec and serial bytes/sec of /follow, every frame versus change-only.")
+    p.add_argument("--session", help="Recorded session (JSON lines of t and dets) to replay.")
+    p.add_argument("--record", help="Write the synthetic session here for later replays.")
+    p.add_argument("--duration", type=float, default=120.0)
+    p.add_argument("--fps", type=float, default=15.0)
+    p.add_argument("--min-delta", type=float, default=PAN_MIN_DELTA)
+    p.add_argument("--max-rate", type=float, default=PAN_MAX_RATE)
+    p.set_defaults(func=bench_pan)
+
+    p = sub.add_parser("preprocess", help="Per-frame allocations and time: full-res crop+resize versus lores and preallocated buffers.")
+    p.add_argument("--frames", type=int, default=200)
+    p.add_argument("--repeats", type=int, default=10, help="Interleaved runs per path; the best is reported.")
+    p.add_argument("--alloc-frames", type=int, default=100)
+    p.set_defaults(func=bench_preprocess)
+
+    p = sub.add_parser("people", help="Target switches/min and per-frame cost on synthetic multi-person trajectories.")
+    p.add_argument("--people", type=int, default=3)
+    p.add_argument("--duration", type=float, default=300.0)
+    p.add_argument("--fps", type=float, default=15.0)
+    p.add_argument("--miss-rate", type=float, default=0.1, help="Chance a person is missed in a frame.")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_people)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import time
+import threading
+
+GOVERNOR_STATES = ("tracking", "presence", "idle", "sleep")
+GOVERNOR_RATES = {"tracking": 0.0, "presence": 10.0, "idle": 2.0, "sleep": 0.5}
+CPU_BUDGET = 0.8
+PERSON_HOLD = 2.0
+CPU_EWMA_ALPHA = 0.2
+GOVERNOR_POLL = 0.1
+
+
+class RateGovernor:
+    def __init__(self, rates=None, cpu_budget=CPU_BUDGET, person_hold=PERSON_HOLD, clock=time.monotonic):
+        self.rates = dict(GOVERNOR_RATES, **(rates or {}))
+        self.cpu_budget = cpu_budget
+        self.person_hold = person_hold
+        self.clock = clock
+        self.cond = threading.Condition()
+        self.sleeping = False
+        self.radar = False
+        self.last_person = None
+        self.last_start = None
+        self.cpu_avg = 0.0
+        self.cpu_total = 0.0
+        self.frames = dict.fromkeys(GOVERNOR_STATES, 0)
+        self.time_in = dict.fromkeys(GOVERNOR_STATES, 0.0)
+        self.current = "idle"
+        self.accounted_at = None
+
+    def state(self, now):
+        if self.sleeping:
+            return "sleep"
+        if self.last_person is not None and now - self.last_person < self.person_hold:
+            return "tracking"
+        if self.radar:
+            return "presence"
+        return "idle"
+
+    def interval(self, state):
+        rate = self.rates[state]
+        interval = 1.0 / rate if rate > 0 else 0.0
+        if self.cpu_budget > 0:
+            interval = max(interval, self.cpu_avg / self.cpu_budget)
+        return interval
+
+    def due(self, now):
+        if self.last_start is None:
+            return now
+        return self.last_start + self.interval(self.state(now))
+
+    def account(self, now):
+        if self.accounted_at is not None:
+            self.time_in[self.current] += now - self.accounted_at
+        self.accounted_at = now
+        self.current = self.state(now)
+
+    def begin_frame(self, now):
+        self.account(now)
+        self.last_start = now
+        self.frames[self.current] += 1
+
+    def start_frame(self):
+        with self.cond:
+            self.begin_frame(self.clock())
+
+    def wait(self, stop_event):
+        with self.cond:
+            while not stop_event.is_set():
+                now = self.clock()
+                due = self.due(now)
+                if now >= due:
+                    self.begin_frame(now)
+                    return True
+                self.cond.wait(min(due - now, GOVERNOR_POLL))
+        return False
+
+    def record(self, cpu_seconds):
+        with self.cond:
+            self.cpu_total += cpu_seconds
+            if self.cpu_avg == 0.0:
+                self.cpu_avg = cpu_seconds
+            else:
+                self.cpu_avg += CPU_EWMA_ALPHA * (cpu_seconds - self.cpu_avg)
+
+    def saw_person(self):
+        with self.cond:
+            now = self.clock()
+            self.account(now)
+            self.last_person = now
+            self.current = self.state(now)
+            self.cond.notify_all()
+
+    def set_sleeping(self, sleeping):
+        with self.cond:
+            now = self.clock()
+            self.account(now)
+            self.sleeping = sleeping
+            self.last_person = None
+            if not sleeping:
+                self.last_start = None
+            self.current = self.state(now)
+            self.cond.notify_all()
+
+    def set_radar(self, present):
+        with self.cond:
+            now = self.clock()
+            self.account(now)
+            if present and not self.radar:
+                self.last_start = None
+            self.radar = present
+            self.current = self.state(now)
+            self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            self.account(self.clock())
+            stats = {"state": self.current, "cpu_avg_ms": round(self.cpu_avg * 1000, 1)}
+            for state in GOVERNOR_STATES:
+                seconds = self.time_in[state]
+                stats[f"{state}_fps"] = round(self.frames[state] / seconds, 2) if seconds > 0 else 0.0
+            return stats
@@ -0,0 +1,85 @@
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+PAD_VALUE = 114
+IOU_THRESH = 0.45
+MAX_DETECTIONS = 100
+PERSON_CLASS = 0
+
+
+def nms(boxes, scores, iou_thresh=IOU_THRESH, max_det=MAX_DETECTIONS):
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores)
+    keep = []
+    while order.size and len(keep) < max_det:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_thresh]
+    return np.asarray(keep, dtype=np.intp)
+
+
+class OnnxDetector:
+    def __init__(self, path, conf_thresh, iou_thresh=IOU_THRESH, threads=0):
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        _, _, h, w = model_input.shape
+        self.input_h = h if isinstance(h, int) else 640
+        self.input_w = w if isinstance(w, int) else 640
+        self.conf_thresh = conf_thresh
+        self.iou_thresh = iou_thresh
+        self.canvas = np.full((self.input_h, self.input_w, 3), PAD_VALUE, dtype=np.uint8)
+        self.tensor = np.empty((1, 3, self.input_h, self.input_w), dtype=np.float32)
+        self.resized = None
+        self.layout = None
+
+    def letterbox(self, frame):
+        h, w = frame.shape[:2]
+        if self.layout is None or self.layout[0] != (h, w):
+            r = min(self.input_h / h, self.input_w / w)
+            nh, nw = int(round(h * r)), int(round(w * r))
+            top, left = (self.input_h - nh) // 2, (self.input_w - nw) // 2
+            self.canvas[:] = PAD_VALUE
+            self.resized = np.empty((nh, nw, 3), dtype=np.uint8)
+            self.layout = ((h, w), r, top, left)
+        _, r, top, left = self.layout
+        nh, nw = self.resized.shape[:2]
+        if (nh, nw) == (h, w):
+            self.canvas[top:top + nh, left:left + nw] = frame
+        else:
+            cv2.resize(frame, (nw, nh), dst=self.resized, interpolation=cv2.INTER_LINEAR)
+            self.canvas[top:top + nh, left:left + nw] = self.resized
+        np.multiply(self.canvas[..., ::-1].transpose(2, 0, 1), np.float32(1 / 255), out=self.tensor[0])
+        return self.tensor
+
+    def postprocess(self, preds):
+        person = preds[4 + PERSON_CLASS]
+        candidates = np.flatnonzero(person >= self.conf_thresh)
+        if candidates.size == 0:
+            return np.empty((0, 6), dtype=np.float32)
+        candidates = candidates[preds[4:, candidates].argmax(axis=0) == PERSON_CLASS]
+        cx, cy, bw, bh = preds[:4, candidates]
+        boxes = np.stack((cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2), axis=1)
+        scores = person[candidates]
+        keep = nms(boxes, scores, self.iou_thresh)
+        boxes = boxes[keep]
+
+        (h, w), r, top, left = self.layout
+        boxes -= (left, top, left, top)
+        boxes /= r
+        np.clip(boxes, 0, (w, h, w, h), out=boxes)
+        return np.column_stack((boxes, scores[keep], np.full(len(keep), PERSON_CLASS, dtype=np.float32)))
+
+    def detect(self, frame):
+        outputs = self.session.run(None, {self.input_name: self.letterbox(frame)})
+        return self.postprocess(outputs[0][0])
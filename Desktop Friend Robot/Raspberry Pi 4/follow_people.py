@@ -0,0 +1,143 @@
+import time
+import numpy as np
+
+TRACK_IOU_MIN = 0.3
+TRACK_CENTROID_GATE = 0.5
+TRACK_MAX_AGE = 0.8
+SWITCH_MARGIN = 1.5
+SWITCH_FRAMES = 5
+
+
+def iou_matrix(a, b):
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+class Track:
+    __slots__ = ("id", "box", "area", "hits", "last_seen", "visible", "waved")
+
+    def __init__(self, track_id, box, now):
+        self.id = track_id
+        self.box = box
+        self.area = float((box[2] - box[0]) * (box[3] - box[1]))
+        self.hits = 1
+        self.last_seen = now
+        self.visible = True
+        self.waved = False
+
+
+class PersonTracker:
+    def __init__(self, iou_min=TRACK_IOU_MIN, max_age=TRACK_MAX_AGE, switch_margin=SWITCH_MARGIN,
+                 switch_frames=SWITCH_FRAMES, clock=time.monotonic):
+        self.iou_min = iou_min
+        self.max_age = max_age
+        self.switch_margin = switch_margin
+        self.switch_frames = switch_frames
+        self.clock = clock
+        self.tracks = []
+        self.next_id = 1
+        self.primary = None
+        self.challenger = None
+        self.challenger_frames = 0
+        self.switches = 0
+
+    def reset(self):
+        self.tracks = []
+        self.primary = None
+        self.challenger = None
+        self.challenger_frames = 0
+
+    def associate(self, boxes):
+        if not self.tracks or len(boxes) == 0:
+            return []
+        prev = np.array([t.box for t in self.tracks], dtype=np.float32)
+        iou = iou_matrix(prev, boxes)
+        prev_c = (prev[:, :2] + prev[:, 2:]) / 2
+        curr_c = (boxes[:, :2] + boxes[:, 2:]) / 2
+        width = np.maximum(prev[:, 2] - prev[:, 0], 1)
+        dist = np.linalg.norm(prev_c[:, None, :] - curr_c[None, :, :], axis=2) / width[:, None]
+        valid = (iou >= self.iou_min) | (dist < TRACK_CENTROID_GATE)
+        score = np.where(valid, iou + 0.5 * (1 - np.minimum(dist, 1)), -1.0)
+
+        pairs = []
+        used_t, used_d = set(), set()
+        for flat in np.argsort(-score, axis=None):
+            t, d = divmod(int(flat), score.shape[1])
+            if score[t, d] < 0:
+                break
+            if t in used_t or d in used_d:
+                continue
+            pairs.append((t, d))
+            used_t.add(t)
+            used_d.add(d)
+            if len(pairs) == min(score.shape):
+                break
+        return pairs
+
+    def update(self, boxes):
+        now = self.clock()
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        for track in self.tracks:
+            track.visible = False
+
+        matched = set()
+        for t, d in self.associate(boxes):
+            track = self.tracks[t]
+            track.box = boxes[d]
+            track.area = float((boxes[d, 2] - boxes[d, 0]) * (boxes[d, 3] - boxes[d, 1]))
+            track.hits += 1
+            track.last_seen = now
+            track.visible = True
+            matched.add(d)
+        for d in range(len(boxes)):
+            if d not in matched:
+                self.tracks.append(Track(self.next_id, boxes[d], now))
+                self.next_id += 1
+        self.tracks = [t for t in self.tracks if now - t.last_seen <= self.max_age]
+
+        self.select_primary()
+        return self.primary
+
+    def select_primary(self):
+        visible = [t for t in self.tracks if t.visible]
+        if self.primary is not None and self.primary not in self.tracks:
+            self.primary = None
+        if not visible:
+            self.challenger = None
+            self.challenger_frames = 0
+            return
+        best = max(visible, key=lambda t: t.area)
+        if self.primary is None:
+            self.primary = best
+            self.challenger = None
+            self.challenger_frames = 0
+            return
+        if self.challenger is not None and not self.challenger.visible and self.challenger in self.tracks:
+            return
+        if best is self.primary:
+            self.challenger = None
+            self.challenger_frames = 0
+            return
+        primary_area = self.primary.area if self.primary.visible else 0.0
+        if best.area <= primary_area * self.switch_margin:
+            self.challenger = None
+            self.challenger_frames = 0
+            return
+        if best is not self.challenger:
+            self.challenger = best
+            self.challenger_frames = 0
+        self.challenger_frames += 1
+        if self.challenger_frames >= self.switch_frames:
+            self.primary = best
+            self.challenger = None
+            self.challenger_frames = 0
+            self.switches += 1
+
+    def stats(self):
+        return {"tracks": len(self.tracks), "ids_issued": self.next_id - 1, "switches": self.switches}
@@ -0,0 +1,137 @@
+import time
+import threading
+from collections import deque
+from metrics import percentile
+
+LATENCY_WINDOW = 1000
+
+
+class LatestSlot:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.item = None
+        self.closed = False
+        self.puts = 0
+        self.dropped = 0
+
+    def put(self, item):
+        with self.cond:
+            if self.item is not None:
+                self.dropped += 1
+            self.item = item
+            self.puts += 1
+            self.cond.notify()
+
+    def take(self, timeout=None):
+        with self.cond:
+            if self.item is None and not self.closed:
+                self.cond.wait(timeout)
+            item = self.item
+            self.item = None
+            return item
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class FollowPipeline:
+    def __init__(self, capture, infer, control, clock=time.monotonic, stop_event=None, governor=None):
+        self.capture = capture
+        self.infer = infer
+        self.control = control
+        self.clock = clock
+        self.frames = LatestSlot()
+        self.results = LatestSlot()
+        self.wanted = threading.Event()
+        self.stop_event = stop_event or threading.Event()
+        self.governor = governor
+        self.threads = []
+        self.captured = 0
+        self.inferred = 0
+        self.handled = 0
+        self.errors = 0
+        self.started_at = None
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def capture_loop(self):
+        while not self.stop_event.is_set():
+            if self.governor is not None and not self.governor.wait(self.stop_event):
+                break
+            if not self.wanted.wait(0.1):
+                continue
+            self.wanted.clear()
+            try:
+                frame = self.capture()
+            except Exception as e:
+                self.errors += 1
+                print(f"Capture failed: {e}")
+                time.sleep(0.1)
+                self.wanted.set()
+                continue
+            self.frames.put((self.clock(), frame))
+            self.captured += 1
+        self.frames.close()
+
+    def inference_loop(self):
+        while not self.stop_event.is_set():
+            item = self.frames.take(timeout=0.1)
+            if item is None:
+                continue
+            captured_at, frame = item
+            cpu_start = time.process_time()
+            try:
+                result = self.infer(frame)
+            except Exception as e:
+                self.errors += 1
+                print(f"Inference failed: {e}")
+                continue
+            finally:
+                self.wanted.set()
+            if self.governor is not None:
+                self.governor.record(time.process_time() - cpu_start)
+            self.results.put((captured_at, result))
+            self.inferred += 1
+        self.results.close()
+
+    def start(self):
+        self.started_at = self.clock()
+        self.wanted.set()
+        for target in (self.capture_loop, self.inference_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def run(self):
+        if not self.threads:
+            self.start()
+        while not self.stop_event.is_set():
+            item = self.results.take(timeout=0.1)
+            if item is None:
+                continue
+            captured_at, result = item
+            self.control(result)
+            self.latencies.append(self.clock() - captured_at)
+            self.handled += 1
+
+    def stop(self):
+        self.stop_event.set()
+        self.frames.close()
+        self.results.close()
+        for thread in self.threads:
+            thread.join(timeout=2)
+
+    def stats(self):
+        elapsed = max(1e-9, self.clock() - (self.started_at or self.clock()))
+        latencies = list(self.latencies)
+        return {
+            "capture_fps": round(self.captured / elapsed, 1),
+            "inference_fps": round(self.inferred / elapsed, 1),
+            "control_fps": round(self.handled / elapsed, 1),
+            "frames_dropped": self.frames.dropped,
+            "results_dropped": self.results.dropped,
+            "errors": self.errors,
+            "latency_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "latency_p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        }
@@ -0,0 +1,78 @@
+import cv2
+import numpy as np
+
+KEYFRAME_INTERVAL = 5
+MAX_TRACK_POINTS = 40
+MIN_TRACK_POINTS = 4
+MIN_TRACK_RATIO = 0.5
+MIN_BOX_SIZE = 4
+LK_PARAMS = dict(winSize=(15, 15), maxLevel=2,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+
+class RoiTracker:
+    def __init__(self, detector, select, keyframe_interval=KEYFRAME_INTERVAL):
+        self.detector = detector
+        self.select = select
+        self.keyframe_interval = keyframe_interval
+        self.box = None
+        self.conf = 0.0
+        self.cls = 0.0
+        self.points = None
+        self.prev_gray = None
+        self.since_keyframe = 0
+        self.keyframes = 0
+        self.tracked = 0
+        self.lost = 0
+
+    def features(self, gray):
+        h, w = gray.shape
+        x1, y1, x2, y2 = self.box.astype(int)
+        mask = np.zeros((h, w), dtype=np.uint8)
+        mask[max(0, y1):min(h, y2), max(0, x1):min(w, x2)] = 255
+        return cv2.goodFeaturesToTrack(gray, MAX_TRACK_POINTS, 0.01, 3, mask=mask)
+
+    def keyframe(self, frame, gray):
+        dets = self.detector.detect(frame)
+        self.keyframes += 1
+        self.since_keyframe = 0
+        self.prev_gray = gray
+        person = self.select(dets)
+        if person is None:
+            self.box = None
+            return dets
+        self.box = person[:4].astype(np.float32)
+        self.conf, self.cls = float(person[4]), float(person[5])
+        self.points = self.features(gray)
+        if self.points is None or len(self.points) < MIN_TRACK_POINTS:
+            self.box = None
+        return dets
+
+    def detect(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.box is None or self.since_keyframe + 1 >= self.keyframe_interval:
+            return self.keyframe(frame, gray)
+
+        points, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, self.points, None, **LK_PARAMS)
+        good = status.ravel() == 1
+        if good.sum() < MIN_TRACK_POINTS or good.mean() < MIN_TRACK_RATIO:
+            self.lost += 1
+            return self.keyframe(frame, gray)
+
+        dx, dy = np.median(points[good] - self.points[good], axis=0).ravel()
+        h, w = gray.shape
+        box = self.box + (dx, dy, dx, dy)
+        np.clip(box, 0, (w, h, w, h), out=box)
+        if box[2] - box[0] < MIN_BOX_SIZE or box[3] - box[1] < MIN_BOX_SIZE:
+            self.lost += 1
+            return self.keyframe(frame, gray)
+
+        self.box = box
+        self.points = points[good].reshape(-1, 1, 2)
+        self.prev_gray = gray
+        self.since_keyframe += 1
+        self.tracked += 1
+        return np.array([[box[0], box[1], box[2], box[3], self.conf, self.cls]], dtype=np.float32)
+
+    def stats(self):
+        return {"keyframes": self.keyframes, "tracked": self.tracked, "lost": self.lost}
@@ -0,0 +1,40 @@
+import os
+import sys
+import time
+import logging
+
+LOG_RATE_PER_SEC = 5.0
+LOG_BURST = 20
+
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, per_second=LOG_RATE_PER_SEC, burst=LOG_BURST):
+        super().__init__()
+        self.per_second = per_second
+        self.burst = burst
+        self.state = {}
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        tokens, last, suppressed = self.state.get(key, (self.burst, now, 0))
+        tokens = min(self.burst, tokens + (now - last) * self.per_second)
+        if tokens < 1:
+            self.state[key] = (tokens, now, suppressed + 1)
+            return False
+        if suppressed:
+            record.msg = f"{record.msg} [{suppressed} similar messages suppressed]"
+        self.state[key] = (tokens - 1, now, 0)
+        return True
+
+
+def setup_logging(name, default_level="INFO"):
+    level = os.environ.get("ROBOT_LOG_LEVEL", default_level).upper()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    handler.addFilter(RateLimitFilter())
+    logger = logging.getLogger(name)
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
@@ -1,6 +1,9 @@
 import threading
 import time
 import paho.mqtt.client as mqtt
+import tracing
+from scheduler import Scheduler
+from behavior import StateMachine
 
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
@@ -13,19 +16,185 @@ TOPIC_RADAR = "/radar"
 TOPIC_SOUND = "/sound"
 TOPIC_SLEEP = "/sleep"
 
+TOUCH_OFF_DELAY = 3.0
+RADAR_OFF_DELAY = 3.0
+RADAR_BLOCK_DELAY = 3.0
+INACTIVITY_DELAY = 180.0
+
+def head_held(st):
+    return st.machine.in_state("touch", "held")
+
+def head_idle(st):
+    return not st.machine.in_state("touch", "held")
+
+def touch_showing(st):
+    return not st.machine.in_state("touch", "idle")
+
+def radar_present(st):
+    return st.machine.in_state("radar", "on", "clearing")
+
+def cooling_down(st):
+    return st.machine.in_state("block", "blocked")
+
+def screen_free(st):
+    return not touch_showing(st) and not cooling_down(st)
+
+def radar_waiting(st):
+    return radar_present(st) and not touch_showing(st)
+
+def awake(st):
+    return st.machine.in_state("sleep", "awake")
+
+def wake(st):
+    st.machine.send("wake")
+
+def block_radar(st):
+    st.machine.send("block")
+
+def doze(st):
+    st.machine.send("doze")
+
+def subscribe_radar(st):
+    if not st.radar_subscribed:
+        st.client.subscribe(TOPIC_RADAR)
+        st.radar_subscribed = True
+        print(f"Subscribed to topic: {TOPIC_RADAR}")
+
+def unsubscribe_radar(st):
+    if st.radar_subscribed:
+        st.client.unsubscribe(TOPIC_RADAR)
+        st.radar_subscribed = False
+        print(f"Unsubscribed from topic: {TOPIC_RADAR}")
+
+def publish_wake(st):
+    st.client.publish(TOPIC_SLEEP, "0")
+    print("Waking from sleep -> sleep=0")
+
+def publish_sleep(st):
+    st.client.publish(TOPIC_SLEEP, "1")
+    print("Inactivity 3m -> sleep=1")
+
+def touch_on(st):
+    st.client.publish(TOPIC_HAPTIC, "1")
+    st.client.publish(TOPIC_SERVO, "ear1")
+    st.client.publish(TOPIC_SCREEN, "happy")
+    st.client.publish(TOPIC_SOUND, "meow")
+    print("Head touch detected -> haptic=1, servo='ear1', screen='happy', sound='meow'")
+
+def touch_override(st):
+    st.client.publish(TOPIC_SCREEN, "happy")
+    print("Touch overrides radar -> screen='happy'")
+
+def touch_off(st):
+    st.client.publish(TOPIC_HAPTIC, "0")
+    st.client.publish(TOPIC_SERVO, "ear0")
+    st.client.publish(TOPIC_SCREEN, "normal")
+    print("Head released 3s -> haptic=0, servo='ear0', screen='normal'")
+
+def radar_on(st):
+    st.client.publish(TOPIC_SCREEN, "dizzy")
+    print("Radar detected -> screen='dizzy'")
+
+def radar_blocked(st):
+    print("Radar detected but blocked (touch cooldown) -> no action")
+
+def radar_touch_active(st):
+    print("Radar detected but touch active -> keeping screen='happy'")
+
+def radar_off(st):
+    st.client.publish(TOPIC_SCREEN, "normal")
+    print("Radar cleared 3s -> screen='normal'")
+
+def radar_off_touch_active(st):
+    print("Radar cleared but touch active -> keeping screen='happy'")
+
+def radar_unblocked(st):
+    st.client.publish(TOPIC_SCREEN, "dizzy")
+    print("Radar unblocked and still active -> screen='dizzy'")
+
+def radar_cooled(st):
+    print("Radar unblocked after touch cooldown")
+
+def sleep_changed(st):
+    print(f"/sleep received -> sleeping={not awake(st)}")
+
+HEAD_ACTIONS = {fn.__name__: fn for fn in (
+    wake, block_radar, doze, subscribe_radar, unsubscribe_radar, publish_wake, publish_sleep,
+    touch_on, touch_override, touch_off, radar_on, radar_blocked, radar_touch_active, radar_off,
+    radar_off_touch_active, radar_unblocked, radar_cooled, sleep_changed,
+)}
+
+HEAD_GUARDS = {fn.__name__: fn for fn in (
+    head_held, head_idle, touch_showing, radar_present, cooling_down, screen_free, radar_waiting, awake,
+)}
+
+HEAD_MACHINE = {
+    "touch": {
+        "states": ("idle", "held", "releasing"),
+        "timeouts": {"releasing": (TOUCH_OFF_DELAY, "touch_timeout")},
+        "transitions": [
+            ("idle", "press", None, "held", ["wake", "touch_on"]),
+            ("*", "press", "radar_present", "held", ["wake", "touch_override"]),
+            ("*", "press", None, "held", ["wake"]),
+            ("idle", "release", None, None, []),
+            ("*", "release", None, "releasing", []),
+            ("releasing", "touch_timeout", None, "idle", ["touch_off", "block_radar"]),
+        ],
+    },
+    "radar": {
+        "states": ("off", "on", "clearing"),
+        "timeouts": {"clearing": (RADAR_OFF_DELAY, "radar_timeout")},
+        "transitions": [
+            ("off", "radar_on", "screen_free", "on", ["wake", "radar_on"]),
+            ("off", "radar_on", "cooling_down", "on", ["wake", "radar_blocked"]),
+            ("off", "radar_on", None, "on", ["wake", "radar_touch_active"]),
+            ("*", "radar_on", None, "on", ["wake"]),
+            ("off", "radar_off", None, None, []),
+            ("*", "radar_off", None, "clearing", []),
+            ("clearing", "radar_timeout", "touch_showing", "off", ["radar_off_touch_active"]),
+            ("clearing", "radar_timeout", None, "off", ["radar_off"]),
+        ],
+    },
+    "block": {
+        "states": ("open", "blocked"),
+        "timeouts": {"blocked": (RADAR_BLOCK_DELAY, "block_timeout")},
+        "transitions": [
+            ("*", "block", None, "blocked", []),
+            ("blocked", "block_timeout", "radar_waiting", "open", ["radar_unblocked"]),
+            ("blocked", "block_timeout", None, "open", ["radar_cooled"]),
+        ],
+    },
+    "sleep": {
+        "states": ("awake", "asleep"),
+        "transitions": [
+            ("asleep", "wake", None, "awake", ["publish_wake", "subscribe_radar"]),
+            ("awake", "doze", None, "asleep", ["publish_sleep", "unsubscribe_radar"]),
+            ("awake", "sleep_on", None, "asleep", ["unsubscribe_radar", "sleep_changed"]),
+            ("asleep", "sleep_on", None, None, ["unsubscribe_radar"]),
+            ("asleep", "sleep_off", None, "awake", ["subscribe_radar", "sleep_changed"]),
+            ("awake", "sleep_off", None, None, ["subscribe_radar"]),
+        ],
+    },
+    "inactivity": {
+        "states": ("stopped", "counting"),
+        "timeouts": {"counting": (INACTIVITY_DELAY, "inactivity_timeout")},
+        "transitions": [
+            ("stopped", "release", None, "counting", []),
+            ("counting", "press", None, "stopped", []),
+            ("stopped", "sleep_off", "head_idle", "counting", []),
+            ("counting", "sleep_off", "head_held", "stopped", []),
+            ("counting", "sleep_on", None, "stopped", []),
+            ("counting", "inactivity_timeout", "awake", "stopped", ["doze"]),
+            ("counting", "inactivity_timeout", None, "stopped", []),
+        ],
+    },
+}
+
 class HeadState:
-    def __init__(self):
-        self.lock = threading.Lock()
-        self.head_active_now = False
-        self.active = False
-        self.off_timer = None
-        self.radar_active = False
-        self.radar_off_timer = None
-        self.radar_blocked = False
-        self.radar_block_timer = None
-        self.sleeping = False
-        self.inactivity_timer = None
+    def __init__(self, scheduler, client=None):
+        self.client = client
         self.radar_subscribed = True
+        self.machine = StateMachine(HEAD_MACHINE, HEAD_ACTIONS, HEAD_GUARDS, scheduler, self)
 
 def parse_touch_payload(payload: str):
     try:
@@ -56,202 +225,52 @@ def on_connect(client, userdata, flags, reasonCode, properties=None):
     print(f"Subscribed to topic: {TOPIC_RADAR}")
     userdata.radar_subscribed = True
 
-def on_message(client, userdata: HeadState, msg):
+def message_event(msg):
+    payload = msg.payload.decode("utf-8", errors="ignore").strip()
     if msg.topic == TOPIC_TOUCH:
-        handle_touch(client, userdata, msg)
-    elif msg.topic == TOPIC_RADAR:
-        handle_radar(client, userdata, msg)
-    elif msg.topic == TOPIC_SLEEP:
-        handle_sleep(client, userdata, msg)
-
-def wake_if_sleeping(client, st: HeadState):
-    if st.sleeping:
-        client.publish(TOPIC_SLEEP, "0")
-        print("Waking from sleep -> sleep=0")
-        st.sleeping = False
-        if not st.radar_subscribed:
-            client.subscribe(TOPIC_RADAR)
-            st.radar_subscribed = True
-            print(f"Subscribed to topic: {TOPIC_RADAR}")
-
-def update_inactivity_timer(client, st: HeadState):
-    idle = not st.head_active_now
-    if idle:
-        if st.inactivity_timer is None:
-            def go_sleep():
-                with st.lock:
-                    if (not st.head_active_now) and (not st.sleeping):
-                        client.publish(TOPIC_SLEEP, "1")
-                        print("Inactivity 3m -> sleep=1")
-                        st.sleeping = True
-                        if st.radar_subscribed:
-                            client.unsubscribe(TOPIC_RADAR)
-                            st.radar_subscribed = False
-                            print(f"Unsubscribed from topic: {TOPIC_RADAR}")
-                    st.inactivity_timer = None
-            st.inactivity_timer = threading.Timer(180.0, go_sleep)
-            st.inactivity_timer.daemon = True
-            st.inactivity_timer.start()
-    else:
-        if st.inactivity_timer:
-            st.inactivity_timer.cancel()
-            st.inactivity_timer = None
-
-def handle_sleep(client, userdata: HeadState, msg):
-    payload = msg.payload.decode("utf-8", errors="ignore").strip().lower()
-    try:
-        if payload.startswith("sleep:"):
-            val = payload.split(":", 1)[1].strip()
-        else:
-            val = payload
-        new_state = (val == "1")
-    except Exception:
-        return
+        values = parse_touch_payload(payload)
+        head_now = int(values.get("L_HEAD", 0)) == 1 or int(values.get("R_HEAD", 0)) == 1
+        return "press" if head_now else "release"
+    if msg.topic == TOPIC_RADAR:
+        try:
+            if payload.lower().startswith("radar:"):
+                radar_state = int(payload.split(":", 1)[1].strip())
+            else:
+                radar_state = int(payload)
+        except Exception:
+            return None
+        return "radar_on" if radar_state == 1 else "radar_off"
+    if msg.topic == TOPIC_SLEEP:
+        val = payload.lower()
+        if val.startswith("sleep:"):
+            val = val.split(":", 1)[1].strip()
+        return "sleep_on" if val == "1" else "sleep_off"
+    return None
 
-    st = userdata
-    with st.lock:
-        prev = st.sleeping
-        st.sleeping = new_state
-        if new_state:
-            if st.inactivity_timer:
-                st.inactivity_timer.cancel()
-                st.inactivity_timer = None
-            if st.radar_subscribed:
-                client.unsubscribe(TOPIC_RADAR)
-                st.radar_subscribed = False
-                print(f"Unsubscribed from topic: {TOPIC_RADAR}")
-        else:
-            if not st.radar_subscribed:
-                client.subscribe(TOPIC_RADAR)
-                st.radar_subscribed = True
-                print(f"Subscribed to topic: {TOPIC_RADAR}")
-            update_inactivity_timer(client, st)
-        if new_state != prev:
-            print(f"/sleep received -> sleeping={st.sleeping}")
-
-def handle_touch(client, userdata: HeadState, msg):
-    payload = msg.payload.decode("utf-8", errors="ignore").strip()
-    values = parse_touch_payload(payload)
-    L_HEAD = int(values.get("L_HEAD", 0))
-    R_HEAD = int(values.get("R_HEAD", 0))
-    head_now = (L_HEAD == 1) or (R_HEAD == 1)
-
-    st = userdata
-    with st.lock:
-        st.head_active_now = head_now
-
-        if head_now:
-            wake_if_sleeping(client, st)
-
-            if st.off_timer:
-                st.off_timer.cancel()
-                st.off_timer = None
-
-            if not st.active:
-                client.publish(TOPIC_HAPTIC, "1")
-                client.publish(TOPIC_SERVO, "ear1")
-                client.publish(TOPIC_SCREEN, "happy")
-                client.publish(TOPIC_SOUND, "meow")
-                st.active = True
-                print("Head touch detected -> haptic=1, servo='ear1', screen='happy', sound='meow'")
-            elif st.radar_active:
-                client.publish(TOPIC_SCREEN, "happy")
-                print("Touch overrides radar -> screen='happy'")
-        else:
-            if st.off_timer:
-                st.off_timer.cancel()
-
-            def do_off():
-                with st.lock:
-                    if not st.head_active_now and st.active:
-                        client.publish(TOPIC_HAPTIC, "0")
-                        client.publish(TOPIC_SERVO, "ear0")
-                        client.publish(TOPIC_SCREEN, "normal")
-                        print("Head released 3s -> haptic=0, servo='ear0', screen='normal'")
-                        st.active = False
-                        
-                        st.radar_blocked = True
-                        if st.radar_block_timer:
-                            st.radar_block_timer.cancel()
-                        
-                        def unblock_radar():
-                            with st.lock:
-                                st.radar_blocked = False
-                                st.radar_block_timer = None
-                                if st.radar_active and not st.active:
-                                    client.publish(TOPIC_SCREEN, "dizzy")
-                                    print("Radar unblocked and still active -> screen='dizzy'")
-                                else:
-                                    print("Radar unblocked after touch cooldown")
-                        
-                        st.radar_block_timer = threading.Timer(3.0, unblock_radar)
-                        st.radar_block_timer.daemon = True
-                        st.radar_block_timer.start()
-                    st.off_timer = None
-
-            st.off_timer = threading.Timer(3.0, do_off)
-            st.off_timer.daemon = True
-            st.off_timer.start()
-
-        update_inactivity_timer(client, st)
-
-def handle_radar(client, userdata: HeadState, msg):
-    payload = msg.payload.decode("utf-8", errors="ignore").strip()
-    
-    radar_state = 0
-    try:
-        if payload.lower().startswith("radar:"):
-            radar_state = int(payload.split(":", 1)[1].strip())
-        else:
-            radar_state = int(payload)
-    except Exception:
+def on_message(client, userdata: HeadState, msg):
+    event = message_event(msg)
+    if event is None:
         return
-
-    st = userdata
-    with st.lock:
-        if radar_state == 1:
-            wake_if_sleeping(client, st)
-
-            if st.radar_off_timer:
-                st.radar_off_timer.cancel()
-                st.radar_off_timer = None
-
-            if not st.radar_active:
-                st.radar_active = True
-                if not st.active and not st.radar_blocked:
-                    client.publish(TOPIC_SCREEN, "dizzy")
-                    print("Radar detected -> screen='dizzy'")
-                elif st.radar_blocked:
-                    print("Radar detected but blocked (touch cooldown) -> no action")
-                else:
-                    print("Radar detected but touch active -> keeping screen='happy'")
-        else:
-            if st.radar_off_timer:
-                st.radar_off_timer.cancel()
-
-            def do_radar_off():
-                with st.lock:
-                    if st.radar_active:
-                        st.radar_active = False
-                        if not st.active:
-                            client.publish(TOPIC_SCREEN, "normal")
-                            print("Radar cleared 3s -> screen='normal'")
-                        else:
-                            print("Radar cleared but touch active -> keeping screen='happy'")
-                    st.radar_off_timer = None
-
-            st.radar_off_timer = threading.Timer(3.0, do_radar_off)
-            st.radar_off_timer.daemon = True
-            st.radar_off_timer.start()
+    if userdata.client is None:
+        userdata.client = client
+    ctx = tracing.received(msg) if tracing.enabled else None
+    userdata.machine.dispatch(event)
+    if ctx is not None:
+        tracing.finish(ctx, "main handle")
 
 def main():
-    state = HeadState()
+    tracing.setup("main")
+    scheduler = Scheduler()
+    scheduler_thread = threading.Thread(target=scheduler.run, daemon=True)
+    scheduler_thread.start()
+    state = HeadState(scheduler)
 
     client = mqtt.Client(
         protocol=mqtt.MQTTv5,
         callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
         userdata=state,
     )
+    state.client = tracing.traced(client)
     client.on_connect = on_connect
     client.on_message = on_message
 
@@ -264,19 +283,10 @@ def main():
     except KeyboardInterrupt:
         pass
     finally:
-        with state.lock:
-            if state.off_timer:
-                state.off_timer.cancel()
-                state.off_timer = None
-            if state.radar_off_timer:
-                state.radar_off_timer.cancel()
-                state.radar_off_timer = None
-            if state.radar_block_timer:
-                state.radar_block_timer.cancel()
-                state.radar_block_timer = None
-            if state.inactivity_timer:
-                state.inactivity_timer.cancel()
-                state.inactivity_timer = None
+        state.machine.stop()
+        print(f"Behavior stats: {state.machine.stats()}")
+        scheduler.stop()
+        print(f"Timer stats: {scheduler.stats()}")
         client.loop_stop()
         client.disconnect()
 
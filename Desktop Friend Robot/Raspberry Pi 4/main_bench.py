@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+import io
+import os
+import sys
+import json
+import time
+import random
+import collections
+import argparse
+import tempfile
+import threading
+import subprocess
+import contextlib
+import types
+import main
+import tracing
+from scheduler import Scheduler, VirtualClock
+from fake_devices import FakeClient, FakeMessage
+from serial_bridge import publish_serial_line
+from metrics import summarize_ms
+
+LEGACY_REV = "703f2aff79db9049fac5e815432ab7301ff511ae"
+TOUCH_ON = "Touch: L_BODY=0, R_BODY=0, F_BODY=0, B_BODY=0, L_HEAD=1, R_HEAD=0"
+TOUCH_OFF = "Touch: L_BODY=0, R_BODY=0, F_BODY=0, B_BODY=0, L_HEAD=0, R_HEAD=0"
+
+
+class ThreadTimers:
+    def __init__(self):
+        self.started = 0
+
+    def call_later(self, delay, callback):
+        timer = threading.Timer(delay, callback)
+        timer.daemon = True
+        timer.start()
+        self.started += 1
+        return timer
+
+    def stop(self):
+        pass
+
+
+class TimingTimers:
+    def __init__(self, inner):
+        self.inner = inner
+        self.lateness = []
+
+    def call_later(self, delay, callback):
+        due = time.monotonic() + delay
+
+        def fire():
+            self.lateness.append(time.monotonic() - due)
+            callback()
+        return self.inner.call_later(delay, fire)
+
+
+def sensor_messages(count, seed):
+    rng = random.Random(seed)
+    messages = []
+    touch = radar = False
+    for _ in range(count):
+        if rng.random() < 0.6:
+            touch = not touch
+            messages.append(FakeMessage(main.TOPIC_TOUCH, TOUCH_ON if touch else TOUCH_OFF))
+        else:
+            radar = not radar
+            messages.append(FakeMessage(main.TOPIC_RADAR, f"Radar: {int(radar)}"))
+    messages.append(FakeMessage(main.TOPIC_TOUCH, TOUCH_OFF))
+    messages.append(FakeMessage(main.TOPIC_RADAR, "Radar: 0"))
+    return messages
+
+
+def run_timers(mode, messages, args):
+    if mode == "threading.Timer":
+        inner = ThreadTimers()
+    else:
+        inner = Scheduler()
+        worker = threading.Thread(target=inner.run, daemon=True)
+        worker.start()
+    timers = TimingTimers(inner)
+    state = main.HeadState(timers)
+    client = FakeClient()
+
+    peak_threads = [threading.active_count()]
+    sampling = threading.Event()
+
+    def sample_threads():
+        while not sampling.is_set():
+            peak_threads[0] = max(peak_threads[0], threading.active_count())
+            time.sleep(0.005)
+    sampler = threading.Thread(target=sample_threads, daemon=True)
+    sampler.start()
+
+    probes = []
+    gap = 1.0 / args.rate
+    cpu0 = time.process_time()
+    t_start = time.monotonic()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i, msg in enumerate(messages):
+            main.on_message(client, state, msg)
+            if i % args.probe_every == 0:
+                probes.append(timers.call_later(args.probe_ms / 1000, lambda: None))
+            delay = t_start + (i + 1) * gap - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        burst = time.monotonic() - t_start
+        time.sleep(main.TOUCH_OFF_DELAY + main.RADAR_BLOCK_DELAY + 0.5)
+    cpu = time.process_time() - cpu0
+    sampling.set()
+    sampler.join()
+    inner.stop()
+
+    screens = [payload for _, topic, payload in client.published if topic == main.TOPIC_SCREEN]
+    print(f"  {mode}:")
+    print(f"    {len(messages)} messages in {burst:.2f} s ({len(messages) / burst:.0f}/s), "
+          f"peak threads {peak_threads[0]}, CPU {cpu:.2f} s")
+    if isinstance(inner, ThreadTimers):
+        print(f"    timer threads started: {inner.started}")
+    else:
+        print(f"    scheduler stats: {inner.stats()}")
+    print(f"    timer lateness {summarize_ms(timers.lateness)}")
+    print(f"    published {len(client.published)}, final screen {screens[-1] if screens else None!r}")
+    return screens[-1] if screens else None
+
+
+def bench_timers(args):
+    messages = sensor_messages(int(args.rate * args.duration), args.seed)
+    print(f"main.py timer stress: touch/radar toggles at {args.rate:.0f}/s for {args.duration} s")
+    finals = [run_timers(mode, messages, args) for mode in ("threading.Timer", "scheduler")]
+    ok = finals[0] == finals[1]
+    print("PASS" if ok else f"FAIL: final screen differs {finals}")
+    if not ok:
+        sys.exit(1)
+
+
+class SimBroker:
+    def __init__(self, clock):
+        self.clock = clock
+        self.subscriptions = {main.TOPIC_TOUCH, main.TOPIC_SLEEP, main.TOPIC_RADAR}
+        self.log = []
+        self.pending = collections.deque()
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.log.append((round(self.clock(), 6), "publish", topic, payload))
+        if topic in self.subscriptions:
+            self.pending.append(FakeMessage(topic, payload))
+
+    def subscribe(self, topic, *args, **kwargs):
+        self.log.append((round(self.clock(), 6), "subscribe", topic, None))
+        self.subscriptions.add(topic)
+
+    def unsubscribe(self, topic, *args, **kwargs):
+        self.log.append((round(self.clock(), 6), "unsubscribe", topic, None))
+        self.subscriptions.discard(topic)
+
+
+def record_traffic(hours, seed):
+    rng = random.Random(seed)
+    traffic = []
+    t = 0.0
+    end = hours * 3600
+    touch = radar = False
+    while t < end:
+        t += rng.expovariate(1 / 2.0)
+        if rng.random() < 0.01:
+            t += rng.uniform(main.INACTIVITY_DELAY, 3 * main.INACTIVITY_DELAY)
+        roll = rng.random()
+        if roll < 0.45:
+            if rng.random() < 0.8:
+                touch = not touch
+            side = rng.choice(("L_HEAD", "R_HEAD"))
+            values = {"L_BODY": int(rng.random() < 0.1), "R_BODY": 0, "F_BODY": 0, "B_BODY": 0,
+                      "L_HEAD": 0, "R_HEAD": 0}
+            values[side] = int(touch)
+            payload = "Touch: " + ", ".join(f"{k}={v}" for k, v in values.items())
+            traffic.append({"t": round(t, 3), "topic": main.TOPIC_TOUCH, "payload": payload})
+        elif roll < 0.95:
+            if rng.random() < 0.8:
+                radar = not radar
+            traffic.append({"t": round(t, 3), "topic": main.TOPIC_RADAR, "payload": f"Radar: {int(radar)}"})
+        else:
+            traffic.append({"t": round(t, 3), "topic": main.TOPIC_SLEEP, "payload": rng.choice(("0", "1", "sleep: 1"))})
+    return traffic
+
+
+def load_traffic(args):
+    if args.trace:
+        with open(args.trace) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    traffic = record_traffic(args.hours, args.seed)
+    if args.save:
+        with open(args.save, "w") as f:
+            for entry in traffic:
+                f.write(json.dumps(entry) + "\n")
+    return traffic
+
+
+def simulate(module, traffic):
+    clock = VirtualClock()
+    scheduler = Scheduler(clock)
+    broker = SimBroker(clock)
+    state = module.HeadState(scheduler)
+
+    def drain():
+        while broker.pending:
+            module.on_message(broker, state, broker.pending.popleft())
+
+    def advance(until):
+        while True:
+            deadline = scheduler.next_deadline()
+            if deadline is None or deadline > until:
+                break
+            clock.now = max(clock.now, deadline)
+            scheduler.run_pending()
+            drain()
+        clock.now = max(clock.now, until)
+
+    delivered = 0
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for entry in traffic:
+            advance(entry["t"])
+            if entry["topic"] not in broker.subscriptions:
+                continue
+            module.on_message(broker, state, FakeMessage(entry["topic"], entry["payload"]))
+            delivered += 1
+            drain()
+        advance(clock.now + main.INACTIVITY_DELAY + main.TOUCH_OFF_DELAY + main.RADAR_BLOCK_DELAY)
+    wall = time.perf_counter() - t0
+    return broker.log, delivered, wall, state
+
+
+def load_legacy(rev):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        source = subprocess.run(["git", "-C", directory, "show", f"{rev}:./main.py"],
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        detail = (getattr(e, "stderr", "") or str(e)).strip()
+        sys.exit(f"Cannot read the imperative main.py at {rev} from git: {detail}")
+    module = types.ModuleType("main_imperative")
+    exec(compile(source, f"main.py@{rev[:7]}", "exec"), module.__dict__)
+    return module
+
+
+def bench_simulate(args):
+    legacy = load_legacy(args.legacy_rev)
+    traffic = load_traffic(args)
+    span = traffic[-1]["t"] - traffic[0]["t"] if len(traffic) > 1 else 0.0
+    print(f"main.py behaviour replay: {len(traffic)} sensor messages over {span / 3600:.1f} h of virtual time")
+    logs = []
+    for name, module in (("imperative", legacy), ("state machine", main)):
+        log, delivered, wall, state = simulate(module, traffic)
+        logs.append(log)
+        print(f"  {name:<13} {delivered} delivered, {len(log)} MQTT calls in {wall:.2f} s "
+              f"({span / max(wall, 1e-9):.0f}x real time, {delivered / max(wall, 1e-9):.0f} msg/s)")
+        if hasattr(state, "machine"):
+            print(f"    {state.machine.stats()}")
+    counts = collections.Counter(f"{kind} {topic} {payload}" for _, kind, topic, payload in logs[1])
+    print(f"  outputs: {dict(counts.most_common())}")
+    ok = logs[0] == logs[1]
+    if not ok:
+        for i, (a, b) in enumerate(zip(logs[0], logs[1])):
+            if a != b:
+                break
+        else:
+            i = min(len(logs[0]), len(logs[1]))
+        print(f"  first difference at call {i}: imperative {logs[0][i:i + 3]} vs state machine {logs[1][i:i + 3]}")
+    print("PASS" if ok else "FAIL: MQTT output differs")
+    if not ok:
+        sys.exit(1)
+
+
+def run_traced_path(messages, lines):
+    client = FakeClient()
+    scheduler = Scheduler(VirtualClock())
+    state = main.HeadState(scheduler, tracing.traced(client))
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for line, msg in zip(lines, messages):
+            publish_serial_line(client, line)
+            main.on_message(client, state, msg)
+    elapsed = time.perf_counter() - t0
+    return elapsed, client.published
+
+
+def bench_trace(args):
+    count = int(args.count)
+    messages = sensor_messages(count, args.seed)
+    lines = [msg.payload.decode() for msg in messages]
+    print(f"Tracing overhead: {len(messages)} sensor lines through publish_serial_line + main.on_message")
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ("disabled", "enabled"):
+            if mode == "enabled":
+                with contextlib.redirect_stdout(io.StringIO()):
+                    tracing.setup("bench", directory)
+            best = min(run_traced_path(messages, lines)[0] for _ in range(args.repeat))
+            results[mode] = best
+            print(f"  {mode:<9} {best / len(messages) * 1e6:7.2f} us/message ({len(messages) / best:,.0f} msg/s)")
+            spans = tracing.ring.count if tracing.ring else 0
+            tracing.shutdown()
+            if spans:
+                print(f"    {spans} spans written")
+    print(f"  enabled costs {(results['enabled'] - results['disabled']) / len(messages) * 1e6:.2f} us/message more; "
+          f"disabled tracing is one module flag check per hop")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="main.py behaviour benchmarks with a fake MQTT client.")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("timers", help="Thread count, CPU and timer accuracy: threading.Timer versus one scheduler thread.")
+    p.add_argument("--rate", type=float, default=2000.0, help="Touch/radar messages per second.")
+    p.add_argument("--duration", type=float, default=3.0)
+    p.add_argument("--probe-every", type=int, default=20, help="Schedule an accuracy probe every N messages.")
+    p.add_argument("--probe-ms", type=float, default=50.0, help="Delay of the accuracy probes.")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_timers)
+
+    p = sub.add_parser("simulate", help="Replay sensor traffic on a virtual clock through the imperative handlers and the state machine.")
+    p.add_argument("--hours", type=float, default=8.0, help="Length of the synthetic traffic.")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--trace", help="Recorded traffic (JSON lines of t, topic and payload) to replay.")
+    p.add_argument("--save", help="Write the synthetic traffic here for later replays.")
+    p.add_argument("--legacy-rev", default=LEGACY_REV,
+                   help="Git revision whose main.py holds the imperative handlers to compare against.")
+    p.set_defaults(func=bench_simulate)
+
+    p = sub.add_parser("trace", help="Per-message cost of the tracing hooks, disabled versus enabled.")
+    p.add_argument("--count", type=int, default=20000)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_trace)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main_cli()
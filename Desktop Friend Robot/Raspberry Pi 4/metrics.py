@@ -0,0 +1,12 @@
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize_ms(values):
+    return (f"n={len(values)} p50={percentile(values, 50) * 1000:.2f} ms "
+            f"p90={percentile(values, 90) * 1000:.2f} ms p99={percentile(values, 99) * 1000:.2f} ms "
+            f"max={max(values, default=0.0) * 1000:.2f} ms")
@@ -0,0 +1,133 @@
+import time
+import heapq
+import threading
+from collections import deque
+from metrics import percentile
+
+LATENESS_WINDOW = 1000
+COMPACT_MIN_ENTRIES = 256
+
+
+class VirtualClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TimerHandle:
+    __slots__ = ("when", "callback", "cancelled", "scheduler")
+
+    def __init__(self, scheduler, when, callback):
+        self.scheduler = scheduler
+        self.when = when
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        with self.scheduler.cond:
+            if not self.cancelled:
+                self.cancelled = True
+                self.scheduler.cancelled_entries += 1
+
+
+class Scheduler:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.cond = threading.Condition()
+        self.heap = []
+        self.seq = 0
+        self.running = True
+        self.scheduled = 0
+        self.fired = 0
+        self.cancelled_entries = 0
+        self.errors = 0
+        self.lateness = deque(maxlen=LATENESS_WINDOW)
+
+    def call_later(self, delay, callback):
+        with self.cond:
+            handle = TimerHandle(self, self.clock() + delay, callback)
+            self.seq += 1
+            heapq.heappush(self.heap, (handle.when, self.seq, handle))
+            self.scheduled += 1
+            if self.cancelled_entries > COMPACT_MIN_ENTRIES and self.cancelled_entries > len(self.heap) // 2:
+                self.heap = [entry for entry in self.heap if not entry[2].cancelled]
+                heapq.heapify(self.heap)
+                self.cancelled_entries = 0
+            if self.heap[0][2] is handle:
+                self.cond.notify()
+            return handle
+
+    def pop_due(self, now):
+        while self.heap:
+            when, _, handle = self.heap[0]
+            if handle.cancelled:
+                heapq.heappop(self.heap)
+                self.cancelled_entries -= 1
+                continue
+            if when > now:
+                return None
+            heapq.heappop(self.heap)
+            handle.cancelled = True
+            return handle
+        return None
+
+    def fire(self, handle, now):
+        self.fired += 1
+        self.lateness.append(now - handle.when)
+        try:
+            handle.callback()
+        except Exception as e:
+            self.errors += 1
+            print(f"Timer callback failed: {e}")
+
+    def run_pending(self):
+        while True:
+            with self.cond:
+                now = self.clock()
+                handle = self.pop_due(now)
+            if handle is None:
+                return
+            self.fire(handle, now)
+
+    def next_deadline(self):
+        with self.cond:
+            while self.heap and self.heap[0][2].cancelled:
+                heapq.heappop(self.heap)
+                self.cancelled_entries -= 1
+            return self.heap[0][0] if self.heap else None
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.running:
+                    now = self.clock()
+                    handle = self.pop_due(now)
+                    if handle is not None:
+                        break
+                    timeout = self.heap[0][0] - now if self.heap else None
+                    self.cond.wait(timeout)
+                if not self.running:
+                    return
+            self.fire(handle, now)
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+    def stats(self):
+        with self.cond:
+            pending = len(self.heap) - self.cancelled_entries
+            heap_size = len(self.heap)
+        lateness = list(self.lateness)
+        return {
+            "pending": pending,
+            "heap": heap_size,
+            "scheduled": self.scheduled,
+            "fired": self.fired,
+            "errors": self.errors,
+            "late_p50_ms": round(percentile(lateness, 50) * 1000, 2),
+            "late_p99_ms": round(percentile(lateness, 99) * 1000, 2),
+        }
@@ -1,31 +1,17 @@
-import board
-import digitalio
-from adafruit_rgb_display import ili9341
-from PIL import Image, ImageOps, ImageSequence
+from PIL import Image
+from screen_frames import FrameCache, FramePusher, FRAME_CACHE_MAX_BYTES, decode_gif, np
+from screen_render import ScreenRenderer
+from screen_pack import ExpressionPack
 import time
+import argparse
 import paho.mqtt.client as mqtt
-import threading
+import tracing
 import sys
 import os
 
-spi = board.SPI()
-dc = digitalio.DigitalInOut(board.D24)
-cs = digitalio.DigitalInOut(board.CE0)
-reset = digitalio.DigitalInOut(board.D25)
-display = ili9341.ILI9341(spi, cs=cs, dc=dc, rst=reset, baudrate=32000000)
-
 dir_folder = os.path.expanduser("~/RobotFriend/screen/")
 gif_directory = dir_folder
-gif_files = {}
-
-for filename in os.listdir(gif_directory):
-    if filename.endswith(".gif"):
-        gif_name = filename[:-4]
-        gif_files[gif_name] = Image.open(os.path.join(gif_directory, filename))
-
-current_file = "normal" if "normal" in gif_files else None
-file_type = "gif"
-is_sleeping = False
+pack_path = os.path.expanduser("~/RobotFriend/screen.pack")
 
 LIGHT_TOPIC = "/light"
 LIGHT_NORMAL_PAYLOAD = "Hex(B5B5B5) Brightness(100) Fade(0)"
@@ -33,37 +19,72 @@ LIGHT_DIZZY_PAYLOAD = "Hex(00FF00) Brightness(100) Fade(1)"
 LIGHT_HAPPY_PAYLOAD = "Hex(E0822D) Brightness(100) Fade(0)"
 LIGHT_SLEEP_PAYLOAD = "Hex(0000FF) Brightness(100) Fade(1)"
 
-def publish_light_normal():
-    global client
-    try:
-        client.publish(LIGHT_TOPIC, LIGHT_NORMAL_PAYLOAD)
-    except Exception as e:
-        print(f"Light publish failed: {e}")
-
-def publish_light_dizzy():
-    global client
-    try:
-        client.publish(LIGHT_TOPIC, LIGHT_DIZZY_PAYLOAD)
-    except Exception as e:
-        print(f"Light publish failed: {e}")
-
-def publish_light_happy():
-    global client
-    try:
-        client.publish(LIGHT_TOPIC, LIGHT_HAPPY_PAYLOAD)
-    except Exception as e:
-        print(f"Light publish failed: {e}")
-
-def publish_light_sleep():
-    global client
+LIGHT_PAYLOADS = {
+    "normal": LIGHT_NORMAL_PAYLOAD,
+    "dizzy": LIGHT_DIZZY_PAYLOAD,
+    "happy": LIGHT_HAPPY_PAYLOAD,
+    "sleep": LIGHT_SLEEP_PAYLOAD,
+}
+
+class ScreenState:
+    def __init__(self, renderer, names):
+        self.renderer = renderer
+        self.names = set(names)
+        self.is_sleeping = False
+
+def create_display():
+    import board
+    import digitalio
+    from adafruit_rgb_display import ili9341
+
+    spi = board.SPI()
+    dc = digitalio.DigitalInOut(board.D24)
+    cs = digitalio.DigitalInOut(board.CE0)
+    reset = digitalio.DigitalInOut(board.D25)
+    return ili9341.ILI9341(spi, cs=cs, dc=dc, rst=reset, baudrate=32000000)
+
+def load_gif_files(directory):
+    gif_files = {}
+    for filename in os.listdir(directory):
+        if filename.endswith(".gif"):
+            gif_name = filename[:-4]
+            gif_files[gif_name] = Image.open(os.path.join(directory, filename))
+    return gif_files
+
+def open_frame_source(display, frame_format, delta, pack):
+    size = (display.width, display.height)
+    if frame_format == "rgb565" and pack and os.path.exists(pack):
+        try:
+            source = ExpressionPack(pack)
+            if source.size == size:
+                print(f"Using expression pack: {source.stats()}")
+                return source, source.names()
+            print(f"Expression pack is {source.size}, display is {size} -> ignoring pack")
+            source.close()
+        except (OSError, ValueError) as e:
+            print(f"Failed to open expression pack: {e}")
+
+    gif_files = load_gif_files(gif_directory)
+    frame_cache = FrameCache(
+        lambda name: decode_gif(gif_files[name], size, frame_format, delta),
+        max_bytes=FRAME_CACHE_MAX_BYTES,
+    )
+    return frame_cache, list(gif_files)
+
+def publish_light(client, name):
+    payload = LIGHT_PAYLOADS.get(name)
+    if payload is None:
+        return
     try:
-        client.publish(LIGHT_TOPIC, LIGHT_SLEEP_PAYLOAD)
+        client.publish(LIGHT_TOPIC, payload, properties=tracing.outgoing() if tracing.enabled else None)
     except Exception as e:
         print(f"Light publish failed: {e}")
 
-stop_event = threading.Event()
-lock = threading.Lock()
-running = True
+def show_expression(client, st: ScreenState, name, received_at):
+    if name not in st.names:
+        return
+    st.renderer.show(name, received_at, tracing.current() if tracing.enabled else None)
+    publish_light(client, name)
 
 def on_connect(client, userdata, flags, reasonCode, properties=None):
     try:
@@ -74,109 +95,78 @@ def on_connect(client, userdata, flags, reasonCode, properties=None):
     client.subscribe("/screen")
     client.subscribe("/sleep")
 
-def on_message(client, userdata, msg):
-    global current_file, file_type, stop_event, is_sleeping
+def on_message(client, userdata: ScreenState, msg):
+    st = userdata
+    received_at = st.renderer.clock()
+    ctx = tracing.received(msg) if tracing.enabled else None
+    try:
+        handle_message(client, st, msg, received_at)
+    finally:
+        if ctx is not None:
+            tracing.finish(ctx, "screen handle")
+
+def handle_message(client, st: ScreenState, msg, received_at):
     payload = msg.payload.decode().strip().lower()
 
     if msg.topic == "/sleep":
         if payload == "1":
-            is_sleeping = True
-            if "sleep" in gif_files:
-                with lock:
-                    current_file = "sleep"
-                    file_type = "gif"
-                    stop_event.set()
-                publish_light_sleep()
+            st.is_sleeping = True
+            show_expression(client, st, "sleep", received_at)
         elif payload == "0":
-            is_sleeping = False
-            if "normal" in gif_files:
-                with lock:
-                    current_file = "normal"
-                    file_type = "gif"
-                    stop_event.set()
-                publish_light_normal()
+            st.is_sleeping = False
+            show_expression(client, st, "normal", received_at)
         return
 
     if msg.topic == "/screen":
-        if is_sleeping:
+        if st.is_sleeping:
             return
-        if payload in gif_files:
-            with lock:
-                current_file = payload
-                file_type = "gif"
-                stop_event.set()
-            if payload == "normal":
-                publish_light_normal()
-            elif payload == "dizzy":
-                publish_light_dizzy()
-            elif payload == "happy":
-                publish_light_happy()
-            elif payload == "sleep":
-                publish_light_sleep()
-
-client = mqtt.Client(
-    protocol=mqtt.MQTTv5,
-    callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
-    userdata=None
-)
-client.on_connect = on_connect
-client.on_message = on_message
-client.connect("localhost", 1883)
-client.loop_start()
-
-def process_frame(frame):
-    frame = frame.convert("RGB")
-    r, g, b = frame.split()
-    frame = Image.merge("RGB", (r, g, b))
-    frame = frame.rotate(270, expand=True)
-    frame = ImageOps.invert(frame)
-    frame = frame.resize((display.width, display.height))
-    return frame
-
-def responsive_sleep(duration):
-    step = 0.01
-    elapsed = 0
-    while running and elapsed < duration:
-        time.sleep(min(step, duration - elapsed))
-        elapsed += step
-
-def display_gif(img):
-    target_frame_time = 1.0 / 60.0
-    for frame in ImageSequence.Iterator(img):
-        if not running or stop_event.is_set():
-            stop_event.clear()
-            break
-        start = time.time()
-        frame = process_frame(frame)
-        display.image(frame)
-        duration = frame.info.get('duration', 50) / 1000
-        sleep_time = max(target_frame_time, duration)
-        elapsed = time.time() - start
-        remaining = sleep_time - elapsed
-        if remaining > 0:
-            responsive_sleep(remaining)
-
-try:
-    with lock:
-        img = gif_files["normal"]
-    publish_light_normal()
-    display_gif(img)
-
-    while running:
-        with lock:
-            img = gif_files[current_file]
-
-        if file_type == "gif":
-            display_gif(img)
-        else:
-            frame = process_frame(img)
-            display.image(frame)
-            responsive_sleep(0.1)
-
-except KeyboardInterrupt:
-    print("\nExiting...")
-finally:
-    running = False
-    client.loop_stop()
-    client.disconnect()
-    sys.exit(0)
\ No newline at end of file
+        show_expression(client, st, payload, received_at)
+
+def main():
+    parser = argparse.ArgumentParser(description="Play expression GIFs on the ILI9341 display.")
+    parser.add_argument("--frame-format", choices=["pil", "rgb565"], default="rgb565",
+                        help="Keep frames as PIL images or as pre-packed RGB565 buffers written in one SPI block.")
+    parser.add_argument("--delta", action=argparse.BooleanOptionalAction, default=True,
+                        help="Only push the changed regions between consecutive frames (rgb565 only).")
+    parser.add_argument("--pack", default=pack_path,
+                        help="Expression pack built by screen_pack.py; falls back to GIFs when missing.")
+    args = parser.parse_args()
+    tracing.setup("screen")
+
+    frame_format = args.frame_format
+    if frame_format == "rgb565" and np is None:
+        print("NumPy not available -> falling back to PIL frames")
+        frame_format = "pil"
+
+    display = create_display()
+    frame_source, names = open_frame_source(display, frame_format, args.delta, args.pack)
+    renderer = ScreenRenderer(FramePusher(display, delta=args.delta), frame_source)
+    state = ScreenState(renderer, names)
+
+    client = mqtt.Client(
+        protocol=mqtt.MQTTv5,
+        callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+        userdata=state
+    )
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect("localhost", 1883)
+    client.loop_start()
+
+    try:
+        frame_source.preload(sorted(names, key=lambda name: name != "normal"))
+        print(f"Frames ready: {frame_source.stats()}")
+
+        show_expression(client, state, "normal", time.monotonic())
+        renderer.run()
+    except KeyboardInterrupt:
+        print("\nExiting...")
+    finally:
+        renderer.stop()
+        print(f"Switch latency: {renderer.latency_stats()}")
+        client.loop_stop()
+        client.disconnect()
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+from PIL import Image, ImageSequence
+from screen_frames import DISPLAY_W, DISPLAY_H, FrameCache, FramePusher, decode_gif, process_frame, push_frame
+from screen_render import ScreenRenderer
+from screen_pack import ExpressionPack, build_pack
+from fake_devices import FakeDisplay, FakeClient, FakeMessage, SPI_BAUDRATE
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GIF_FOLDER = os.path.join(BASE_DIR, "screen")
+
+
+def open_gifs(folder):
+    gifs = {}
+    for filename in sorted(os.listdir(folder)):
+        if filename.endswith(".gif"):
+            gifs[filename[:-4]] = Image.open(os.path.join(folder, filename))
+    return gifs
+
+
+def report(label, frames, wall, cpu):
+    fps = frames / wall if wall > 0 else 0.0
+    cpu_ms = cpu / frames * 1000 if frames else 0.0
+    print(f"  {label:<10} frames={frames:<5} fps={fps:8.1f} cpu/frame={cpu_ms:7.3f} ms")
+
+
+def bench_cache(args):
+    gifs = open_gifs(args.folder)
+    display = FakeDisplay()
+    size = (display.width, display.height)
+    cache = FrameCache(lambda name: decode_gif(gifs[name], size), max_bytes=args.max_mb * 1024 * 1024)
+
+    print(f"Frame cache benchmark ({args.loops} loops per GIF, no frame pacing)")
+    for name, img in gifs.items():
+        print(f"{name}:")
+
+        frames = 0
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        for _ in range(args.loops):
+            for frame in ImageSequence.Iterator(img):
+                display.image(process_frame(frame, size))
+                frames += 1
+        report("uncached", frames, time.perf_counter() - wall0, time.process_time() - cpu0)
+
+        t0 = time.perf_counter()
+        cache.get(name)
+        print(f"  {'decode':<10} {(time.perf_counter() - t0) * 1000:.1f} ms (one-off, first play)")
+
+        frames = 0
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        for _ in range(args.loops):
+            for frame in cache.get(name):
+                display.image(frame.data)
+                frames += 1
+        report("cached", frames, time.perf_counter() - wall0, time.process_time() - cpu0)
+
+    print(f"Cache stats: {cache.stats()}")
+
+
+def bench_rgb565(args):
+    gifs = open_gifs(args.folder)
+    display = FakeDisplay(baudrate=args.baudrate)
+    size = (display.width, display.height)
+    wire = f"{args.baudrate} baud" if args.baudrate else "unthrottled"
+
+    print(f"RGB565 push benchmark ({args.loops} loops per GIF, SPI sink {wire})")
+    for name, img in gifs.items():
+        print(f"{name}:")
+        for frame_format in ("pil", "rgb565"):
+            frames = decode_gif(img, size, frame_format)
+            display.reset_counters()
+            wall0, cpu0 = time.perf_counter(), time.process_time()
+            for _ in range(args.loops):
+                for frame in frames:
+                    push_frame(display, frame)
+            wall = time.perf_counter() - wall0
+            cpu = time.process_time() - cpu0
+            count = len(frames) * args.loops
+            print(f"  {frame_format:<10} frames={count:<5} fps={count / wall:8.1f} "
+                  f"MB/s={display.bytes_sent / wall / 1e6:7.2f} cpu/frame={cpu / count * 1000:7.3f} ms")
+
+
+def bench_delta(args):
+    gifs = open_gifs(args.folder)
+    display = FakeDisplay()
+    size = (display.width, display.height)
+
+    print("Delta-frame benchmark (SPI bytes per animation loop, steady state)")
+    short = []
+    for name, img in gifs.items():
+        frames = decode_gif(img, size, "rgb565", delta=True)
+        loop_bytes = {}
+        for delta in (False, True):
+            pusher = FramePusher(display, delta=delta)
+            for index in range(len(frames)):
+                pusher.push(frames, index)
+            display.reset_counters()
+            for index in range(len(frames)):
+                pusher.push(frames, index)
+            loop_bytes[delta] = display.bytes_sent
+        full_frames = sum(1 for f in frames if f.rects is None)
+        rects = sum(len(f.rects) for f in frames if f.rects is not None)
+        ratio = loop_bytes[False] / loop_bytes[True] if loop_bytes[True] else float("inf")
+        print(f"{name}: frames={len(frames)} full-frame fallbacks={full_frames} rects={rects}")
+        print(f"  full   {loop_bytes[False]:>10} B/loop {loop_bytes[False] / len(frames):>10.0f} B/frame")
+        print(f"  delta  {loop_bytes[True]:>10} B/loop {loop_bytes[True] / len(frames):>10.0f} B/frame  ({ratio:.1f}x less)")
+        if ratio < args.min_ratio:
+            short.append(name)
+    if short:
+        print(f"FAIL: delta saves less than {args.min_ratio}x on {', '.join(short)}")
+        sys.exit(1)
+    print(f"PASS: delta saves >= {args.min_ratio}x on every GIF")
+
+
+def bench_switch(args):
+    import screen
+
+    gifs = open_gifs(args.folder)
+    display = FakeDisplay(baudrate=args.baudrate)
+    size = (display.width, display.height)
+    cache = FrameCache(lambda name: decode_gif(gifs[name], size, "rgb565", delta=True))
+    cache.preload(gifs)
+    renderer = ScreenRenderer(FramePusher(display), cache)
+    state = screen.ScreenState(renderer, gifs)
+    client = FakeClient()
+
+    thread = threading.Thread(target=renderer.run, daemon=True)
+    thread.start()
+    screen.on_message(client, state, FakeMessage("/screen", "normal"))
+
+    names = sorted(gifs)
+    rng = random.Random(args.seed)
+    for _ in range(args.count):
+        time.sleep(rng.uniform(args.min_gap_ms, args.max_gap_ms) / 1000)
+        screen.on_message(client, state, FakeMessage("/screen", rng.choice(names)))
+    time.sleep(0.2)
+    renderer.stop()
+    thread.join(timeout=1)
+
+    stats = renderer.latency_stats()
+    print(f"Switch latency over {stats['switches']} /screen messages "
+          f"(SPI sink {args.baudrate or 'unthrottled'}):")
+    print(f"  p50={stats['p50_ms']:.2f} ms p99={stats['p99_ms']:.2f} ms max={stats['max_ms']:.2f} ms")
+    print(f"  frames shown={renderer.frames_shown} light publishes={len(client.published)}")
+    if stats["p99_ms"] > args.max_p99_ms:
+        print(f"FAIL: p99 {stats['p99_ms']:.2f} ms > {args.max_p99_ms} ms")
+        sys.exit(1)
+    print(f"PASS: p99 <= {args.max_p99_ms} ms")
+
+
+def bench_startup(args):
+    size = (DISPLAY_W, DISPLAY_H)
+    with tempfile.TemporaryDirectory() as tmp:
+        pack = args.pack
+        if not pack:
+            pack = os.path.join(tmp, "screen.pack")
+            t0 = time.perf_counter()
+            build_pack(args.folder, pack, size)
+            print(f"Built {pack} in {time.perf_counter() - t0:.2f} s ({os.path.getsize(pack) / 1024 / 1024:.1f} MiB)")
+
+        print(f"Startup benchmark ({args.repeat} runs, time to open all expressions / first 'normal' frame ready)")
+        for label in ("gif", "pack"):
+            opens, firsts = [], []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                if label == "gif":
+                    gifs = open_gifs(args.folder)
+                    source = FrameCache(lambda name: decode_gif(gifs[name], size, "rgb565", delta=True))
+                else:
+                    source = ExpressionPack(pack)
+                t1 = time.perf_counter()
+                bytes(source.get("normal")[0].data[:2])
+                t2 = time.perf_counter()
+                opens.append(t1 - t0)
+                firsts.append(t2 - t0)
+                if label == "pack":
+                    source.close()
+            print(f"  {label:<5} open={min(opens) * 1000:8.2f} ms first frame={min(firsts) * 1000:9.2f} ms (best of {args.repeat})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Screen rendering benchmarks with a fake display.")
+    parser.add_argument("--folder", default=GIF_FOLDER, help="Folder with expression GIFs.")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("cache", help="Frames/sec and CPU per frame with and without the frame cache.")
+    p.add_argument("--loops", type=int, default=3, help="Animation loops per GIF.")
+    p.add_argument("--max-mb", type=int, default=48, help="Frame cache memory cap in MiB.")
+    p.set_defaults(func=bench_cache)
+
+    p = sub.add_parser("rgb565", help="Throughput of PIL frames versus pre-packed RGB565 buffers.")
+    p.add_argument("--loops", type=int, default=3, help="Animation loops per GIF.")
+    p.add_argument("--baudrate", type=int, default=0,
+                   help=f"Simulate SPI wire time at this baudrate (e.g. {SPI_BAUDRATE}); 0 disables.")
+    p.set_defaults(func=bench_rgb565)
+
+    p = sub.add_parser("delta", help="SPI bytes per animation loop with full frames versus dirty rectangles.")
+    p.add_argument("--min-ratio", type=float, default=10.0, help="Required full/delta byte ratio per GIF.")
+    p.set_defaults(func=bench_delta)
+
+    p = sub.add_parser("switch", help="Fire /screen messages at screen.on_message and check p99 switch latency.")
+    p.add_argument("--count", type=int, default=200, help="Number of /screen messages.")
+    p.add_argument("--min-gap-ms", type=float, default=5.0, help="Minimum gap between messages.")
+    p.add_argument("--max-gap-ms", type=float, default=120.0, help="Maximum gap between messages.")
+    p.add_argument("--baudrate", type=int, default=SPI_BAUDRATE,
+                   help="Simulated SPI baudrate of the fake display; 0 disables throttling.")
+    p.add_argument("--max-p99-ms", type=float, default=100.0, help="Fail if p99 switch latency exceeds this.")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_switch)
+
+    p = sub.add_parser("startup", help="Startup time of the GIF loader versus the mmapped expression pack.")
+    p.add_argument("--pack", help="Existing pack to load; built from --folder into a temp dir when omitted.")
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageOps, ImageSequence
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DISPLAY_W, DISPLAY_H = 240, 320
+DEFAULT_FRAME_MS = 50
+FRAME_CACHE_MAX_BYTES = 48 * 1024 * 1024
+
+DIRTY_TILE = 8
+DELTA_MAX_RECTS = 64
+DELTA_MAX_RATIO = 0.5
+BLOCK_OVERHEAD_BYTES = 256
+
+
+class Frame:
+    __slots__ = ("data", "duration", "rects")
+
+    def __init__(self, data, duration, rects=None):
+        self.data = data
+        self.duration = duration
+        self.rects = rects
+
+    @property
+    def nbytes(self):
+        if isinstance(self.data, Image.Image):
+            return self.data.width * self.data.height * len(self.data.getbands())
+        nbytes = memoryview(self.data).nbytes
+        if self.rects:
+            nbytes += sum(memoryview(r[4]).nbytes for r in self.rects)
+        return nbytes
+
+
+def process_frame(frame, size):
+    frame = frame.convert("RGB")
+    r, g, b = frame.split()
+    frame = Image.merge("RGB", (r, g, b))
+    frame = frame.rotate(270, expand=True)
+    frame = ImageOps.invert(frame)
+    frame = frame.resize(size)
+    return frame
+
+
+def to_rgb565(img):
+    pixels = np.asarray(img.convert("RGB"), dtype=np.uint16)
+    packed = ((pixels[..., 0] & 0xF8) << 8) | ((pixels[..., 1] & 0xFC) << 3) | (pixels[..., 2] >> 3)
+    return packed.astype(">u2").tobytes()
+
+
+def dirty_rects(prev, curr, tile=DIRTY_TILE):
+    changed = prev != curr
+    if not changed.any():
+        return []
+
+    h, w = changed.shape
+    th, tw = -(-h // tile), -(-w // tile)
+    padded = np.zeros((th * tile, tw * tile), dtype=bool)
+    padded[:h, :w] = changed
+    tiles = padded.reshape(th, tile, tw, tile).any(axis=(1, 3))
+
+    tile_rects = []
+    open_runs = {}
+    for ty in range(th):
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], tiles[ty].view(np.int8), [0]))))
+        next_runs = {}
+        for c0, c1 in zip(edges[::2], edges[1::2] - 1):
+            rect = open_runs.pop((c0, c1), None) or [c0, ty, c1, ty]
+            rect[3] = ty
+            next_runs[(c0, c1)] = rect
+        tile_rects.extend(open_runs.values())
+        open_runs = next_runs
+    tile_rects.extend(open_runs.values())
+
+    rects = []
+    for c0, r0, c1, r1 in tile_rects:
+        x0, y0 = c0 * tile, r0 * tile
+        x1, y1 = min((c1 + 1) * tile, w) - 1, min((r1 + 1) * tile, h) - 1
+        sub = changed[y0:y1 + 1, x0:x1 + 1]
+        rows = np.flatnonzero(sub.any(axis=1))
+        cols = np.flatnonzero(sub.any(axis=0))
+        rects.append((x0 + int(cols[0]), y0 + int(rows[0]), x0 + int(cols[-1]), y0 + int(rows[-1])))
+    return rects
+
+
+def merge_rects(rects, overhead=BLOCK_OVERHEAD_BYTES):
+    boxes = np.array(rects, dtype=np.int64).reshape(-1, 4)
+    while len(boxes) > 1:
+        lo = np.minimum(boxes[:, None, :2], boxes[None, :, :2])
+        hi = np.maximum(boxes[:, None, 2:], boxes[None, :, 2:])
+        area = np.prod(boxes[:, 2:] - boxes[:, :2] + 1, axis=1)
+        gain = (area[:, None] + area[None, :] - np.prod(hi - lo + 1, axis=2)) * 2 + overhead
+        np.fill_diagonal(gain, -1)
+        i, j = np.unravel_index(np.argmax(gain), gain.shape)
+        if gain[i, j] <= 0:
+            break
+        boxes[i] = np.concatenate((lo[i, j], hi[i, j]))
+        boxes = np.delete(boxes, j, axis=0)
+    return [tuple(int(v) for v in box) for box in boxes]
+
+
+def build_deltas(frames, size):
+    w, h = size
+    full_bytes = w * h * 2
+    pixels = [np.frombuffer(f.data, dtype=">u2").reshape(h, w) for f in frames]
+    for i, frame in enumerate(frames):
+        rects = merge_rects(dirty_rects(pixels[i - 1], pixels[i]))
+        cost = sum((x1 - x0 + 1) * (y1 - y0 + 1) * 2 + BLOCK_OVERHEAD_BYTES for x0, y0, x1, y1 in rects)
+        if len(rects) > DELTA_MAX_RECTS or cost > full_bytes * DELTA_MAX_RATIO:
+            frame.rects = None
+            continue
+        frame.rects = [
+            (x0, y0, x1, y1, pixels[i][y0:y1 + 1, x0:x1 + 1].tobytes())
+            for x0, y0, x1, y1 in rects
+        ]
+    return frames
+
+
+def decode_gif(img, size, frame_format="pil", delta=False):
+    frames = []
+    for frame in ImageSequence.Iterator(img):
+        duration = frame.info.get("duration", DEFAULT_FRAME_MS) / 1000
+        data = process_frame(frame, size)
+        if frame_format == "rgb565":
+            data = to_rgb565(data)
+        frames.append(Frame(data, duration))
+    img.seek(0)
+    if delta and frame_format == "rgb565":
+        build_deltas(frames, size)
+    return frames
+
+
+def write_block(display, x0, y0, x1, y1, data):
+    # Display._block is private in adafruit-circuitpython-rgb-display 3.x: it sets the
+    # column/row window and writes the RGB565 bytes. Re-check it when upgrading the library.
+    display._block(x0, y0, x1, y1, data)
+
+
+def push_frame(display, frame):
+    if isinstance(frame.data, Image.Image):
+        display.image(frame.data)
+    else:
+        write_block(display, 0, 0, display.width - 1, display.height - 1, frame.data)
+
+
+class FramePusher:
+    def __init__(self, display, delta=True):
+        self.display = display
+        self.delta = delta
+        self.last = None
+
+    def push(self, frames, index):
+        frame = frames[index]
+        last = self.last
+        follows_last = last is not None and last[0] is frames and last[1] == (index - 1) % len(frames)
+        if self.delta and frame.rects is not None and follows_last:
+            for x0, y0, x1, y1, data in frame.rects:
+                write_block(self.display, x0, y0, x1, y1, data)
+        else:
+            push_frame(self.display, frame)
+        self.last = (frames, index)
+
+
+class FrameCache:
+    def __init__(self, loader, max_bytes=FRAME_CACHE_MAX_BYTES):
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, name):
+        with self.lock:
+            frames = self.entries.get(name)
+            if frames is not None:
+                self.entries.move_to_end(name)
+                self.hits += 1
+                return frames
+            self.misses += 1
+            frames = self.loader(name)
+            self.entries[name] = frames
+            self.size_bytes += sum(f.nbytes for f in frames)
+            while self.size_bytes > self.max_bytes and len(self.entries) > 1:
+                _, old = self.entries.popitem(last=False)
+                self.size_bytes -= sum(f.nbytes for f in old)
+                self.evictions += 1
+            return frames
+
+    def preload(self, names):
+        for name in names:
+            if self.size_bytes >= self.max_bytes:
+                break
+            self.get(name)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+import os
+import mmap
+import struct
+import argparse
+from PIL import Image
+from screen_frames import Frame, DISPLAY_W, DISPLAY_H, decode_gif
+
+PACK_MAGIC = b"RFXP"
+PACK_VERSION = 1
+PACK_ALIGN = 4096
+NAME_LEN = 32
+
+HEADER = struct.Struct("<4sHHHHIII")
+EXPRESSION = struct.Struct(f"<{NAME_LEN}sII")
+FRAME = struct.Struct("<QIHHI")
+RECT = struct.Struct("<HHHHQI")
+
+
+def align(offset, alignment):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def build_pack(folder, output, size=(DISPLAY_W, DISPLAY_H), delta=True):
+    expressions = []
+    for filename in sorted(os.listdir(folder)):
+        if filename.endswith(".gif"):
+            name = filename[:-4]
+            if len(name.encode("utf-8")) > NAME_LEN:
+                raise ValueError(f"Expression name too long: {name}")
+            with Image.open(os.path.join(folder, filename)) as img:
+                expressions.append((name, decode_gif(img, size, "rgb565", delta)))
+
+    n_frames = sum(len(frames) for _, frames in expressions)
+    n_rects = sum(len(f.rects or ()) for _, frames in expressions for f in frames)
+    index_end = HEADER.size + len(expressions) * EXPRESSION.size + n_frames * FRAME.size + n_rects * RECT.size
+
+    blobs = []
+    offset = align(index_end, PACK_ALIGN)
+    expr_table, frame_table, rect_table = [], [], []
+    for name, frames in expressions:
+        expr_table.append(EXPRESSION.pack(name.encode("utf-8"), len(frame_table), len(frames)))
+        for frame in frames:
+            frame_offset = offset
+            blobs.append((offset, frame.data))
+            offset = align(offset + len(frame.data), 4)
+            rects = frame.rects
+            first_rect = len(rect_table)
+            if rects:
+                for x0, y0, x1, y1, data in rects:
+                    rect_table.append(RECT.pack(x0, y0, x1, y1, offset, len(data)))
+                    blobs.append((offset, data))
+                    offset = align(offset + len(data), 4)
+            duration_ms = min(0xFFFF, int(round(frame.duration * 1000)))
+            rect_count = 0xFFFF if rects is None else len(rects)
+            frame_table.append(FRAME.pack(frame_offset, len(frame.data), duration_ms, rect_count, first_rect))
+
+    flags = 1 if delta else 0
+    header = HEADER.pack(PACK_MAGIC, PACK_VERSION, size[0], size[1], flags,
+                         len(expressions), n_frames, n_rects)
+    tmp = output + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(b"".join(expr_table))
+        f.write(b"".join(frame_table))
+        f.write(b"".join(rect_table))
+        for blob_offset, data in blobs:
+            f.seek(blob_offset)
+            f.write(data)
+        f.truncate(offset)
+    os.replace(tmp, output)
+    return len(expressions), n_frames, offset
+
+
+class ExpressionPack:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.width, self.height, flags, n_expr, n_frames, n_rects = HEADER.unpack_from(self.map, 0)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            self.close()
+            raise ValueError(f"Not an expression pack (v{PACK_VERSION}): {path}")
+        self.delta = bool(flags & 1)
+
+        self.expressions = {}
+        for i in range(n_expr):
+            raw_name, first_frame, frame_count = EXPRESSION.unpack_from(self.map, HEADER.size + i * EXPRESSION.size)
+            self.expressions[raw_name.rstrip(b"\0").decode("utf-8")] = (first_frame, frame_count)
+        self.frame_table = HEADER.size + n_expr * EXPRESSION.size
+        self.rect_table = self.frame_table + n_frames * FRAME.size
+        self.loaded = {}
+
+    @property
+    def size(self):
+        return (self.width, self.height)
+
+    def names(self):
+        return list(self.expressions)
+
+    def get(self, name):
+        frames = self.loaded.get(name)
+        if frames is not None:
+            return frames
+        first_frame, frame_count = self.expressions[name]
+        view = memoryview(self.map)
+        frames = []
+        for i in range(first_frame, first_frame + frame_count):
+            offset, nbytes, duration_ms, rect_count, first_rect = FRAME.unpack_from(self.map, self.frame_table + i * FRAME.size)
+            rects = None
+            if rect_count != 0xFFFF:
+                rects = []
+                for r in range(first_rect, first_rect + rect_count):
+                    x0, y0, x1, y1, r_offset, r_nbytes = RECT.unpack_from(self.map, self.rect_table + r * RECT.size)
+                    rects.append((x0, y0, x1, y1, view[r_offset:r_offset + r_nbytes]))
+            frames.append(Frame(view[offset:offset + nbytes], duration_ms / 1000, rects))
+        self.loaded[name] = frames
+        return frames
+
+    def preload(self, names):
+        for name in names:
+            self.get(name)
+
+    def stats(self):
+        return {"path": self.path, "expressions": len(self.expressions), "bytes": len(self.map)}
+
+    def close(self):
+        self.loaded.clear()
+        try:
+            self.map.close()
+        except BufferError:
+            pass
+        self.file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile expression GIFs into a memory-mappable pack.")
+    parser.add_argument("--folder", default=os.path.expanduser("~/RobotFriend/screen/"), help="Folder with expression GIFs.")
+    parser.add_argument("--output", default=os.path.expanduser("~/RobotFriend/screen.pack"), help="Pack file to write.")
+    parser.add_argument("--width", type=int, default=DISPLAY_W)
+    parser.add_argument("--height", type=int, default=DISPLAY_H)
+    parser.add_argument("--delta", action=argparse.BooleanOptionalAction, default=True,
+                        help="Store dirty rectangles for delta rendering.")
+    args = parser.parse_args()
+
+    n_expr, n_frames, nbytes = build_pack(args.folder, args.output, (args.width, args.height), args.delta)
+    print(f"Wrote {args.output}: {n_expr} expressions, {n_frames} frames, {nbytes / 1024 / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import time
+import threading
+import tracing
+from collections import deque
+from metrics import percentile
+
+TARGET_FRAME_TIME = 1.0 / 60.0
+LATENCY_WINDOW = 1000
+
+
+class ScreenRenderer:
+    def __init__(self, pusher, frame_source, clock=time.monotonic):
+        self.pusher = pusher
+        self.frame_source = frame_source
+        self.clock = clock
+        self.cond = threading.Condition()
+        self.running = True
+        self.pending = None
+        self.current = None
+        self.frames_shown = 0
+        self.switches = 0
+        self.switch_latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def show(self, name, received_at=None, trace=None):
+        with self.cond:
+            self.pending = (name, self.clock() if received_at is None else received_at, trace)
+            self.cond.notify()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+    def run(self):
+        frames = None
+        index = 0
+        deadline = 0.0
+        requested_at = None
+        trace = None
+        while True:
+            with self.cond:
+                while self.running and self.pending is None:
+                    timeout = None
+                    if frames is not None:
+                        timeout = deadline - self.clock()
+                        if timeout <= 0:
+                            break
+                    self.cond.wait(timeout)
+                if not self.running:
+                    return
+                if self.pending is not None:
+                    self.current, requested_at, trace = self.pending
+                    self.pending = None
+                    frames = None
+
+            if frames is None:
+                frames = self.frame_source.get(self.current)
+                index = 0
+
+            start = self.clock()
+            self.pusher.push(frames, index)
+            self.frames_shown += 1
+            if requested_at is not None:
+                latency = self.clock() - requested_at
+                self.switch_latencies.append(latency)
+                self.switches += 1
+                if trace is not None:
+                    tracing.span(trace, "screen frame", requested_at)
+                    trace = None
+                requested_at = None
+                print(f"Screen -> '{self.current}' in {latency * 1000:.1f} ms")
+
+            deadline = start + max(TARGET_FRAME_TIME, frames[index].duration)
+            index = (index + 1) % len(frames)
+
+    def latency_stats(self):
+        latencies = list(self.switch_latencies)
+        return {
+            "switches": self.switches,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": max(latencies, default=0.0) * 1000,
+        }
@@ -3,175 +3,87 @@ import paho.mqtt.client as mqtt
 import time
 import threading
 import RPi.GPIO as GPIO
+import tracing
+from logutil import setup_logging
+from serial_bridge import (
+    ROUTES,
+    MQTT_TOPIC_FOLLOW,
+    SerialReader,
+    SerialWriter,
+    handle_serial_line,
+    on_message,
+)
+from serial_codec import PROTO_REQUEST
 
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
-MQTT_TOPIC_TOUCH = "/touch"
-MQTT_TOPIC_SERVO = "/servo"
-MQTT_TOPIC_LIGHT = "/light"
-MQTT_TOPIC_RADAR = "/radar"
-MQTT_TOPIC_HAPTIC = "/haptic"
-MQTT_TOPIC_FOLLOW = "/follow"
-MQTT_TOPIC_SLEEP = "/sleep"
-MQTT_TOPIC_LIGHTBASE = "/LightBase"
 
 SERIAL_PORT = "/dev/serial0"
 SERIAL_BAUD = 115200
+STATS_INTERVAL = 60
+SERIAL_PROTOCOL = "auto"
+PROTO_TIMEOUT = 2.0
 
 BOOT_GPIO_PIN = 18
 
+log = setup_logging("serial-MQTT")
+
 
 def on_connect(client, userdata, flags, reasonCode, properties=None):
     try:
         code = int(reasonCode)
     except Exception:
         code = reasonCode
-    print(f"Connected to MQTT broker with result code: {code}")
-    client.subscribe(MQTT_TOPIC_SERVO)
-    print(f"Subscribed to topic: {MQTT_TOPIC_SERVO}")
-    client.subscribe(MQTT_TOPIC_LIGHT)
-    print(f"Subscribed to topic: {MQTT_TOPIC_LIGHT}")
-    client.subscribe(MQTT_TOPIC_HAPTIC)
-    print(f"Subscribed to topic: {MQTT_TOPIC_HAPTIC}")
-    client.subscribe(MQTT_TOPIC_FOLLOW)
-    print(f"Subscribed to topic: {MQTT_TOPIC_FOLLOW}")
-    client.subscribe(MQTT_TOPIC_SLEEP)
-    print(f"Subscribed to topic: {MQTT_TOPIC_SLEEP}")
-    client.subscribe(MQTT_TOPIC_LIGHTBASE)
-    print(f"Subscribed to topic: {MQTT_TOPIC_LIGHTBASE}")
+    log.info("Connected to MQTT broker with result code: %s", code)
+    for topic in ROUTES:
+        client.subscribe(topic)
+        log.info("Subscribed to topic: %s", topic)
 
     if userdata.get("sleeping"):
         try:
             client.unsubscribe(MQTT_TOPIC_FOLLOW)
-            print(f"Sleeping on connect -> unsubscribed from {MQTT_TOPIC_FOLLOW}")
+            log.info("Sleeping on connect -> unsubscribed from %s", MQTT_TOPIC_FOLLOW)
         except Exception as e:
-            print(f"Failed to unsubscribe on connect: {e}")
+            log.warning("Failed to unsubscribe on connect: %s", e)
 
-def on_message(client, userdata, msg):
-    ser = userdata["serial"]
-    lock = userdata["lock"]
-    sleeping = userdata.get("sleeping", False)
-    message = msg.payload.decode("utf-8").strip()
-    print(f"Received MQTT message on {msg.topic}: {message}")
 
-    if msg.topic == MQTT_TOPIC_SERVO:
-        data = f"Servo: {message}\n".encode("utf-8")
-        try:
-            with lock:
-                ser.write(data)
-            print(f"Forwarded to serial: Servo: {message}")
-        except Exception as e:
-            print(f"Failed to write to serial: {e}")
-    elif msg.topic == MQTT_TOPIC_LIGHT:
-        data = f"Light: {message}\n".encode("utf-8")
-        try:
-            with lock:
-                ser.write(data)
-            print(f"Forwarded to serial: Light: {message}")
-        except Exception as e:
-            print(f"Failed to write to serial: {e}")
-    elif msg.topic == MQTT_TOPIC_HAPTIC:
-        data = f"Haptic: {message}\n".encode("utf-8")
-        try:
-            with lock:
-                ser.write(data)
-            print(f"Forwarded to serial: Haptic: {message}")
-        except Exception as e:
-            print(f"Failed to write to serial: {e}")
-    elif msg.topic == MQTT_TOPIC_LIGHTBASE:
-        data = f"LightBase: {message}\n".encode("utf-8")
-        try:
-            with lock:
-                ser.write(data)
-            print(f"Forwarded to serial: LightBase: {message}")
-        except Exception as e:
-            print(f"Failed to write to serial: {e}")
-    elif msg.topic == MQTT_TOPIC_FOLLOW:
-        if userdata.get("sleeping", False):
-            print("Sleeping -> ignoring /follow message")
-            return
-        data = f"{message}\n".encode("utf-8")
-        try:
-            with lock:
-                ser.write(data)
-            print(f"Forwarded to serial: {message}")
-        except Exception as e:
-            print(f"Failed to write to serial: {e}")
-    elif msg.topic == MQTT_TOPIC_SLEEP:
-        data = f"Sleep: {message}\n".encode("utf-8")
-        try:
-            with lock:
-                ser.write(data)
-            print(f"Forwarded to serial: Sleep: {message}")
-        except Exception as e:
-            print(f"Failed to write to serial: {e}")
-
-        cmd = message.strip()
-        if cmd == "1" and not sleeping:
-            userdata["sleeping"] = True
-            try:
-                client.unsubscribe(MQTT_TOPIC_FOLLOW)
-                print(f"Sleep=1 -> unsubscribed from {MQTT_TOPIC_FOLLOW} (paused pan tracking)")
-            except Exception as e:
-                print(f"Failed to unsubscribe {MQTT_TOPIC_FOLLOW}: {e}")
-        elif cmd == "0" and sleeping:
-            userdata["sleeping"] = False
-            try:
-                client.subscribe(MQTT_TOPIC_FOLLOW)
-                print(f"Sleep=0 -> subscribed to {MQTT_TOPIC_FOLLOW} (resumed pan tracking)")
-            except Exception as e:
-                print(f"Failed to subscribe {MQTT_TOPIC_FOLLOW}: {e}")
-
-
-def serial_to_mqtt(ser, client, lock):
-    while True:
-        try:
-            if ser.in_waiting:
-                with lock:
-                    line = ser.readline().decode("utf-8").strip()
-                if line:
-                    print(f"Received from serial: {line}")
-                    if line.startswith("Touch:"):
-                        client.publish(MQTT_TOPIC_TOUCH, line)
-                        print(f"Published to {MQTT_TOPIC_TOUCH}: {line}")
-                    elif line.startswith("Radar:"):
-                        client.publish(MQTT_TOPIC_RADAR, line)
-                        print(f"Published to {MQTT_TOPIC_RADAR}: {line}")
-            time.sleep(0.01)
-        except serial.SerialException as e:
-            print(f"Serial error: {e}")
-            break
-        except Exception as e:
-            print(f"Error in serial loop: {e}")
-            time.sleep(1)
+def serial_to_mqtt(reader):
+    try:
+        reader.run()
+    except serial.SerialException as e:
+        log.error("Serial error: %s", e)
 
 
 def main():
+    tracing.setup("serial-MQTT")
     GPIO.setmode(GPIO.BCM)
     GPIO.setup(BOOT_GPIO_PIN, GPIO.OUT)
     GPIO.output(BOOT_GPIO_PIN, GPIO.LOW)
     
-    print("Waiting 5 seconds before activating boot signal...")
+    log.info("Waiting 5 seconds before activating boot signal...")
     time.sleep(1)
     
     GPIO.output(BOOT_GPIO_PIN, GPIO.HIGH)
-    print(f"GPIO{BOOT_GPIO_PIN} set HIGH (boot signal active)")
+    log.info("GPIO%d set HIGH (boot signal active)", BOOT_GPIO_PIN)
 
     try:
         ser = serial.Serial(SERIAL_PORT, SERIAL_BAUD, timeout=1)
-        print(f"Connected to {SERIAL_PORT} at {SERIAL_BAUD} baud")
+        log.info("Connected to %s at %d baud", SERIAL_PORT, SERIAL_BAUD)
     except serial.SerialException as e:
-        print(f"Failed to open serial port: {e}")
+        log.error("Failed to open serial port: %s", e)
         GPIO.output(BOOT_GPIO_PIN, GPIO.LOW)
         GPIO.cleanup()
         return
 
-    lock = threading.Lock()
+    writer = SerialWriter(ser)
+    writer_thread = threading.Thread(target=writer.run, daemon=True)
+    writer_thread.start()
 
+    userdata = {"writer": writer, "sleeping": False, "proto_ack": threading.Event()}
     client = mqtt.Client(
         protocol=mqtt.MQTTv5,
         callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
-        userdata={"serial": ser, "lock": lock, "sleeping": False},
+        userdata=userdata,
     )
     client.on_connect = on_connect
     client.on_message = on_message
@@ -180,27 +92,42 @@ def main():
         client.connect(MQTT_BROKER, MQTT_PORT)
         client.loop_start()
     except Exception as e:
-        print(f"Failed to connect to MQTT broker: {e}")
+        log.error("Failed to connect to MQTT broker: %s", e)
+        writer.stop()
         ser.close()
         GPIO.output(BOOT_GPIO_PIN, GPIO.LOW)
         GPIO.cleanup()
         return
 
-    thread = threading.Thread(target=serial_to_mqtt, args=(ser, client, lock), daemon=True)
+    reader = SerialReader(ser, lambda line: handle_serial_line(client, userdata, line))
+    thread = threading.Thread(target=serial_to_mqtt, args=(reader,), daemon=True)
     thread.start()
 
+    if SERIAL_PROTOCOL == "auto":
+        writer.submit(PROTO_REQUEST)
+        if not userdata["proto_ack"].wait(PROTO_TIMEOUT):
+            log.info("ESP32 did not answer '%s' -> using text protocol", PROTO_REQUEST)
+
     try:
+        last_stats = time.monotonic()
         while True:
             time.sleep(1)
+            if time.monotonic() - last_stats >= STATS_INTERVAL:
+                last_stats = time.monotonic()
+                log.info("Serial writer stats: %s", writer.stats())
     except KeyboardInterrupt:
-        print("\nExiting...")
+        log.info("Exiting...")
     finally:
+        reader.stop()
+        writer.stop()
+        thread.join(timeout=1)
+        writer_thread.join(timeout=1)
         ser.close()
         client.loop_stop()
         client.disconnect()
         GPIO.output(BOOT_GPIO_PIN, GPIO.LOW)
         GPIO.cleanup()
-        print(f"GPIO{BOOT_GPIO_PIN} set LOW (boot signal inactive)")
+        log.info("GPIO%d set LOW (boot signal inactive)", BOOT_GPIO_PIN)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+import io
+import sys
+import time
+import random
+import argparse
+import threading
+import subprocess
+import contextlib
+import collections
+import serial
+import serial_bridge
+from serial_bridge import SerialReader, SerialWriter, publish_serial_line, send_command
+from serial_codec import (
+    T_RADAR,
+    StreamDecoder,
+    encode_binary,
+    encode_frame,
+    encode_text,
+    encode_touch,
+)
+from fake_devices import FakeESP32, FakeClient, FakeMessage, FakeSerial
+from metrics import summarize_ms
+from logutil import setup_logging
+
+SERIAL_BAUD = 115200
+
+SENSOR_LINES = [
+    "Touch: L_BODY=0, R_BODY=0, F_BODY=0, B_BODY=0, L_HEAD=1, R_HEAD=0",
+    "Radar: 1",
+    "Touch: L_BODY=0, R_BODY=0, F_BODY=0, B_BODY=0, L_HEAD=0, R_HEAD=0",
+    "Radar: 0",
+]
+
+
+def poll_serial_to_mqtt(ser, client, lock, stop):
+    while not stop.is_set():
+        if ser.in_waiting:
+            with lock:
+                line = ser.readline().decode("utf-8").strip()
+            if line:
+                publish_serial_line(client, line)
+        time.sleep(0.01)
+
+
+def wait_for(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def run_read_latency(mode, args):
+    fake = FakeESP32()
+    ser = serial.Serial(fake.port, SERIAL_BAUD, timeout=1)
+    client = FakeClient()
+    stop = threading.Event()
+    reader = None
+    if mode == "poll":
+        thread = threading.Thread(target=poll_serial_to_mqtt, args=(ser, client, threading.Lock(), stop), daemon=True)
+    else:
+        reader = SerialReader(ser, lambda line: publish_serial_line(client, line))
+        thread = threading.Thread(target=reader.run, daemon=True)
+
+    rng = random.Random(args.seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        thread.start()
+        for i in range(args.count):
+            fake.send_line(SENSOR_LINES[i % len(SENSOR_LINES)])
+            time.sleep(rng.uniform(args.min_gap_ms, args.max_gap_ms) / 1000)
+        wait_for(lambda: len(client.published) >= args.count, 2.0)
+        stop.set()
+        if reader:
+            reader.stop()
+        thread.join(timeout=2)
+
+    latencies = [pub[0] - sent[0] for sent, pub in zip(fake.sent, client.published)]
+    ser.close()
+    fake.close()
+    print(f"  {mode:<9} {summarize_ms(latencies)}")
+
+
+def bench_read_latency(args):
+    print(f"Serial line -> MQTT publish latency over a pty ({args.count} lines)")
+    for mode in ("poll", "selector"):
+        run_read_latency(mode, args)
+
+
+def burst_commands(count, seed):
+    rng = random.Random(seed)
+    commands = []
+    for i in range(count):
+        if i % 100 == 50:
+            commands.append(f"Servo: wave {i}")
+        elif i % 40 == 20:
+            commands.append(f"Light: Hex({rng.randrange(0xFFFFFF):06X}) Brightness(100) Fade(0)")
+        else:
+            commands.append(f"Body: {rng.uniform(55, 125):.1f}")
+    return commands
+
+
+def run_writer(mode, commands, args):
+    fake = FakeESP32(baudrate=args.device_baud)
+    ser = serial.Serial(fake.port, SERIAL_BAUD, timeout=1, write_timeout=5)
+    writer = None
+    if mode == "direct":
+        lock = threading.Lock()
+
+        def send(command):
+            with lock:
+                ser.write(f"{command}\n".encode("utf-8"))
+    else:
+        writer = SerialWriter(ser)
+        writer_thread = threading.Thread(target=writer.run, daemon=True)
+        writer_thread.start()
+        send = writer.submit
+
+    gap = 1.0 / args.rate
+    callback_times = []
+    t_start = time.monotonic()
+    for i, command in enumerate(commands):
+        t0 = time.monotonic()
+        send(command)
+        callback_times.append(time.monotonic() - t0)
+        delay = t_start + (i + 1) * gap - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    offered = time.monotonic() - t_start
+
+    if writer:
+        wait_for(lambda: not writer.queue, 30.0)
+        writer.stop()
+        writer_thread.join(timeout=2)
+    expected_bytes = writer.bytes_written if writer else sum(len(c) + 1 for c in commands)
+    wait_for(lambda: fake.bytes_received >= expected_bytes, 30.0)
+    drained = time.monotonic() - t_start
+
+    lines = [line.decode("utf-8") for _, line in fake.received]
+    waves_sent = [c for c in commands if c.startswith("Servo:")]
+    waves_seen = [line for line in lines if line.startswith("Servo:")]
+    ser.close()
+    fake.close()
+
+    print(f"  {mode}:")
+    print(f"    callback   {summarize_ms(callback_times)}")
+    print(f"    offered {len(commands) / offered:8.0f} msg/s, drained in {drained:.2f} s, "
+          f"lines delivered={len(lines)} bytes={fake.bytes_received} ({fake.bytes_received / drained:.0f} B/s)")
+    print(f"    one-shot commands in order: {waves_seen == waves_sent} ({len(waves_seen)}/{len(waves_sent)})")
+    if writer:
+        print(f"    writer stats: {writer.stats()}")
+
+
+def run_overflow(args):
+    fake = FakeESP32(baudrate=args.overflow_baud)
+    ser = serial.Serial(fake.port, SERIAL_BAUD, timeout=1, write_timeout=5)
+    writer = SerialWriter(ser, max_queue=args.overflow_queue)
+    writer_thread = threading.Thread(target=writer.run, daemon=True)
+    writer_thread.start()
+    commands = []
+    for i in range(args.overflow_count):
+        commands.append(f"Servo: wave {i}" if i % 2 else f"Haptic: {i % 4 // 2}")
+        commands.append(f"Body: {60 + i % 60:.1f}")
+    t0 = time.monotonic()
+    with contextlib.redirect_stderr(io.StringIO()):
+        for command in commands:
+            writer.submit(command)
+        wait_for(lambda: not writer.queue, 30.0)
+    writer.stop()
+    writer_thread.join(timeout=2)
+    wait_for(lambda: fake.bytes_received >= writer.bytes_written, 30.0)
+    elapsed = time.monotonic() - t0
+    lines = [line.decode("utf-8") for _, line in fake.received]
+    ser.close()
+    fake.close()
+
+    one_shots = [c for c in commands if not c.startswith("Body:")]
+    seen = [line for line in lines if not line.startswith("Body:")]
+    bodies = [line for line in lines if line.startswith("Body:")]
+    stats = writer.stats()
+    print(f"  overflow: {len(commands)} commands at once into a {args.overflow_queue}-entry queue, "
+          f"fake ESP32 at {args.overflow_baud} baud, drained in {elapsed:.2f} s")
+    print(f"    one-shot commands in order: {seen == one_shots} ({len(seen)}/{len(one_shots)}), "
+          f"last pan target {bodies[-1] if bodies else None!r} (sent {commands[-1]!r})")
+    print(f"    writer stats: {stats}")
+    return seen == one_shots and bodies[-1:] == commands[-1:]
+
+
+def bench_writer(args):
+    commands = burst_commands(args.count, args.seed)
+    print(f"Serial writer burst: {args.count} commands at {args.rate} msg/s, "
+          f"fake ESP32 draining at {args.device_baud or 'unlimited'} baud")
+    for mode in ("direct", "queue"):
+        run_writer(mode, commands, args)
+    if not run_overflow(args):
+        print("FAIL: a full queue lost or reordered one-shot commands, or the last pan target")
+        sys.exit(1)
+    print("PASS: a full queue drops superseded pan targets and holds back one-shot commands")
+
+
+def reaction_bursts(count, seed):
+    rng = random.Random(seed)
+    bursts = []
+    for i in range(count):
+        if i % 2:
+            bursts.append([f"Body: {rng.uniform(55, 125):.1f}"])
+        else:
+            bursts.append([
+                "Haptic: 1",
+                rng.choice(["Servo: ear1", "Servo: ear2", "Servo: wave"]),
+                f"Light: Hex({rng.randrange(0xFFFFFF):06X}) Brightness(100) Fade(0)",
+            ])
+    return bursts
+
+
+def run_batch(mode, bursts, args):
+    fake = FakeESP32()
+    ser = serial.Serial(fake.port, SERIAL_BAUD, timeout=1, write_timeout=5)
+    latencies = []
+    writer = None
+    if mode == "direct":
+        writes = [0]
+
+        def send(command):
+            t0 = time.monotonic()
+            ser.write(f"{command}\n".encode("utf-8"))
+            writes[0] += 1
+            latencies.append(time.monotonic() - t0)
+    else:
+        window = args.window_ms / 1000 if mode == "batched" else 0.0
+        writer = SerialWriter(ser, batch_window=window, max_delay=args.max_delay_ms / 1000)
+        writer.latencies = collections.deque()
+        writer_thread = threading.Thread(target=writer.run, daemon=True)
+        writer_thread.start()
+        send = writer.submit
+
+    commands = [command for burst in bursts for command in burst]
+    t_start = time.monotonic()
+    for burst in bursts:
+        for command in burst:
+            send(command)
+            time.sleep(args.intra_gap_ms / 1000)
+        time.sleep(args.burst_gap_ms / 1000)
+    expected_bytes = sum(len(c) + 1 for c in commands)
+    wait_for(lambda: fake.bytes_received >= expected_bytes, 10.0)
+    elapsed = time.monotonic() - t_start
+
+    if writer:
+        writer.stop()
+        writer_thread.join(timeout=2)
+        latencies = list(writer.latencies)
+        syscalls = writer.writes
+    else:
+        syscalls = writes[0]
+    lines = [line.decode("utf-8") for _, line in fake.received]
+    ser.close()
+    fake.close()
+
+    print(f"  {mode}:")
+    print(f"    {syscalls} writes for {len(commands)} commands over {elapsed:.2f} s -> "
+          f"{syscalls / elapsed:.0f} syscalls/s ({len(commands) / syscalls:.2f} commands/write)")
+    print(f"    latency  {summarize_ms(latencies)}")
+    if writer:
+        print(f"    writer stats: {writer.stats()}")
+    return lines == commands, max(latencies, default=0.0)
+
+
+def bench_batch(args):
+    bursts = reaction_bursts(args.count, args.seed)
+    print(f"Batched serial writes: {args.count} events (touch reactions and single pan updates), "
+          f"window {args.window_ms} ms, cap {args.max_delay_ms} ms")
+    ok = True
+    for mode in ("direct", "queue", "batched"):
+        in_order, worst = run_batch(mode, bursts, args)
+        if not in_order:
+            print(f"    FAIL: {mode} delivered commands out of order or incomplete")
+            ok = False
+        if mode == "batched":
+            print(f"    worst enqueue -> write {worst * 1000:.2f} ms (cap {args.max_delay_ms} ms + write time)")
+    print("PASS" if ok else "FAIL")
+    if not ok:
+        sys.exit(1)
+
+
+def legacy_on_message(client, userdata, msg):
+    ser = userdata["serial"]
+    lock = userdata["lock"]
+    message = msg.payload.decode("utf-8").strip()
+    print(f"Received MQTT message on {msg.topic}: {message}")
+
+    if msg.topic == "/servo":
+        data = f"Servo: {message}\n".encode("utf-8")
+        try:
+            with lock:
+                ser.write(data)
+            print(f"Forwarded to serial: Servo: {message}")
+        except Exception as e:
+            print(f"Failed to write to serial: {e}")
+    elif msg.topic == "/light":
+        data = f"Light: {message}\n".encode("utf-8")
+        try:
+            with lock:
+                ser.write(data)
+            print(f"Forwarded to serial: Light: {message}")
+        except Exception as e:
+            print(f"Failed to write to serial: {e}")
+    elif msg.topic == "/haptic":
+        data = f"Haptic: {message}\n".encode("utf-8")
+        try:
+            with lock:
+                ser.write(data)
+            print(f"Forwarded to serial: Haptic: {message}")
+        except Exception as e:
+            print(f"Failed to write to serial: {e}")
+    elif msg.topic == "/LightBase":
+        data = f"LightBase: {message}\n".encode("utf-8")
+        try:
+            with lock:
+                ser.write(data)
+            print(f"Forwarded to serial: LightBase: {message}")
+        except Exception as e:
+            print(f"Failed to write to serial: {e}")
+    elif msg.topic == "/follow":
+        if userdata.get("sleeping", False):
+            print("Sleeping -> ignoring /follow message")
+            return
+        data = f"{message}\n".encode("utf-8")
+        try:
+            with lock:
+                ser.write(data)
+            print(f"Forwarded to serial: {message}")
+        except Exception as e:
+            print(f"Failed to write to serial: {e}")
+
+
+def routing_messages(count, seed):
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        if i % 50 == 0:
+            messages.append(FakeMessage("/servo", "wave"))
+        elif i % 25 == 0:
+            messages.append(FakeMessage("/light", "Hex(E0822D) Brightness(100) Fade(0)"))
+        else:
+            messages.append(FakeMessage("/follow", f"Body: {rng.uniform(55, 125):.1f}"))
+    return messages
+
+
+class DirectWriter:
+    def __init__(self, ser):
+        self.ser = ser
+        self.lock = threading.Lock()
+
+    def put(self, channel, data, trace=None):
+        with self.lock:
+            self.ser.write(data)
+
+
+def time_routing(messages, handler, client, userdata):
+    t0 = time.perf_counter()
+    for msg in messages:
+        handler(client, userdata, msg)
+    return time.perf_counter() - t0
+
+
+def bench_routing(args):
+    messages = routing_messages(args.count, args.seed)
+    client = FakeClient()
+    print(f"on_message throughput ({args.count} messages, mostly /follow, best of {args.repeats}; "
+          f"stdout and the log go to a pipe drained by cat)")
+
+    cat = subprocess.Popen(["cat"], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    pipe = open(cat.stdin.fileno(), "w", closefd=False)
+    with contextlib.redirect_stdout(pipe):
+        setup_logging("serial-MQTT")
+    ser = FakeSerial()
+    sink = DirectWriter(ser)
+    writer = SerialWriter(FakeSerial())
+    writer_thread = threading.Thread(target=writer.run, daemon=True)
+    writer_thread.start()
+    runs = {
+        "if/elif + print": (legacy_on_message, {"serial": ser, "lock": sink.lock, "sleeping": False}),
+        "routing table": (serial_bridge.on_message, {"writer": sink, "sleeping": False}),
+        "  + SerialWriter": (serial_bridge.on_message, {"writer": writer, "sleeping": False}),
+    }
+    times = {label: [] for label in runs}
+    with contextlib.redirect_stdout(pipe):
+        for _ in range(args.repeats):
+            for label, (handler, userdata) in runs.items():
+                times[label].append(time_routing(messages, handler, client, userdata))
+        pipe.flush()
+    writer.stop()
+    writer_thread.join(timeout=2)
+    pipe.close()
+    cat.stdin.close()
+    cat.wait()
+
+    best = {label: min(values) for label, values in times.items()}
+    for label, elapsed in best.items():
+        print(f"  {label:<17} {args.count / elapsed:10.0f} msg/s {elapsed / args.count * 1e6:7.2f} us/msg")
+    print(f"  same direct-write sink for the first two; {ser.writes} writes, {ser.bytes_written} bytes")
+    print(f"  writer stats: {writer.stats()}")
+    gain = best["if/elif + print"] / best["routing table"]
+    if gain <= 1.0:
+        print(f"FAIL: the routing table is not faster than if/elif + print ({gain:.2f}x)")
+        sys.exit(1)
+    print(f"PASS: the routing table is {gain:.2f}x faster than if/elif + print")
+
+
+def codec_commands(count, seed):
+    rng = random.Random(seed)
+    commands = []
+    for i in range(count):
+        if i % 10 == 0:
+            commands.append(("Servo", b"Servo: ", b"wave"))
+        elif i % 10 == 5:
+            commands.append(("Haptic", b"Haptic: ", b"1"))
+        else:
+            commands.append(("Body", b"Body: ", f"{rng.uniform(55, 125):.1f}".encode()))
+    return commands
+
+
+def sensor_events(count, seed):
+    rng = random.Random(seed)
+    events = []
+    for i in range(count):
+        if i % 3 == 0:
+            events.append(("radar", rng.randrange(2)))
+        else:
+            events.append(("touch", {key: rng.randrange(2) for key in
+                                     ("L_BODY", "R_BODY", "F_BODY", "B_BODY", "L_HEAD", "R_HEAD")}))
+    return events
+
+
+def event_text(event):
+    kind, value = event
+    if kind == "radar":
+        return f"Radar: {value}"
+    return "Touch: " + ", ".join(f"{k}={v}" for k, v in value.items())
+
+
+def event_frame(event):
+    kind, value = event
+    if kind == "radar":
+        return encode_frame(T_RADAR, bytes((value,)))
+    return encode_touch(value)
+
+
+def bench_codec(args):
+    commands = codec_commands(args.count, args.seed)
+    events = sensor_events(args.count, args.seed)
+    print(f"Serial codec benchmark ({args.count} commands / sensor events, wire time at {SERIAL_BAUD} baud)")
+
+    for label, encode in (("text", encode_text), ("binary", encode_binary)):
+        t0 = time.perf_counter()
+        encoded = [encode(channel, prefix, payload) for channel, prefix, payload in commands]
+        elapsed = time.perf_counter() - t0
+        nbytes = sum(len(e) for e in encoded)
+        print(f"  encode {label:<7} {elapsed / args.count * 1e6:6.2f} us/cmd {nbytes / args.count:6.1f} B/cmd "
+              f"wire {nbytes * 10 / SERIAL_BAUD / args.count * 1000:6.3f} ms/cmd")
+
+    for label, stream in (("text", b"".join(event_text(e).encode() + b"\n" for e in events)),
+                          ("binary", b"".join(event_frame(e) for e in events))):
+        decoder = StreamDecoder()
+        t0 = time.perf_counter()
+        lines = []
+        for i in range(0, len(stream), 32):
+            lines.extend(decoder.feed(stream[i:i + 32]))
+        elapsed = time.perf_counter() - t0
+        print(f"  decode {label:<7} {elapsed / args.count * 1e6:6.2f} us/event {len(stream) / args.count:6.1f} B/event "
+              f"lines={len(lines)} crc_errors={decoder.crc_errors}")
+
+
+def bench_loopback(args):
+    fake = FakeESP32()
+    ser = serial.Serial(fake.port, SERIAL_BAUD, timeout=1)
+    client = FakeClient()
+    reader = SerialReader(ser, lambda line: publish_serial_line(client, line))
+    reader_thread = threading.Thread(target=reader.run, daemon=True)
+    writer = SerialWriter(ser, coalesce=())
+    writer_thread = threading.Thread(target=writer.run, daemon=True)
+    userdata = {"writer": writer, "encode": encode_binary}
+
+    events = sensor_events(args.count, args.seed)
+    commands = codec_commands(args.count, args.seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        reader_thread.start()
+        writer_thread.start()
+        for i, event in enumerate(events):
+            fake.send_bytes(event_frame(event))
+            if i % 7 == 0:
+                fake.send_line(f"Executing pose: log line {i}")
+        for channel, prefix, payload in commands:
+            send_command(userdata, channel, prefix, payload)
+        wait_for(lambda: len(client.published) >= len(events), 5.0)
+        wait_for(lambda: not writer.queue, 5.0)
+        time.sleep(0.2)
+        reader.stop()
+        writer.stop()
+        reader_thread.join(timeout=2)
+        writer_thread.join(timeout=2)
+
+    published = [payload for _, _, payload in client.published]
+    expected_up = [event_text(e) for e in events]
+    received = StreamDecoder().feed(bytes(fake.raw))
+    expected_down = [f"{channel}: {float(payload):.1f}" if channel == "Body" else (prefix + payload).decode()
+                     for channel, prefix, payload in commands]
+    ser.close()
+    fake.close()
+
+    ok_up = published == expected_up
+    ok_down = received == expected_down
+    print(f"ESP32 -> Pi: {len(published)}/{len(expected_up)} frames decoded and published, match={ok_up}")
+    print(f"Pi -> ESP32: {len(received)}/{len(expected_down)} commands decoded, match={ok_down}, "
+          f"{fake.bytes_received} bytes")
+    print(f"  writer stats: {writer.stats()}")
+    if not (ok_up and ok_down):
+        print("FAIL")
+        sys.exit(1)
+    print("PASS")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serial-MQTT bridge benchmarks against a pty-backed fake ESP32.")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("read-latency", help="Serial-line-to-publish latency, 10 ms polling versus selector reader.")
+    p.add_argument("--count", type=int, default=500, help="Number of sensor lines to send.")
+    p.add_argument("--min-gap-ms", type=float, default=1.0)
+    p.add_argument("--max-gap-ms", type=float, default=20.0)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_read_latency)
+
+    p = sub.add_parser("writer", help="Follow-rate command burst through direct writes versus the coalescing writer.")
+    p.add_argument("--count", type=int, default=3000, help="Number of commands in the burst.")
+    p.add_argument("--rate", type=float, default=1000.0, help="Commands per second offered by the MQTT side.")
+    p.add_argument("--device-baud", type=int, default=SERIAL_BAUD, help="Simulated UART drain rate of the fake ESP32.")
+    p.add_argument("--overflow-count", type=int, default=100, help="One-shot commands in the overflow burst.")
+    p.add_argument("--overflow-queue", type=int, default=8, help="Writer queue size for the overflow burst.")
+    p.add_argument("--overflow-baud", type=int, default=9600, help="Fake ESP32 drain rate for the overflow burst.")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_writer)
+
+    p = sub.add_parser("batch", help="Touch-reaction bursts: syscalls/sec and added latency with and without write batching.")
+    p.add_argument("--count", type=int, default=400, help="Number of events (reaction bursts and single commands).")
+    p.add_argument("--window-ms", type=float, default=serial_bridge.WRITE_BATCH_WINDOW * 1000)
+    p.add_argument("--max-delay-ms", type=float, default=serial_bridge.WRITE_BATCH_MAX_DELAY * 1000)
+    p.add_argument("--intra-gap-ms", type=float, default=0.2, help="Gap between commands inside a reaction.")
+    p.add_argument("--burst-gap-ms", type=float, default=10.0, help="Gap between events.")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_batch)
+
+    p = sub.add_parser("routing", help="Messages/sec through on_message: if/elif chain versus routing table.")
+    p.add_argument("--count", type=int, default=100000)
+    p.add_argument("--repeats", type=int, default=5, help="Interleaved runs per path; the best is reported.")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_routing)
+
+    p = sub.add_parser("codec", help="Text versus binary framing: encode/decode cost and bytes on the wire.")
+    p.add_argument("--count", type=int, default=20000)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_codec)
+
+    p = sub.add_parser("loopback", help="Binary frames both ways over a pty fake ESP32, checked for equality.")
+    p.add_argument("--count", type=int, default=500)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_loopback)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+import os
+import time
+import logging
+import selectors
+import threading
+from collections import deque
+import tracing
+from metrics import percentile
+from serial_codec import PROTO_ACK, StreamDecoder, encode_binary, encode_text
+
+MQTT_TOPIC_TOUCH = "/touch"
+MQTT_TOPIC_SERVO = "/servo"
+MQTT_TOPIC_LIGHT = "/light"
+MQTT_TOPIC_RADAR = "/radar"
+MQTT_TOPIC_HAPTIC = "/haptic"
+MQTT_TOPIC_FOLLOW = "/follow"
+MQTT_TOPIC_SLEEP = "/sleep"
+MQTT_TOPIC_LIGHTBASE = "/LightBase"
+
+WRITE_QUEUE_MAX = 64
+WRITE_BLOCK_TIMEOUT = 1.0
+COALESCE_CHANNELS = ("Body", "Head", "Light", "LightBase")
+WRITE_BATCH_WINDOW = 0.002
+WRITE_BATCH_MAX_DELAY = 0.005
+LATENCY_WINDOW = 1000
+FOLLOW_CHANNELS = {name.encode(): (name, name.encode() + b": ") for name in ("Body", "Head")}
+
+
+def command_channel(command):
+    head, sep, _ = command.partition(":")
+    return head if sep else None
+
+
+log = logging.getLogger("serial-MQTT")
+
+
+def publish_sensor(client, topic, line):
+    if not tracing.enabled:
+        client.publish(topic, line)
+        return
+    ctx = tracing.start()
+    client.publish(topic, line, properties=tracing.outgoing(ctx))
+    tracing.span(ctx, "serial publish", ctx.received)
+
+
+def publish_serial_line(client, line):
+    log.debug("Received from serial: %s", line)
+    if line.startswith("Touch:"):
+        publish_sensor(client, MQTT_TOPIC_TOUCH, line)
+        log.info("Published to %s: %s", MQTT_TOPIC_TOUCH, line)
+    elif line.startswith("Radar:"):
+        publish_sensor(client, MQTT_TOPIC_RADAR, line)
+        log.info("Published to %s: %s", MQTT_TOPIC_RADAR, line)
+
+
+class Route:
+    __slots__ = ("prefix", "channel", "handler")
+
+    def __init__(self, prefix, channel, handler):
+        self.prefix = prefix
+        self.channel = channel
+        self.handler = handler
+
+
+def handle_serial_line(client, userdata, line):
+    if line == PROTO_ACK:
+        userdata["encode"] = encode_binary
+        log.info("ESP32 acknowledged binary framing -> switching serial commands to binary")
+        ack = userdata.get("proto_ack")
+        if ack is not None:
+            ack.set()
+        return
+    publish_serial_line(client, line)
+
+
+def send_command(userdata, channel, prefix, payload):
+    encode = userdata.get("encode", encode_text)
+    userdata["writer"].put(channel, encode(channel, prefix, payload), tracing.current() if tracing.enabled else None)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Queued for serial: %s", (prefix + payload).decode("utf-8", errors="replace"))
+
+
+def forward_payload(client, userdata, route, payload):
+    send_command(userdata, route.channel, route.prefix, payload)
+
+
+def forward_follow(client, userdata, route, payload):
+    if userdata.get("sleeping", False):
+        log.debug("Sleeping -> ignoring /follow message")
+        return
+    name, sep, value = payload.partition(b":")
+    if not sep:
+        send_command(userdata, None, b"", payload)
+        return
+    channel = FOLLOW_CHANNELS.get(name)
+    if channel is None:
+        channel = (name.decode("utf-8", errors="ignore"), name + b": ")
+    send_command(userdata, channel[0], channel[1], value.strip())
+
+
+def forward_sleep(client, userdata, route, payload):
+    forward_payload(client, userdata, route, payload)
+
+    sleeping = userdata.get("sleeping", False)
+    cmd = payload.decode("utf-8", errors="ignore")
+    if cmd == "1" and not sleeping:
+        userdata["sleeping"] = True
+        try:
+            client.unsubscribe(MQTT_TOPIC_FOLLOW)
+            log.info("Sleep=1 -> unsubscribed from %s (paused pan tracking)", MQTT_TOPIC_FOLLOW)
+        except Exception as e:
+            log.warning("Failed to unsubscribe %s: %s", MQTT_TOPIC_FOLLOW, e)
+    elif cmd == "0" and sleeping:
+        userdata["sleeping"] = False
+        try:
+            client.subscribe(MQTT_TOPIC_FOLLOW)
+            log.info("Sleep=0 -> subscribed to %s (resumed pan tracking)", MQTT_TOPIC_FOLLOW)
+        except Exception as e:
+            log.warning("Failed to subscribe %s: %s", MQTT_TOPIC_FOLLOW, e)
+
+
+ROUTES = {
+    MQTT_TOPIC_SERVO: Route(b"Servo: ", "Servo", forward_payload),
+    MQTT_TOPIC_LIGHT: Route(b"Light: ", "Light", forward_payload),
+    MQTT_TOPIC_HAPTIC: Route(b"Haptic: ", "Haptic", forward_payload),
+    MQTT_TOPIC_LIGHTBASE: Route(b"LightBase: ", "LightBase", forward_payload),
+    MQTT_TOPIC_FOLLOW: Route(b"", None, forward_follow),
+    MQTT_TOPIC_SLEEP: Route(b"Sleep: ", "Sleep", forward_sleep),
+}
+
+
+def on_message(client, userdata, msg):
+    route = ROUTES.get(msg.topic)
+    if route is None:
+        return
+    payload = msg.payload.strip()
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Received MQTT message on %s: %s", msg.topic, payload.decode("utf-8", errors="replace"))
+    ctx = tracing.received(msg) if tracing.enabled else None
+    route.handler(client, userdata, route, payload)
+    if ctx is not None:
+        tracing.finish(ctx, "serial route")
+
+
+class SerialReader:
+    def __init__(self, ser, on_line):
+        self.ser = ser
+        self.on_line = on_line
+        self.decoder = StreamDecoder()
+        self.selector = selectors.DefaultSelector()
+        self.wake_r, self.wake_w = os.pipe()
+        self.running = True
+
+    def stop(self):
+        self.running = False
+        try:
+            os.write(self.wake_w, b"\0")
+        except OSError:
+            pass
+
+    def feed(self, data):
+        for line in self.decoder.feed(data):
+            try:
+                self.on_line(line)
+            except Exception as e:
+                log.warning("Error handling serial line '%s': %s", line, e)
+
+    def run(self):
+        ser_fd = self.ser.fileno()
+        self.selector.register(ser_fd, selectors.EVENT_READ)
+        self.selector.register(self.wake_r, selectors.EVENT_READ)
+        try:
+            while self.running:
+                for key, _ in self.selector.select():
+                    if key.fd == self.wake_r:
+                        os.read(self.wake_r, 64)
+                        continue
+                    data = self.ser.read(self.ser.in_waiting or 1)
+                    if data:
+                        self.feed(data)
+        finally:
+            self.selector.close()
+            os.close(self.wake_r)
+            os.close(self.wake_w)
+
+
+class SerialWriter:
+    def __init__(self, ser, max_queue=WRITE_QUEUE_MAX, coalesce=COALESCE_CHANNELS,
+                 batch_window=WRITE_BATCH_WINDOW, max_delay=WRITE_BATCH_MAX_DELAY, block_timeout=WRITE_BLOCK_TIMEOUT):
+        self.ser = ser
+        self.max_queue = max_queue
+        self.coalesce = frozenset(coalesce)
+        self.batch_window = batch_window
+        self.max_delay = max(max_delay, batch_window)
+        self.block_timeout = block_timeout
+        self.last_put = 0.0
+        lock = threading.Lock()
+        self.cond = threading.Condition(lock)
+        self.space = threading.Condition(lock)
+        self.queue = deque()
+        self.pending = {}
+        self.running = True
+        self.submitted = 0
+        self.coalesced = 0
+        self.overflow_drops = 0
+        self.blocked = 0
+        self.blocked_time = 0.0
+        self.writes = 0
+        self.commands_written = 0
+        self.max_batch = 0
+        self.bytes_written = 0
+        self.write_errors = 0
+        self.max_depth = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def submit(self, command):
+        self.put(command_channel(command), f"{command}\n".encode("utf-8"))
+
+    def put(self, channel, data, trace=None):
+        with self.cond:
+            self.submitted += 1
+            if self.coalesce_into(channel, data, trace):
+                return
+            if len(self.queue) >= self.max_queue:
+                if not self.make_room():
+                    self.overflow_drops += 1
+                    log.warning("Serial queue stayed full of one-shot commands for %.1f s; dropped %r",
+                                self.block_timeout, data)
+                    return
+                if self.coalesce_into(channel, data, trace):
+                    return
+            entry = [channel, data, time.monotonic(), trace]
+            self.last_put = entry[2]
+            self.queue.append(entry)
+            if channel in self.coalesce:
+                self.pending[channel] = entry
+            self.max_depth = max(self.max_depth, len(self.queue))
+            self.cond.notify()
+
+    def coalesce_into(self, channel, data, trace):
+        if channel not in self.coalesce:
+            return False
+        entry = self.pending.get(channel)
+        if entry is None:
+            return False
+        entry[1] = data
+        entry[3] = trace
+        self.coalesced += 1
+        return True
+
+    def make_room(self):
+        for index, old in enumerate(self.queue):
+            if old[0] in self.coalesce:
+                del self.queue[index]
+                del self.pending[old[0]]
+                self.overflow_drops += 1
+                return True
+        self.blocked += 1
+        start = time.monotonic()
+        deadline = start + self.block_timeout
+        while self.running and len(self.queue) >= self.max_queue:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            self.space.wait(timeout)
+        self.blocked_time += time.monotonic() - start
+        return self.running and len(self.queue) < self.max_queue
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+            self.space.notify_all()
+
+    def gather(self):
+        while self.running and len(self.queue) < self.max_queue:
+            deadline = min(self.last_put + self.batch_window, self.queue[0][2] + self.max_delay)
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                return
+            self.cond.wait(timeout)
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.queue:
+                    self.cond.wait()
+                if not self.queue:
+                    return
+                if self.batch_window > 0:
+                    self.gather()
+                batch = list(self.queue)
+                self.queue.clear()
+                self.pending.clear()
+                self.space.notify_all()
+            data = batch[0][1] if len(batch) == 1 else b"".join(entry[1] for entry in batch)
+            try:
+                self.ser.write(data)
+                now = time.monotonic()
+                self.writes += 1
+                self.commands_written += len(batch)
+                self.max_batch = max(self.max_batch, len(batch))
+                self.bytes_written += len(data)
+                self.latencies.extend(now - entry[2] for entry in batch)
+                if tracing.enabled:
+                    for entry in batch:
+                        if entry[3] is not None:
+                            tracing.span(entry[3], "serial write", entry[2], now)
+            except Exception as e:
+                self.write_errors += 1
+                log.warning("Failed to write %d command(s) to serial: %s", len(batch), e)
+
+    def stats(self):
+        with self.cond:
+            depth = len(self.queue)
+        latencies = list(self.latencies)
+        return {
+            "queue_depth": depth,
+            "max_depth": self.max_depth,
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "overflow_drops": self.overflow_drops,
+            "blocked": self.blocked,
+            "blocked_ms": round(self.blocked_time * 1000, 1),
+            "writes": self.writes,
+            "commands_written": self.commands_written,
+            "max_batch": self.max_batch,
+            "bytes": self.bytes_written,
+            "errors": self.write_errors,
+            "write_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "write_p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        }
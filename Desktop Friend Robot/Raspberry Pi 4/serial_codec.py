@@ -0,0 +1,177 @@
+import struct
+
+SYNC = 0xA5
+SYNC_BYTE = bytes((SYNC,))
+MAX_PAYLOAD = 255
+MAX_BUFFER_BYTES = 4096
+ANGLE_CACHE_SIZE = 4096
+
+PROTO_REQUEST = "Proto: bin1"
+PROTO_ACK = "Proto: bin1 OK"
+
+T_SERVO = 0x01
+T_LIGHT = 0x02
+T_LIGHTBASE = 0x03
+T_HAPTIC = 0x04
+T_BODY = 0x05
+T_HEAD = 0x06
+T_SLEEP = 0x07
+T_TOUCH = 0x10
+T_RADAR = 0x11
+
+COMMAND_TYPES = {
+    "Servo": T_SERVO,
+    "Light": T_LIGHT,
+    "LightBase": T_LIGHTBASE,
+    "Haptic": T_HAPTIC,
+    "Body": T_BODY,
+    "Head": T_HEAD,
+    "Sleep": T_SLEEP,
+}
+TYPE_NAMES = {t: name for name, t in COMMAND_TYPES.items()}
+TYPE_NAMES[T_TOUCH] = "Touch"
+TYPE_NAMES[T_RADAR] = "Radar"
+
+ANGLE = struct.Struct("<h")
+FRAME_HEADER = struct.Struct("<BBB")
+ANGLE_FRAME = struct.Struct("<BBBhB")
+TOUCH_KEYS = ("L_BODY", "R_BODY", "F_BODY", "B_BODY", "L_HEAD", "R_HEAD")
+TOUCH_LINES = tuple("Touch: " + ", ".join(f"{key}={(mask >> bit) & 1}" for bit, key in enumerate(TOUCH_KEYS))
+                    for mask in range(1 << len(TOUCH_KEYS)))
+
+
+def _crc8_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return bytes(table)
+
+
+CRC8_TABLE = _crc8_table()
+
+
+def crc8(data, crc=0):
+    table = CRC8_TABLE
+    for b in data:
+        crc = table[crc ^ b]
+    return crc
+
+
+def encode_frame(ftype, payload):
+    crc = crc8(payload, CRC8_TABLE[CRC8_TABLE[ftype] ^ len(payload)])
+    return FRAME_HEADER.pack(SYNC, ftype, len(payload)) + payload + bytes((crc,))
+
+
+ANGLE_CRC_SEEDS = {ftype: CRC8_TABLE[CRC8_TABLE[ftype] ^ ANGLE.size] for ftype in (T_BODY, T_HEAD)}
+FLAG_FRAMES = {ftype: (encode_frame(ftype, b"\x00"), encode_frame(ftype, b"\x01")) for ftype in (T_HAPTIC, T_SLEEP)}
+angle_frames = {}
+
+
+def encode_angle(ftype, angle):
+    raw = angle & 0xFFFF
+    table = CRC8_TABLE
+    crc = table[table[ANGLE_CRC_SEEDS[ftype] ^ (raw & 0xFF)] ^ (raw >> 8)]
+    return ANGLE_FRAME.pack(SYNC, ftype, ANGLE.size, angle, crc)
+
+
+def encode_text(channel, prefix, payload):
+    return prefix + payload + b"\n"
+
+
+def encode_binary(channel, prefix, payload):
+    ftype = COMMAND_TYPES.get(channel)
+    if ftype is None:
+        return prefix + payload + b"\n"
+    if ftype == T_BODY or ftype == T_HEAD:
+        frame = angle_frames.get((ftype, payload))
+        if frame is not None:
+            return frame
+        try:
+            frame = encode_angle(ftype, round(float(payload) * 10))
+        except (ValueError, OverflowError, struct.error):
+            return prefix + payload + b"\n"
+        if len(angle_frames) >= ANGLE_CACHE_SIZE:
+            angle_frames.clear()
+        angle_frames[(ftype, payload)] = frame
+        return frame
+    if ftype == T_HAPTIC or ftype == T_SLEEP:
+        return FLAG_FRAMES[ftype][payload == b"1"]
+    if len(payload) > MAX_PAYLOAD:
+        return prefix + payload + b"\n"
+    return encode_frame(ftype, payload)
+
+
+def encode_touch(states):
+    mask = 0
+    for bit, key in enumerate(TOUCH_KEYS):
+        if states.get(key):
+            mask |= 1 << bit
+    return encode_frame(T_TOUCH, bytes((mask,)))
+
+
+def frame_to_line(ftype, payload):
+    if ftype == T_TOUCH and len(payload) == 1:
+        return TOUCH_LINES[payload[0] & (len(TOUCH_LINES) - 1)]
+    if ftype == T_RADAR and len(payload) == 1:
+        return f"Radar: {payload[0]}"
+    name = TYPE_NAMES.get(ftype)
+    if name is None:
+        return None
+    if ftype == T_BODY or ftype == T_HEAD:
+        return f"{name}: {ANGLE.unpack(payload)[0] / 10:.1f}" if len(payload) == 2 else None
+    if ftype == T_HAPTIC or ftype == T_SLEEP:
+        return f"{name}: {payload[0]}" if len(payload) == 1 else None
+    return f"{name}: {payload.decode('utf-8', errors='ignore')}"
+
+
+class StreamDecoder:
+    def __init__(self):
+        self.buf = bytearray()
+        self.frames = 0
+        self.crc_errors = 0
+
+    def feed(self, data):
+        buf = self.buf
+        buf += data
+        lines = []
+        i = 0
+        while True:
+            nl = buf.find(b"\n", i)
+            sync = buf.find(SYNC_BYTE, i, nl if nl >= 0 else len(buf))
+            if sync < 0:
+                if nl < 0:
+                    break
+                line = buf[i:nl].decode("utf-8", errors="ignore").strip()
+                if line:
+                    lines.append(line)
+                i = nl + 1
+                continue
+
+            if len(buf) - sync < 3:
+                break
+            end = sync + 3 + buf[sync + 2] + 1
+            if end > len(buf):
+                break
+            if crc8(buf[sync + 1:end - 1]) != buf[end - 1]:
+                self.crc_errors += 1
+                if sync == i:
+                    i += 1
+                else:
+                    del buf[sync]
+                continue
+            line = frame_to_line(buf[sync + 1], bytes(buf[sync + 3:end - 1]))
+            self.frames += 1
+            if line:
+                lines.append(line)
+            if sync == i:
+                i = end
+            else:
+                del buf[sync:end]
+        if i:
+            del buf[:i]
+        if len(buf) > MAX_BUFFER_BYTES:
+            buf.clear()
+        return lines
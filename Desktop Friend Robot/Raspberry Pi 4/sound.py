@@ -2,8 +2,12 @@ import os
 import subprocess
 import time
 import shutil
+import argparse
+import threading
 from glob import glob
 import paho.mqtt.client as mqtt
+import tracing
+from sound_engine import SoundLibrary, PlaybackEngine, AlsaSink, NullSink, WavSink, POLICY_MIX, POLICY_RESTART
 
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
@@ -13,6 +17,13 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SOUND_FOLDER = os.path.join(BASE_DIR, "sound")
 
 SOUND_EXTENSIONS = [".wav"]
+SOUND_POLICIES = {
+    "meow": (POLICY_RESTART, None),
+}
+DEFAULT_POLICY = (POLICY_MIX, 0.5)
+SOUND_ALIASES = {
+    "cat": "meow",
+}
 
 
 def log(msg):
@@ -27,6 +38,7 @@ def find_aplay():
 
 
 APLAY = find_aplay()
+APLAY_DEVICE = None
 
 
 def list_available_sounds():
@@ -64,6 +76,47 @@ def resolve_sound_path(name: str) -> str | None:
     return None
 
 
+class SoundState:
+    def __init__(self, library=None, engine=None):
+        self.library = library
+        self.engine = engine
+
+    def stop(self):
+        if self.engine is not None:
+            self.engine.stop()
+        if self.library is not None:
+            self.library.stop()
+
+
+def open_sink(output, device="default", wav_out=None):
+    if output == "null":
+        return NullSink()
+    if output == "wav":
+        return WavSink(wav_out)
+    return AlsaSink(device)
+
+
+def open_library(preload=True):
+    if preload:
+        return SoundLibrary(SOUND_FOLDER, SOUND_EXTENSIONS, SOUND_ALIASES)
+    return SoundLibrary(SOUND_FOLDER, SOUND_EXTENSIONS, SOUND_ALIASES, preload_bytes=0)
+
+
+def start_library(library):
+    thread = threading.Thread(target=library.run, name="sound-library", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_engine(sink, library=None, reopen=None):
+    library = library or open_library()
+    start_library(library)
+    engine = PlaybackEngine(sink, reopen=reopen)
+    thread = threading.Thread(target=engine.run, name="sound-engine", daemon=True)
+    thread.start()
+    return SoundState(library, engine), thread
+
+
 def on_connect(client, userdata, flags, reasonCode, properties=None):
     try:
         code = int(reasonCode)
@@ -75,9 +128,38 @@ def on_connect(client, userdata, flags, reasonCode, properties=None):
 
 
 def on_message(client, userdata, msg):
+    ctx = tracing.received(msg) if tracing.enabled else None
     sound_name = msg.payload.decode("utf-8").strip()
     log(f"Received MQTT message on {msg.topic}: {sound_name}")
 
+    if userdata is None or userdata.library is None:
+        play_with_aplay(sound_name, ctx)
+        return
+
+    library = userdata.library
+    entry = library.lookup(sound_name)
+    if entry is None:
+        names = library.names()
+        log(f"Sound file not found for payload '{sound_name}'. "
+            f"Available ({len(names)}): {names[:20]}{' ...' if len(names) > 20 else ''}")
+        return
+    if userdata.engine is None:
+        play_file(entry.path, ctx)
+        return
+    if entry.clip is None:
+        library.request(entry, lambda clip: play_clip(userdata.engine, entry.path, clip, ctx))
+        return
+    play_clip(userdata.engine, entry.path, entry.clip, ctx)
+
+
+def play_clip(engine, path, clip, ctx=None):
+    policy, max_age = SOUND_POLICIES.get(clip.name.lower(), DEFAULT_POLICY)
+    if not engine.play(clip, ctx, policy, max_age):
+        log("Sound engine has stopped; playing with aplay instead")
+        play_file(path, ctx)
+
+
+def play_with_aplay(sound_name, ctx=None):
     if not os.path.isdir(SOUND_FOLDER):
         log(f"Sound folder not found: {SOUND_FOLDER}")
         return
@@ -87,14 +169,23 @@ def on_message(client, userdata, msg):
         log(f"Sound file not found for payload '{sound_name}'. "
             f"Available: {list_available_sounds()}")
         return
+    play_file(path, ctx)
 
+
+def play_file(path, ctx=None):
     if not APLAY:
         log("Audio player 'aplay' not found. Install with: sudo apt-get install alsa-utils")
         return
 
     log(f"Playing sound: {path}")
+    if ctx is not None:
+        tracing.span(ctx, "sound start", ctx.received)
+    play_start = time.monotonic()
     try:
-        subprocess.run([APLAY, "-q", path], check=True)
+        device = ["-D", APLAY_DEVICE] if APLAY_DEVICE else []
+        subprocess.run([APLAY, "-q", *device, path], check=True)
+        if ctx is not None:
+            tracing.span(ctx, "sound play", play_start)
         log(f"Finished playing: {path}")
     except subprocess.CalledProcessError as e:
         log(f"Audio player returned error: {e}")
@@ -105,17 +196,40 @@ def on_message(client, userdata, msg):
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Play sounds named on the /sound topic.")
+    parser.add_argument("--output", choices=("alsa", "null", "wav", "aplay"), default="alsa",
+                        help="Keep one ALSA stream open, discard or record the mix, or run aplay per sound.")
+    parser.add_argument("--device", default="default", help="ALSA device for --output alsa and aplay.")
+    parser.add_argument("--wav-out", default="sound-out.wav", help="File written by --output wav.")
+    args = parser.parse_args()
+    global APLAY_DEVICE
+    APLAY_DEVICE = args.device
+
+    tracing.setup("sound")
     if not os.path.exists(SOUND_FOLDER):
         os.makedirs(SOUND_FOLDER, exist_ok=True)
         log(f"Created sound folder: {SOUND_FOLDER}")
 
     log(f"Using SOUND_FOLDER={SOUND_FOLDER}")
-    log(f"Available sounds: {list_available_sounds()}")
-    log(f"Using aplay at: {APLAY if APLAY else 'NOT FOUND'}")
+
+    state = None
+    thread = None
+    if args.output != "aplay":
+        try:
+            state, thread = start_engine(open_sink(args.output, args.device, args.wav_out),
+                                         reopen=lambda: open_sink(args.output, args.device, args.wav_out))
+        except (OSError, ImportError) as e:
+            log(f"Could not open the {args.output} output ({e}); falling back to aplay per sound")
+    if state is None:
+        state = SoundState(open_library(preload=False))
+        start_library(state.library)
+        log(f"Using aplay at: {APLAY if APLAY else 'NOT FOUND'}")
+    log(f"Sound library: {state.library.stats()}")
 
     client = mqtt.Client(
         protocol=mqtt.MQTTv5,
         callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+        userdata=state,
     )
     client.on_connect = on_connect
     client.on_message = on_message
@@ -135,6 +249,9 @@ def main():
     finally:
         client.loop_stop()
         client.disconnect()
+        state.stop()
+        if thread is not None:
+            thread.join(timeout=1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+import io
+import os
+import sys
+import math
+import time
+import wave
+import array
+import bisect
+import shutil
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import contextlib
+import tracemalloc
+from metrics import percentile
+import numpy as np
+from sound_engine import (
+    OUTPUT_RATE,
+    SoundLibrary,
+    PlaybackEngine,
+    NullSink,
+    WavSink,
+    AlsaSink,
+    POLICY_MIX,
+    POLICY_RESTART,
+    POLICY_DROP,
+    POLICY_QUEUE,
+)
+from sound_index import SoundIndex
+from fake_devices import FakeClient, FakeMessage
+
+
+def write_tone(path, duration, rate=OUTPUT_RATE, freq=880.0, amplitude=12000):
+    samples = array.array("h", (int(amplitude * math.sin(2 * math.pi * freq * i / rate))
+                                for i in range(int(duration * rate))))
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples.tobytes())
+
+
+def sound_folder(args, tmp, sounds=None, amplitude=12000):
+    if args.folder:
+        return args.folder, sorted(os.path.splitext(f)[0] for f in os.listdir(args.folder) if f.endswith(".wav"))
+    sounds = sounds or args.sounds
+    for index in range(sounds):
+        write_tone(os.path.join(tmp, f"tone{index}.wav"), args.clip_ms / 1000, freq=440.0 * (index + 1),
+                   amplitude=amplitude)
+    return tmp, [f"tone{index}" for index in range(sounds)]
+
+
+def wait_idle(engine, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if engine.settled == engine.triggers:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def overlaps(placements, name):
+    spans = sorted((start, start + frames) for clip, start, frames in placements if clip.name == name)
+    return sum(1 for (_, end), (start, _) in zip(spans, spans[1:]) if start < end)
+
+
+def ms(values):
+    return f"p50={percentile(values, 50) * 1000:8.2f} ms p99={percentile(values, 99) * 1000:8.2f} ms"
+
+
+class LoopbackCapture:
+    def __init__(self, device, rate=OUTPUT_RATE, quiet_ms=2.0, period_ms=5.0):
+        self.rate = rate
+        self.quiet = int(rate * quiet_ms / 1000)
+        self.chunk = int(rate * period_ms / 1000) * 2
+        self.onsets = []
+        cmd = ["arecord", "-q", "-D", device, "-t", "raw", "-f", "S16_LE", "-r", str(rate), "-c", "1",
+               "--period-time", str(int(period_ms * 1000)), "-"]
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        self.thread = threading.Thread(target=self.run, name="loopback-capture", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        quiet = self.quiet
+        rest = b""
+        while True:
+            data = self.proc.stdout.read1(self.chunk)
+            if not data:
+                return
+            now = time.monotonic()
+            data = rest + data
+            usable = len(data) - len(data) % 2
+            rest = data[usable:]
+            samples = np.frombuffer(data[:usable], dtype="<i2")
+            loud = np.flatnonzero(samples)
+            if len(loud):
+                gaps = np.diff(loud, prepend=loud[0] - quiet - 1) - 1
+                for index in loud[gaps >= self.quiet]:
+                    self.onsets.append(now - (len(samples) - index) / self.rate)
+                quiet = len(samples) - 1 - loud[-1]
+            else:
+                quiet += len(samples)
+
+    def close(self):
+        self.proc.terminate()
+        self.proc.wait(timeout=2)
+        self.thread.join(timeout=1)
+
+
+def first_after(triggers, onsets):
+    return [onsets[index] - trigger for trigger in triggers
+            if (index := bisect.bisect_left(onsets, trigger)) < len(onsets)]
+
+
+def bench_latency(args):
+    import sound
+
+    if shutil.which("aplay") is None or shutil.which("arecord") is None:
+        sys.exit("latency needs aplay and arecord (sudo apt-get install alsa-utils)")
+    try:
+        with open("/proc/asound/cards") as f:
+            loopback = "Loopback" in f.read()
+    except OSError:
+        loopback = False
+    if not loopback:
+        sys.exit("latency plays into the ALSA loopback card; load it with: sudo modprobe snd-aloop")
+    with tempfile.TemporaryDirectory() as tmp:
+        folder, names = sound_folder(args, tmp)
+        sound.SOUND_FOLDER = folder
+        rng = random.Random(args.seed)
+        picks = [rng.choice(names) for _ in range(args.count)]
+        client = FakeClient()
+        capture = LoopbackCapture(args.capture)
+        time.sleep(0.2)
+
+        sink = AlsaSink(args.device)
+        state, thread = sound.start_engine(sink)
+        time.sleep(0.2)
+        triggers, callbacks = [], []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name in picks:
+                time.sleep(args.gap_ms / 1000)
+                triggers.append(time.monotonic())
+                sound.on_message(client, state, FakeMessage("/sound", name))
+                callbacks.append(time.monotonic() - triggers[-1])
+            time.sleep(args.gap_ms / 1000 + 0.2)
+        state.stop()
+        thread.join(timeout=2)
+        engine_latency = first_after(triggers, list(capture.onsets))
+        reported = list(state.engine.latencies)
+
+        sound.APLAY = shutil.which("aplay")
+        sound.APLAY_DEVICE = args.device
+        capture.onsets.clear()
+        triggers, blocked = [], []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name in picks[:args.spawn_count]:
+                time.sleep(args.gap_ms / 1000)
+                triggers.append(time.monotonic())
+                sound.on_message(client, sound.SoundState(), FakeMessage("/sound", name))
+                blocked.append(time.monotonic() - triggers[-1])
+            time.sleep(0.2)
+        spawn_latency = first_after(triggers, list(capture.onsets))
+        capture.close()
+
+    print(f"Trigger to first sample captured from {args.capture} ({len(names)} sounds, {args.gap_ms:g} ms apart):")
+    print(f"  engine, {sink.kind:<15} {ms(engine_latency)}  n={len(engine_latency)}")
+    print(f"  engine's own estimate   {ms(reported)}  n={len(reported)}")
+    print(f"  aplay per sound         {ms(spawn_latency)}  n={len(spawn_latency)}")
+    print("/sound callback time:")
+    print(f"  engine                  {ms(callbacks)}")
+    print(f"  aplay per sound         {ms(blocked)}  blocks until the sound has played")
+    if len(engine_latency) < args.count or len(spawn_latency) < len(triggers):
+        print(f"FAIL: only {len(engine_latency)}/{args.count} engine and {len(spawn_latency)}/{len(triggers)} "
+              f"aplay sounds reached the output")
+        sys.exit(1)
+    failures = []
+    if percentile(engine_latency, 50) >= percentile(spawn_latency, 50):
+        failures.append(f"engine p50 {percentile(engine_latency, 50) * 1000:.2f} ms is not below aplay's "
+                        f"{percentile(spawn_latency, 50) * 1000:.2f} ms")
+    if percentile(engine_latency, 99) * 1000 > args.max_p99_ms:
+        failures.append(f"engine p99 {percentile(engine_latency, 99) * 1000:.2f} ms > {args.max_p99_ms} ms")
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+    print(f"PASS: the engine reaches the output before aplay per sound, p99 <= {args.max_p99_ms} ms")
+
+
+def bench_burst(args):
+    import sound
+
+    policies = {
+        "tone0": (POLICY_RESTART, None),
+        "tone1": (POLICY_DROP, None),
+        "tone2": (POLICY_QUEUE, args.max_age_ms / 1000),
+        "tone3": (POLICY_MIX, None),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        folder, names = sound_folder(args, tmp, sounds=len(policies), amplitude=20000)
+        sound.SOUND_FOLDER = folder
+        sound.SOUND_POLICIES = policies
+        out_path = args.out or os.path.join(tmp, "burst.out")
+        rng = random.Random(args.seed)
+        client = FakeClient()
+
+        state, thread = sound.start_engine(WavSink(out_path))
+        engine = state.engine
+        callbacks = []
+        start = time.monotonic()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for index in range(args.count):
+                delay = start + index / args.rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                t0 = time.perf_counter()
+                sound.on_message(client, state, FakeMessage("/sound", rng.choice(names)))
+                callbacks.append(time.perf_counter() - t0)
+        drained = wait_idle(engine)
+        state.stop()
+        thread.join(timeout=2)
+
+        with wave.open(out_path, "rb") as w:
+            output = np.frombuffer(w.readframes(w.getnframes()), dtype="<i2")
+        expected = np.zeros(engine.frames * engine.sink.channels, dtype=np.int32)
+        placements = list(engine.placements)
+        for clip, first, frames in placements:
+            lo = first * clip.channels
+            expected[lo:lo + frames * clip.channels] += clip.samples[:frames * clip.channels]
+        expected = np.clip(expected, -32768, 32767).astype("<i2")
+        mismatched = int(np.count_nonzero(output != expected)) if len(output) == len(expected) else -1
+        clipped = int(np.count_nonzero((output == 32767) | (output == -32768)))
+
+    stats = engine.latency_stats()
+    accounted = (stats["played"] + stats["dropped"] + stats["restarted"] + stats["stale"] + stats["stolen"]
+                 + stats["overflow"])
+    print(f"Burst of {args.count} /sound messages at {args.rate:g}/s into a WAV sink "
+          f"({len(names)} tones of {args.clip_ms:g} ms, clipping on overlap):")
+    print(f"  on_message              {ms(callbacks)}  max={max(callbacks) * 1000:.2f} ms")
+    print(f"  trigger to first sample p50={stats['p50_ms']:8.2f} ms p99={stats['p99_ms']:8.2f} ms")
+    print(f"  played={stats['played']} restarted={stats['restarted']} dropped={stats['dropped']} "
+          f"stale={stats['stale']} stolen={stats['stolen']} overflow={stats['overflow']} "
+          f"peak voices={stats['peak_voices']}")
+    print(f"  output {len(output)} samples, {clipped} clipped, {mismatched} differ from the reference mix")
+
+    failures = []
+    if not drained:
+        failures.append("the engine did not drain")
+    if accounted != stats["triggers"]:
+        failures.append(f"{stats['triggers'] - accounted} triggers unaccounted for")
+    if len(placements) == engine.placements.maxlen:
+        failures.append(f"more than {engine.placements.maxlen} voices; lower --count to check the mix")
+    elif mismatched != 0:
+        failures.append("output differs from the reference mix" if mismatched > 0 else "output length differs")
+    for name, (policy, _) in policies.items():
+        if policy != POLICY_MIX and overlaps(placements, name):
+            failures.append(f"{name} ({policy}) overlapped itself")
+    if percentile(callbacks, 99) * 1000 > args.max_callback_ms:
+        failures.append(f"on_message p99 {percentile(callbacks, 99) * 1000:.2f} ms > {args.max_callback_ms} ms")
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+    print(f"PASS: mix matches the reference and on_message p99 <= {args.max_callback_ms} ms")
+
+
+class FlakySink(NullSink):
+    def __init__(self, fail_at, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail_at = fail_at
+        self.writes = 0
+
+    def consume(self, data):
+        self.writes += 1
+        if self.writes == self.fail_at:
+            raise BrokenPipeError("stand-in audio device went away")
+        super().consume(data)
+
+
+class FirstSoundSink(NullSink):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failed = False
+
+    def consume(self, data):
+        if not self.failed and any(data):
+            self.failed = True
+            raise BrokenPipeError("stand-in audio device went away on the first sound")
+        super().consume(data)
+
+
+def bench_failover(args):
+    import sound
+    import tracing
+
+    results = {}
+    cases = (("reopen", lambda: FlakySink(args.fail_at), NullSink, False),
+             ("no reopen", lambda: FlakySink(args.fail_at), None, False),
+             ("traced", FirstSoundSink, NullSink, True))
+    with tempfile.TemporaryDirectory() as tmp:
+        folder, names = sound_folder(args, tmp)
+        sound.SOUND_FOLDER = folder
+        client = FakeClient()
+        fallback = []
+        play_file = sound.play_file
+        sound.play_file = lambda path, ctx=None: fallback.append(path)
+        try:
+            for label, sink, reopen, traced in cases:
+                fallback.clear()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    if traced:
+                        tracing.setup("sound", os.path.join(tmp, "traces"))
+                    state, thread = sound.start_engine(sink(), reopen=reopen)
+                    for index in range(args.count):
+                        time.sleep(args.gap_ms / 1000)
+                        msg = FakeMessage("/sound", names[index % len(names)])
+                        if traced:
+                            msg.properties = tracing.outgoing(tracing.start())
+                        sound.on_message(client, state, msg)
+                    wait_idle(state.engine, timeout=2.0)
+                alive = thread.is_alive()
+                running = state.engine.running
+                state.stop()
+                thread.join(timeout=2)
+                spans = tracing.ring.count if tracing.ring is not None else 0
+                tracing.shutdown()
+                results[label] = (alive, running, state.engine.latency_stats(), len(state.engine.pending),
+                                  len(fallback), spans)
+        finally:
+            sound.play_file = play_file
+
+    print(f"Audio output failing on write {args.fail_at} (traced: on the first sound), "
+          f"then {args.count} /sound messages:")
+    for label, (alive, running, stats, pending, fell_back, spans) in results.items():
+        print(f"  {label:<10} engine alive={alive} running={running} played={stats['played']} "
+              f"sink errors={stats['sink_errors']} reopens={stats['reopens']} pending={pending} "
+              f"aplay fallbacks={fell_back} spans={spans}")
+    failures = []
+    alive, running, stats, pending, fell_back, spans = results["reopen"]
+    if not alive or stats["reopens"] != 1 or stats["played"] < args.count - 2:
+        failures.append("the engine did not recover after reopening the output")
+    alive, running, stats, pending, fell_back, spans = results["no reopen"]
+    if alive or running or pending or fell_back + stats["played"] < args.count - 2:
+        failures.append("triggers after the output died were neither played nor handed to aplay")
+    alive, running, stats, pending, fell_back, spans = results["traced"]
+    if alive != running or stats["reopens"] != 1 or stats["played"] < args.count - 2 or not spans:
+        failures.append("a traced sound whose first write failed stopped the engine")
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+    print("PASS: the engine reopens its output, or hands new sounds to aplay once it cannot")
+
+
+def write_library(folder, count, rng):
+    header = wav_bytes(16)
+    names = []
+    for index in range(count):
+        name = f"{rng.choice(('Cat', 'dog', 'BEEP', 'chirp', 'Purr'))}_{index:05d}"
+        ext = ".WAV" if index % 7 == 0 else ".wav"
+        with open(os.path.join(folder, name + ext), "wb") as f:
+            f.write(header)
+        names.append((name, ext))
+    return names
+
+
+def wav_bytes(frames, rate=16000):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(bytes(frames * 2))
+    return buf.getvalue()
+
+
+def bench_index(args):
+    import sound
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as folder:
+        files = write_library(folder, args.files, rng)
+        aliases = {f"alias{index}": files[index][0] for index in range(0, len(files), 10)}
+        sound.SOUND_FOLDER = folder
+
+        queries = []
+        for _ in range(args.lookups):
+            name, ext = rng.choice(files)
+            kind = rng.random()
+            if kind < 0.4:
+                queries.append(name.lower())
+            elif kind < 0.7:
+                queries.append((name + ext).upper())
+            elif kind < 0.9:
+                queries.append(rng.choice(list(aliases)))
+            else:
+                queries.append(f"missing_{rng.randrange(10 ** 6)}")
+
+        clock = [0.0]
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        index = SoundIndex(folder, sound.SOUND_EXTENSIONS, aliases, clock=lambda: clock[0])
+        build = time.perf_counter() - t0
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        t0 = time.perf_counter()
+        for query in queries:
+            index.lookup(query)
+        indexed = (time.perf_counter() - t0) / len(queries)
+
+        legacy_queries = [q for q in queries if not q.startswith("alias")][:args.legacy_lookups]
+        mismatched = 0
+        t0 = time.perf_counter()
+        for query in legacy_queries:
+            path = sound.resolve_sound_path(query)
+            if path is None:
+                sound.list_available_sounds()
+            entry = index.lookup(query)
+            if path != (entry.path if entry else None):
+                mismatched += 1
+        legacy = (time.perf_counter() - t0) / len(legacy_queries)
+
+        def settle(path):
+            past = time.time() - 10 * index.settle_time
+            os.utime(path, (past, past))
+
+        fresh_path = os.path.join(folder, "Fresh_Sound.wav")
+        with open(fresh_path, "wb") as f:
+            f.write(wav_bytes(32))
+        t0 = time.perf_counter()
+        index.refresh()
+        added = time.perf_counter() - t0
+        copying = index.lookup("fresh_sound")
+        settle(fresh_path)
+        clock[0] += index.restat_interval
+        index.refresh()
+        fresh = index.lookup("fresh_sound")
+
+        overwritten_path = os.path.join(folder, files[2][0] + files[2][1])
+        with open(overwritten_path, "r+b") as f:
+            f.truncate(0)
+            f.write(wav_bytes(64))
+        settle(overwritten_path)
+        clock[0] += index.restat_interval
+        t0 = time.perf_counter()
+        index.refresh()
+        overwrite = time.perf_counter() - t0
+        overwritten = index.lookup(files[2][0])
+
+        os.remove(os.path.join(folder, files[1][0] + files[1][1]))
+        t0 = time.perf_counter()
+        index.refresh()
+        removed = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        index.refresh()
+        idle = time.perf_counter() - t0
+        clock[0] += index.restat_interval
+        t0 = time.perf_counter()
+        index.refresh()
+        restat = time.perf_counter() - t0
+        stats = index.stats()
+        incremental_ok = (copying is None and stats["settling"] >= 1 and fresh is not None and fresh.frames == 32
+                          and overwritten is not None and overwritten.frames == 64
+                          and index.lookup(files[1][0]) is None and stats["added"] == args.files + 1
+                          and stats["updated"] == 1 and stats["removed"] == 1)
+
+        library = SoundLibrary(folder, sound.SOUND_EXTENSIONS, aliases, preload_bytes=0)
+        library.index.restat_interval = args.restat_ms / 1000
+        state = sound.SoundState(library, PlaybackEngine(NullSink()))
+        threads = [threading.Thread(target=library.run, args=(args.restat_ms / 1000,), daemon=True),
+                   threading.Thread(target=state.engine.run, daemon=True)]
+        for thread in threads:
+            thread.start()
+        client = FakeClient()
+        names = [name for name, _ in files[3:]]
+        scans = library.index.scans
+        callbacks = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name in names[:args.callbacks]:
+                time.sleep(0.001)
+                t0 = time.perf_counter()
+                sound.on_message(client, state, FakeMessage("/sound", name))
+                callbacks.append(time.perf_counter() - t0)
+            deadline = time.monotonic() + 5.0
+            while library.loads < args.callbacks and time.monotonic() < deadline:
+                time.sleep(0.01)
+        background_scans = library.index.scans - scans
+        state.stop()
+        for thread in threads:
+            thread.join(timeout=2)
+        loaded = library.loads
+
+    print(f"Sound index over {args.files} files with {len(aliases)} aliases:")
+    print(f"  build          {build * 1000:8.1f} ms  (WAV headers only)")
+    print(f"  memory         {memory / 1024:8.1f} KiB  ({memory / args.files:.0f} B per sound)")
+    print(f"  index lookup   {indexed * 1e6:8.2f} us  over {len(queries)} lookups (names, name+ext, aliases, misses)")
+    print(f"  legacy resolve {legacy * 1e6:8.2f} us  over {len(legacy_queries)} lookups "
+          f"(listdir per call, glob on misses), {legacy / indexed:.0f}x slower")
+    print(f"  refresh after adding one file {added * 1000:.2f} ms, after removing one {removed * 1000:.2f} ms, "
+          f"after overwriting one in place {overwrite * 1000:.2f} ms")
+    print(f"  refresh with nothing due {idle * 1e6:.1f} us, timed re-stat every {index.restat_interval:g} s "
+          f"{restat * 1000:.2f} ms")
+    print(f"  /sound callback {ms(callbacks)}  max={max(callbacks) * 1000:.2f} ms over {len(callbacks)} messages, "
+          f"while the library thread re-stat the folder {background_scans} times and loaded {loaded} clips")
+    if mismatched:
+        print(f"FAIL: {mismatched} lookups resolved differently from resolve_sound_path")
+        sys.exit(1)
+    if not incremental_ok:
+        print(f"FAIL: incremental refresh missed a change ({index.stats()})")
+        sys.exit(1)
+    if loaded < len(callbacks) or not background_scans:
+        print(f"FAIL: the library thread loaded {loaded}/{len(callbacks)} clips in {background_scans} re-stats")
+        sys.exit(1)
+    if percentile(callbacks, 50) >= restat:
+        print(f"FAIL: /sound callback p50 {percentile(callbacks, 50) * 1000:.2f} ms is not below one re-stat")
+        sys.exit(1)
+    print("PASS: index matches resolve_sound_path, picks up added, overwritten and removed files, "
+          "and /sound leaves re-stats and loads to the library thread")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sound playback benchmarks with a null audio sink.")
+    parser.add_argument("--folder", help="Folder with WAV files; short generated tones are used when omitted.")
+    parser.add_argument("--sounds", type=int, default=4, help="Number of generated tones for latency.")
+    parser.add_argument("--clip-ms", type=float, default=40.0, help="Length of the generated tones.")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("latency", help="Trigger-to-first-sample latency of the engine versus spawning aplay, "
+                                       "both playing into the ALSA loopback card (snd-aloop).")
+    p.add_argument("--count", type=int, default=100, help="Number of /sound messages.")
+    p.add_argument("--gap-ms", type=float, default=60.0, help="Gap between messages; keep it above --clip-ms.")
+    p.add_argument("--spawn-count", type=int, default=30, help="Number of /sound messages for the aplay path.")
+    p.add_argument("--max-p99-ms", type=float, default=60.0, help="Fail if the engine's p99 exceeds this.")
+    p.add_argument("--device", default="plughw:Loopback,0,0", help="Loopback playback side for both paths.")
+    p.add_argument("--capture", default="hw:Loopback,1,0", help="Loopback capture side the onsets are read from.")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_latency)
+
+    p = sub.add_parser("burst", help="Fire a burst of triggers into a WAV sink and check the mix and policies.")
+    p.add_argument("--count", type=int, default=300, help="Number of /sound messages.")
+    p.add_argument("--rate", type=float, default=100.0, help="Messages per second.")
+    p.add_argument("--max-age-ms", type=float, default=100.0, help="Max age of queued triggers for the queue tone.")
+    p.add_argument("--max-callback-ms", type=float, default=2.0, help="Fail if on_message p99 exceeds this.")
+    p.add_argument("--out", help="Keep the mixed output here.")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_burst)
+
+    p = sub.add_parser("failover", help="Kill the audio output mid-run and check sounds keep playing.")
+    p.add_argument("--count", type=int, default=50, help="Number of /sound messages.")
+    p.add_argument("--gap-ms", type=float, default=60.0)
+    p.add_argument("--fail-at", type=int, default=5, help="Output write that raises.")
+    p.set_defaults(func=bench_failover)
+
+    p = sub.add_parser("index", help="Lookup time and memory of the sound index versus resolve_sound_path.")
+    p.add_argument("--files", type=int, default=5000, help="Number of WAV files in the generated library.")
+    p.add_argument("--lookups", type=int, default=100000, help="Number of index lookups.")
+    p.add_argument("--legacy-lookups", type=int, default=300, help="Number of resolve_sound_path lookups.")
+    p.add_argument("--callbacks", type=int, default=2000, help="Number of /sound messages to unloaded sounds.")
+    p.add_argument("--restat-ms", type=float, default=50.0, help="Library re-stat interval during the callbacks.")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_index)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,541 @@
+import os
+import time
+import wave
+import shutil
+import threading
+import subprocess
+from collections import deque
+from metrics import percentile
+import tracing
+from sound_index import SoundIndex, RESTAT_INTERVAL
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+OUTPUT_RATE = 44100
+OUTPUT_CHANNELS = 1
+OUTPUT_WIDTH = 2
+ENGINE_PERIOD = 0.01
+SINK_BUFFER = 0.03
+PIPE_BUFFER_BYTES = 4096
+LATENCY_WINDOW = 1000
+F_SETPIPE_SZ = 1031
+MAX_VOICES = 8
+RING_PERIODS = 4
+MAX_PENDING = 64
+REOPEN_ATTEMPTS = 3
+REOPEN_DELAY = 0.5
+PRELOAD_BYTES = 64 * 1024 * 1024
+
+POLICY_MIX = "mix"
+POLICY_RESTART = "restart"
+POLICY_DROP = "drop"
+POLICY_QUEUE = "queue"
+POLICIES = (POLICY_MIX, POLICY_RESTART, POLICY_DROP, POLICY_QUEUE)
+
+
+class Clip:
+    __slots__ = ("name", "path", "mtime", "rate", "channels", "width", "pcm", "frames", "samples")
+
+    def __init__(self, name, path, mtime, rate, channels, width, pcm):
+        self.name = name
+        self.path = path
+        self.mtime = mtime
+        self.rate = rate
+        self.channels = channels
+        self.width = width
+        self.pcm = pcm
+        self.frames = len(pcm) // (channels * width)
+        self.samples = np.frombuffer(pcm, dtype="<i2") if np is not None else None
+
+    @property
+    def duration(self):
+        return self.frames / self.rate
+
+
+def convert_pcm(pcm, rate, channels, width, out_rate, out_channels):
+    if (rate, channels, width) == (out_rate, out_channels, OUTPUT_WIDTH):
+        return pcm
+    if np is None:
+        raise ValueError(f"{rate} Hz/{channels} ch/{width * 8} bit needs NumPy to convert")
+    dtypes = {1: np.uint8, 2: np.int16, 4: np.int32}
+    if width not in dtypes:
+        raise ValueError(f"Unsupported sample width {width}")
+    samples = np.frombuffer(pcm, dtype=dtypes[width]).astype(np.float32)
+    if width == 1:
+        samples = (samples - 128.0) * 256.0
+    elif width == 4:
+        samples /= 65536.0
+    samples = samples.reshape(-1, channels)
+    if channels != out_channels:
+        mono = samples.mean(axis=1, keepdims=True)
+        samples = np.repeat(mono, out_channels, axis=1)
+    if rate != out_rate and len(samples):
+        count = max(1, int(round(len(samples) * out_rate / rate)))
+        positions = np.linspace(0, len(samples) - 1, count)
+        samples = np.stack([np.interp(positions, np.arange(len(samples)), samples[:, c])
+                            for c in range(out_channels)], axis=1)
+    return np.clip(samples, -32768, 32767).astype("<i2").tobytes()
+
+
+def load_clip(name, path, rate=OUTPUT_RATE, channels=OUTPUT_CHANNELS):
+    with wave.open(path, "rb") as w:
+        params = w.getparams()
+        pcm = w.readframes(params.nframes)
+    if params.comptype != "NONE":
+        raise ValueError(f"Compressed WAV ({params.comptype}) is not supported")
+    pcm = convert_pcm(pcm, params.framerate, params.nchannels, params.sampwidth, rate, channels)
+    return Clip(name, path, os.stat(path).st_mtime_ns, rate, channels, OUTPUT_WIDTH, pcm)
+
+
+class SoundLibrary:
+    def __init__(self, folder, extensions=(".wav",), aliases=None, rate=OUTPUT_RATE, channels=OUTPUT_CHANNELS,
+                 preload_bytes=PRELOAD_BYTES):
+        self.rate = rate
+        self.channels = channels
+        self.preload_bytes = preload_bytes
+        self.index = SoundIndex(folder, extensions, aliases)
+        self.loads = 0
+        self.errors = 0
+        self.wake = threading.Condition()
+        self.requests = deque()
+        self.running = True
+        self.preload()
+
+    def preload(self):
+        budget = self.preload_bytes
+        for entry in sorted(self.index.snapshot(), key=lambda e: e.size):
+            if entry.clip is None and entry.size > budget:
+                break
+            if self.clip(entry) is not None:
+                budget -= len(entry.clip.pcm)
+
+    def refresh(self):
+        if self.index.refresh():
+            self.preload()
+            return True
+        return False
+
+    def request(self, entry, then):
+        with self.wake:
+            self.requests.append((entry, then))
+            self.wake.notify()
+
+    def run(self, interval=RESTAT_INTERVAL):
+        while True:
+            with self.wake:
+                if self.running and not self.requests:
+                    self.wake.wait(interval)
+                if not self.running:
+                    break
+                requests = list(self.requests)
+                self.requests.clear()
+            for entry, then in requests:
+                clip = self.clip(entry)
+                if clip is None:
+                    continue
+                try:
+                    then(clip)
+                except Exception as e:
+                    print(f"Playing loaded sound {entry.path} failed: {e}")
+            self.refresh()
+
+    def stop(self):
+        with self.wake:
+            self.running = False
+            self.wake.notify()
+
+    def lookup(self, name):
+        return self.index.lookup(name)
+
+    def clip(self, entry):
+        if entry.clip is None:
+            try:
+                entry.clip = load_clip(entry.name, entry.path, self.rate, self.channels)
+                self.loads += 1
+            except (OSError, EOFError, ValueError, wave.Error) as e:
+                self.errors += 1
+                print(f"Failed to load sound {entry.path}: {e}")
+        return entry.clip
+
+    def resolve(self, name):
+        entry = self.lookup(name)
+        return self.clip(entry) if entry is not None else None
+
+    def names(self):
+        return self.index.names()
+
+    def stats(self):
+        stats = self.index.stats()
+        clips = [entry.clip for entry in self.index.snapshot() if entry.clip is not None]
+        stats.update({"loaded": len(clips), "bytes": sum(len(clip.pcm) for clip in clips),
+                      "loads": self.loads, "load_errors": self.errors})
+        return stats
+
+
+class PacedSink:
+    def __init__(self, rate=OUTPUT_RATE, channels=OUTPUT_CHANNELS, width=OUTPUT_WIDTH, buffer=SINK_BUFFER,
+                 clock=time.monotonic):
+        self.rate = rate
+        self.channels = channels
+        self.width = width
+        self.buffer = buffer
+        self.clock = clock
+        self.started_at = None
+        self.frames_written = 0
+
+    def wait(self):
+        if self.started_at is None:
+            return
+        ahead = self.started_at + self.frames_written / self.rate - self.clock()
+        if ahead > self.buffer:
+            time.sleep(ahead - self.buffer)
+
+    def write(self, data):
+        now = self.clock()
+        if self.started_at is None or self.started_at + self.frames_written / self.rate < now:
+            self.started_at = now - self.frames_written / self.rate
+        plays_at = self.started_at + self.frames_written / self.rate
+        self.consume(data)
+        self.frames_written += len(data) // (self.channels * self.width)
+        return plays_at
+
+    def consume(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+class NullSink(PacedSink):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bytes_written = 0
+
+    def consume(self, data):
+        self.bytes_written += len(data)
+
+
+class WavSink(PacedSink):
+    def __init__(self, path, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wav = wave.open(path, "wb")
+        self.wav.setnchannels(self.channels)
+        self.wav.setsampwidth(self.width)
+        self.wav.setframerate(self.rate)
+
+    def consume(self, data):
+        self.wav.writeframesraw(data)
+
+    def close(self):
+        self.wav.close()
+
+
+class AlsaSink:
+    def __init__(self, device="default", rate=OUTPUT_RATE, channels=OUTPUT_CHANNELS, width=OUTPUT_WIDTH,
+                 period=ENGINE_PERIOD):
+        self.rate = rate
+        self.channels = channels
+        self.width = width
+        self.pcm = None
+        self.proc = None
+        self.queued_until = 0.0
+        period_frames = int(rate * period)
+        periods = max(2, round(SINK_BUFFER / period))
+        try:
+            import alsaaudio
+        except ImportError:
+            alsaaudio = None
+        if alsaaudio is not None:
+            try:
+                self.pcm = alsaaudio.PCM(alsaaudio.PCM_PLAYBACK, device=device, channels=channels, rate=rate,
+                                         format=alsaaudio.PCM_FORMAT_S16_LE, periodsize=period_frames,
+                                         periods=periods)
+            except alsaaudio.ALSAAudioError as e:
+                raise OSError(str(e))
+            self.kind = "alsaaudio"
+            self.buffer = periods * period_frames / rate
+        else:
+            aplay = shutil.which("aplay")
+            if aplay is None:
+                raise OSError("Neither pyalsaaudio nor aplay is available")
+            cmd = [aplay, "-q", "-t", "raw", "-f", "S16_LE", "-r", str(rate), "-c", str(channels),
+                   "--buffer-time", str(int(SINK_BUFFER * 1e6)), "-D", device, "-"]
+            self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+            try:
+                import fcntl
+                fcntl.fcntl(self.proc.stdin.fileno(), F_SETPIPE_SZ, PIPE_BUFFER_BYTES)
+            except OSError:
+                pass
+            self.kind = "aplay pipe"
+            self.buffer = SINK_BUFFER + PIPE_BUFFER_BYTES / (rate * channels * width)
+
+    def wait(self):
+        pass
+
+    def write(self, data):
+        duration = len(data) / (self.rate * self.channels * self.width)
+        plays_at = max(self.queued_until, time.monotonic())
+        if self.pcm is not None:
+            self.pcm.write(bytes(data))
+        else:
+            self.proc.stdin.write(data)
+            self.proc.stdin.flush()
+        now = time.monotonic()
+        self.queued_until = min(max(plays_at, now) + duration, now + self.buffer)
+        return self.queued_until - duration
+
+    def close(self):
+        if self.pcm is not None:
+            self.pcm.close()
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()
+            except OSError:
+                pass
+            self.proc.wait(timeout=2)
+
+
+class Voice:
+    __slots__ = ("clip", "offset", "triggered_at", "trace", "policy", "max_age", "started", "first_sample",
+                 "start_frame")
+
+    def __init__(self, clip, triggered_at, trace, policy, max_age):
+        self.clip = clip
+        self.offset = 0
+        self.triggered_at = triggered_at
+        self.trace = trace
+        self.policy = policy
+        self.max_age = max_age
+        self.started = False
+        self.first_sample = None
+        self.start_frame = None
+
+
+class PlaybackEngine:
+    def __init__(self, sink, period=ENGINE_PERIOD, max_voices=MAX_VOICES, ring_periods=RING_PERIODS,
+                 clock=time.monotonic, reopen=None, max_pending=MAX_PENDING):
+        if np is None:
+            raise ImportError("NumPy is required to mix sounds")
+        self.sink = sink
+        self.clock = clock
+        self.reopen = reopen
+        self.max_voices = max_voices
+        self.max_pending = max_pending
+        self.period_frames = int(sink.rate * period)
+        self.period_samples = self.period_frames * sink.channels
+        self.mix = np.zeros(self.period_samples, dtype=np.int32)
+        self.ring = np.zeros((ring_periods, self.period_samples), dtype="<i2")
+        self.slots = [memoryview(row).cast("B") for row in self.ring]
+        self.slot = 0
+        self.silence = bytes(self.period_samples * sink.width)
+        self.frames = 0
+        self.lock = threading.Lock()
+        self.pending = deque()
+        self.active = []
+        self.waiting = {}
+        self.running = True
+        self.triggers = 0
+        self.settled = 0
+        self.played = 0
+        self.dropped = 0
+        self.restarted = 0
+        self.stale = 0
+        self.stolen = 0
+        self.overflow = 0
+        self.sink_errors = 0
+        self.reopens = 0
+        self.peak_voices = 0
+        self.starts = deque(maxlen=LATENCY_WINDOW)
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.placements = deque(maxlen=LATENCY_WINDOW)
+
+    def play(self, clip, trace=None, policy=POLICY_MIX, max_age=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown playback policy {policy!r}")
+        with self.lock:
+            if not self.running:
+                return False
+            if len(self.pending) >= self.max_pending:
+                self.pending.popleft()
+                self.overflow += 1
+            self.pending.append(Voice(clip, self.clock(), trace, policy, max_age))
+            self.triggers += 1
+        return True
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+
+    def admit(self, voice):
+        name = voice.clip.name
+        playing = [v for v in self.active if v.clip.name == name]
+        if voice.policy == POLICY_DROP and playing:
+            self.dropped += 1
+        elif voice.policy == POLICY_RESTART and playing:
+            for old in playing:
+                self.retire(old)
+                self.restarted += 1
+            self.begin(voice)
+        elif voice.policy == POLICY_QUEUE and (playing or self.waiting.get(name)):
+            self.waiting.setdefault(name, deque()).append(voice)
+        else:
+            self.begin(voice)
+
+    def begin(self, voice):
+        if len(self.active) >= self.max_voices:
+            self.retire(self.active[0])
+            self.stolen += 1
+        voice.start_frame = self.frames
+        self.active.append(voice)
+        self.peak_voices = max(self.peak_voices, len(self.active))
+
+    def retire(self, voice):
+        self.active.remove(voice)
+        self.placements.append((voice.clip, voice.start_frame, voice.offset // voice.clip.channels))
+
+    def promote(self, now):
+        for name in list(self.waiting):
+            queue = self.waiting[name]
+            if any(v.clip.name == name for v in self.active):
+                continue
+            while queue:
+                voice = queue.popleft()
+                if voice.max_age is not None and now - voice.triggered_at > voice.max_age:
+                    self.stale += 1
+                    continue
+                self.begin(voice)
+                break
+            if not queue:
+                del self.waiting[name]
+
+    def render(self):
+        now = self.clock()
+        with self.lock:
+            incoming = list(self.pending)
+            self.pending.clear()
+            seen = self.triggers
+        for voice in incoming:
+            if voice.max_age is not None and now - voice.triggered_at > voice.max_age:
+                self.stale += 1
+                continue
+            self.admit(voice)
+        self.promote(now)
+        if not self.active:
+            self.settled = seen
+            self.frames += self.period_frames
+            return self.silence, [], []
+
+        mix = self.mix
+        mix[:] = 0
+        started = []
+        finished = []
+        for voice in self.active:
+            if not voice.started:
+                voice.started = True
+                started.append(voice)
+            samples = voice.clip.samples
+            take = min(self.period_samples, len(samples) - voice.offset)
+            mix[:take] += samples[voice.offset:voice.offset + take]
+            voice.offset += take
+            if voice.offset >= len(samples):
+                finished.append(voice)
+        for voice in finished:
+            self.retire(voice)
+            self.played += 1
+        self.frames += self.period_frames
+        if finished:
+            self.promote(now)
+
+        out = self.ring[self.slot]
+        np.clip(mix, -32768, 32767, out=mix)
+        out[:] = mix
+        data = self.slots[self.slot]
+        self.slot = (self.slot + 1) % len(self.ring)
+        return data, started, finished
+
+    def run(self):
+        try:
+            while True:
+                with self.lock:
+                    if not self.running:
+                        break
+                try:
+                    self.step()
+                except Exception as e:
+                    print(f"Audio output failed: {e}")
+                    if not self.recover():
+                        break
+        finally:
+            with self.lock:
+                self.running = False
+                self.pending.clear()
+            self.close_sink()
+
+    def step(self):
+        self.sink.wait()
+        data, started, finished = self.render()
+        try:
+            plays_at = self.sink.write(data)
+        except Exception:
+            self.sink_errors += 1
+            for voice in started:
+                voice.started = False
+            raise
+        for voice in started:
+            voice.first_sample = plays_at
+            self.starts.append((plays_at, voice.clip.name))
+            self.latencies.append(plays_at - voice.triggered_at)
+            if voice.trace is not None:
+                tracing.span(voice.trace, "sound start", voice.trace.received, plays_at)
+        for voice in finished:
+            if voice.trace is not None and voice.first_sample is not None:
+                tracing.span(voice.trace, "sound play", voice.first_sample,
+                             plays_at + ((voice.clip.frames - 1) % self.period_frames + 1) / self.sink.rate)
+
+    def close_sink(self):
+        try:
+            self.sink.close()
+        except Exception as e:
+            print(f"Closing the audio output failed: {e}")
+
+    def recover(self):
+        self.close_sink()
+        for attempt in range(REOPEN_ATTEMPTS if self.reopen is not None else 0):
+            time.sleep(REOPEN_DELAY * attempt)
+            with self.lock:
+                if not self.running:
+                    return False
+            try:
+                self.sink = self.reopen()
+            except Exception as e:
+                print(f"Reopening the audio output failed: {e}")
+                continue
+            self.reopens += 1
+            print("Reopened the audio output")
+            return True
+        with self.lock:
+            self.running = False
+            self.pending.clear()
+        print("Audio output is gone; the engine has stopped")
+        return False
+
+    def latency_stats(self):
+        latencies = list(self.latencies)
+        return {
+            "triggers": self.triggers,
+            "played": self.played,
+            "dropped": self.dropped,
+            "restarted": self.restarted,
+            "stale": self.stale,
+            "stolen": self.stolen,
+            "overflow": self.overflow,
+            "sink_errors": self.sink_errors,
+            "reopens": self.reopens,
+            "peak_voices": self.peak_voices,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "max_ms": round(max(latencies, default=0.0) * 1000, 2),
+        }
@@ -0,0 +1,200 @@
+import os
+import time
+import wave
+import bisect
+import threading
+
+RESTAT_INTERVAL = 2.0
+SETTLE_TIME = 0.5
+
+
+class SoundEntry:
+    __slots__ = ("filename", "name", "path", "mtime", "size", "rate", "channels", "width", "frames", "clip")
+
+    def __init__(self, filename, path, mtime, size, rate, channels, width, frames):
+        self.filename = filename
+        self.name = os.path.splitext(filename)[0]
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.rate = rate
+        self.channels = channels
+        self.width = width
+        self.frames = frames
+        self.clip = None
+
+    @property
+    def duration(self):
+        return self.frames / self.rate if self.rate else 0.0
+
+    def metadata(self):
+        return {
+            "name": self.name,
+            "file": self.filename,
+            "duration": round(self.duration, 3),
+            "rate": self.rate,
+            "channels": self.channels,
+            "bits": self.width * 8,
+            "bytes": self.size,
+        }
+
+
+def read_entry(filename, path, stat):
+    with wave.open(path, "rb") as w:
+        params = w.getparams()
+    if params.comptype != "NONE":
+        raise ValueError(f"Compressed WAV ({params.comptype}) is not supported")
+    return SoundEntry(filename, path, stat.st_mtime_ns, stat.st_size, params.framerate, params.nchannels,
+                      params.sampwidth, params.nframes)
+
+
+class SoundIndex:
+    def __init__(self, folder, extensions=(".wav",), aliases=None, restat_interval=RESTAT_INTERVAL,
+                 settle_time=SETTLE_TIME, clock=time.monotonic):
+        self.folder = folder
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.restat_interval = restat_interval
+        self.settle_time = settle_time
+        self.clock = clock
+        self.scanned_at = None
+        self.lock = threading.Lock()
+        self.scanning = threading.Lock()
+        self.entries = {}
+        self.by_name = {}
+        self.by_base = {}
+        self.aliases = {}
+        self.broken = {}
+        self.folder_mtime = None
+        self.scans = 0
+        self.added = 0
+        self.removed = 0
+        self.updated = 0
+        self.settling = 0
+        self.errors = 0
+        for alias, target in (aliases or {}).items():
+            self.add_alias(alias, target)
+        self.refresh()
+
+    def add_alias(self, alias, target):
+        self.aliases[alias.strip().lower()] = target.strip().lower()
+
+    def link(self, entry):
+        bisect.insort(self.by_name.setdefault(entry.filename.lower(), []), entry.filename)
+        bisect.insort(self.by_base.setdefault(entry.name.lower(), []), entry.filename)
+
+    def unlink(self, entry):
+        for table, key in ((self.by_name, entry.filename.lower()), (self.by_base, entry.name.lower())):
+            names = table[key]
+            names.remove(entry.filename)
+            if not names:
+                del table[key]
+
+    def scan(self):
+        seen = set()
+        changes = []
+        settled_before = time.time() - self.settle_time if self.scans else float("inf")
+        for item in os.scandir(self.folder):
+            if os.path.splitext(item.name)[1].lower() not in self.extensions or not item.is_file():
+                continue
+            seen.add(item.name)
+            stat = item.stat()
+            old = self.entries.get(item.name)
+            if old is not None and old.mtime == stat.st_mtime_ns and old.size == stat.st_size:
+                continue
+            if stat.st_mtime > settled_before:
+                self.settling += 1
+                continue
+            if self.broken.get(item.name) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            try:
+                changes.append((old, read_entry(item.name, item.path, stat)))
+                self.broken.pop(item.name, None)
+            except (OSError, EOFError, ValueError, wave.Error) as e:
+                self.errors += 1
+                self.broken[item.name] = (stat.st_mtime_ns, stat.st_size)
+                print(f"Failed to index sound {item.path}: {e}")
+                changes.append((old, None))
+        gone = [entry for filename, entry in self.entries.items() if filename not in seen]
+        for filename in [name for name in self.broken if name not in seen]:
+            del self.broken[filename]
+
+        with self.lock:
+            for entry in gone:
+                self.unlink(entry)
+                del self.entries[entry.filename]
+                self.removed += 1
+            for old, entry in changes:
+                if old is not None:
+                    self.unlink(old)
+                    del self.entries[old.filename]
+                if entry is None:
+                    continue
+                self.entries[entry.filename] = entry
+                self.link(entry)
+                if old is None:
+                    self.added += 1
+                else:
+                    self.updated += 1
+            self.scans += 1
+        return len(gone) + len(changes)
+
+    def due(self, mtime, now):
+        return mtime != self.folder_mtime or now - self.scanned_at >= self.restat_interval
+
+    def refresh(self):
+        try:
+            mtime = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            return False
+        now = self.clock()
+        if not self.due(mtime, now):
+            return False
+        with self.scanning:
+            if not self.due(mtime, now):
+                return False
+            self.folder_mtime = mtime
+            self.scanned_at = now
+            return self.scan() > 0
+
+    def lookup(self, name):
+        if not name:
+            return None
+        name = os.path.basename(name).strip()
+        with self.lock:
+            entry = self.find(name)
+            if entry is None:
+                target = self.aliases.get(name.lower())
+                if target is not None:
+                    entry = self.find(target)
+        return entry
+
+    def find(self, name):
+        lower = name.lower()
+        if os.path.splitext(lower)[1]:
+            entry = self.entries.get(name)
+            if entry is not None:
+                return entry
+            names = self.by_name.get(lower)
+        else:
+            names = self.by_base.get(lower)
+        return self.entries[names[0]] if names else None
+
+    def names(self):
+        with self.lock:
+            return sorted(self.entries)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.entries.values())
+
+    def stats(self):
+        return {
+            "sounds": len(self.entries),
+            "aliases": len(self.aliases),
+            "scans": self.scans,
+            "added": self.added,
+            "removed": self.removed,
+            "updated": self.updated,
+            "settling": self.settling,
+            "errors": self.errors,
+        }
@@ -0,0 +1,622 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import queue
+import bisect
+import random
+import argparse
+import resource
+import tempfile
+import threading
+import contextlib
+import collections
+import tracing
+from metrics import percentile, summarize_ms
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+NODES = ("serial", "main", "screen", "sound", "follow")
+SERIAL_BAUD = 115200
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+CONNECT = object()
+
+TOUCH_LINE = "Touch: L_BODY=0, R_BODY=0, F_BODY=0, B_BODY=0, L_HEAD={}, R_HEAD={}"
+
+AUDIO_SINK = """#!{python}
+import sys, time, wave
+start = time.monotonic()
+path = sys.argv[-1]
+with open({log!r}, "a") as f:
+    f.write(f"{{start}} {{path}}\\n")
+if {realtime!r}:
+    with wave.open(path) as w:
+        time.sleep(w.getnframes() / w.getframerate())
+"""
+
+
+class BrokerMessage:
+    __slots__ = ("topic", "payload", "seq", "qos", "retain", "properties")
+
+    def __init__(self, topic, payload, seq, properties=None):
+        self.topic = topic
+        self.payload = payload
+        self.seq = seq
+        self.qos = 0
+        self.retain = False
+        self.properties = properties
+
+
+class LocalBroker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = []
+        self.seq = 0
+        self.log = []
+
+    def client(self, name, userdata=None):
+        client = BrokerClient(self, name, userdata)
+        with self.lock:
+            self.clients.append(client)
+        return client
+
+    def route(self, sender, topic, payload, cause, properties=None):
+        if payload is None:
+            payload = b""
+        elif isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        elif not isinstance(payload, (bytes, bytearray)):
+            payload = str(payload).encode("utf-8")
+        with self.lock:
+            self.seq += 1
+            msg = BrokerMessage(topic, bytes(payload), self.seq, properties)
+            self.log.append((time.monotonic(), msg.seq, sender.name, topic, msg.payload, cause))
+            targets = [c for c in self.clients if topic in c.subscriptions]
+        for client in targets:
+            client.inbox.put(msg)
+        return msg
+
+
+class BrokerClient:
+    def __init__(self, broker, name, userdata=None):
+        self.broker = broker
+        self.name = name
+        self.userdata = userdata
+        self.on_connect = None
+        self.on_message = None
+        self.subscriptions = set()
+        self.inbox = queue.Queue()
+        self.connected = threading.Event()
+        self.thread = None
+        self.cause = None
+        self.delivered = 0
+        self.errors = 0
+
+    def user_data_set(self, userdata):
+        self.userdata = userdata
+
+    def connect(self, host="localhost", port=1883, *args, **kwargs):
+        self.inbox.put(CONNECT)
+
+    def loop_start(self):
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def loop_stop(self):
+        self.inbox.put(None)
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+
+    def disconnect(self):
+        with self.broker.lock:
+            if self in self.broker.clients:
+                self.broker.clients.remove(self)
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        cause = self.cause if threading.current_thread() is self.thread else None
+        self.broker.route(self, topic, payload, cause, properties)
+
+    def subscribe(self, topic, *args, **kwargs):
+        with self.broker.lock:
+            self.subscriptions.add(topic)
+
+    def unsubscribe(self, topic, *args, **kwargs):
+        with self.broker.lock:
+            self.subscriptions.discard(topic)
+
+    def loop(self):
+        while True:
+            item = self.inbox.get()
+            if item is None:
+                return
+            try:
+                if item is CONNECT:
+                    if self.on_connect:
+                        self.on_connect(self, self.userdata, {}, 0)
+                    self.connected.set()
+                    continue
+                self.cause = item.seq
+                self.delivered += 1
+                if self.on_message:
+                    self.on_message(self, self.userdata, item)
+            except Exception as e:
+                self.errors += 1
+                print(f"[{self.name}] callback failed: {e}")
+            finally:
+                self.cause = None
+
+
+class TimedPusher:
+    def __init__(self, pusher):
+        self.pusher = pusher
+        self.renderer = None
+        self.frames = []
+
+    def push(self, frames, index):
+        self.pusher.push(frames, index)
+        self.frames.append((time.monotonic(), self.renderer.current))
+
+
+class Node:
+    def __init__(self, name, client):
+        self.name = name
+        self.client = client
+        self.tids = set()
+        self.stoppers = []
+        self.stats = None
+
+
+def start_node(name, start, *args):
+    before = set(threading.enumerate())
+    node = start(*args)
+    threads = set(threading.enumerate()) - before
+    node.tids = {t.native_id for t in threads}
+    tracing.name_threads(name, threads)
+    if not node.client.connected.wait(5):
+        raise RuntimeError(f"{name} node did not connect")
+    return node
+
+
+def start_serial(broker, esp32, args):
+    import serial
+    from serial_bridge import ROUTES, SerialReader, SerialWriter, handle_serial_line, on_message
+
+    ser = serial.Serial(esp32.port, SERIAL_BAUD, timeout=1)
+    writer = SerialWriter(ser)
+    userdata = {"writer": writer, "sleeping": False, "proto_ack": threading.Event()}
+    client = broker.client("serial", userdata)
+
+    def on_connect(c, userdata, flags, rc, properties=None):
+        for topic in ROUTES:
+            c.subscribe(topic)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect()
+    client.loop_start()
+
+    reader = SerialReader(ser, lambda line: handle_serial_line(client, userdata, line))
+    threads = [threading.Thread(target=reader.run, daemon=True), threading.Thread(target=writer.run, daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    node = Node("serial", client)
+
+    def stop():
+        reader.stop()
+        writer.stop()
+        for thread in threads:
+            thread.join(timeout=1)
+        ser.close()
+    node.stoppers.append(stop)
+    node.stats = writer.stats
+    return node
+
+
+def start_main(broker, esp32, args):
+    import main
+    from scheduler import Scheduler
+
+    scheduler = Scheduler()
+    threading.Thread(target=scheduler.run, daemon=True).start()
+    state = main.HeadState(scheduler)
+    client = broker.client("main", state)
+    state.client = tracing.traced(client)
+    client.on_connect = main.on_connect
+    client.on_message = main.on_message
+    client.connect()
+    client.loop_start()
+
+    node = Node("main", client)
+    node.stoppers.append(lambda: (state.machine.stop(), scheduler.stop()))
+    node.stats = state.machine.stats
+    return node
+
+
+def start_screen(broker, esp32, args):
+    import screen
+    from fake_devices import FakeDisplay, SPI_BAUDRATE
+    from screen_frames import FramePusher
+    from screen_render import ScreenRenderer
+
+    display = FakeDisplay(baudrate=SPI_BAUDRATE)
+    screen.gif_directory = args.screen_dir
+    frame_source, names = screen.open_frame_source(display, "rgb565", True, None)
+    frame_source.preload(sorted(names, key=lambda name: name != "normal"))
+    pusher = TimedPusher(FramePusher(display, delta=True))
+    renderer = ScreenRenderer(pusher, frame_source)
+    pusher.renderer = renderer
+    state = screen.ScreenState(renderer, names)
+    client = broker.client("screen", state)
+    client.on_connect = screen.on_connect
+    client.on_message = screen.on_message
+    client.connect()
+    client.loop_start()
+
+    thread = threading.Thread(target=renderer.run, daemon=True)
+    thread.start()
+    screen.show_expression(client, state, "normal", time.monotonic())
+
+    node = Node("screen", client)
+    node.pusher = pusher
+    node.stoppers.append(lambda: (renderer.stop(), thread.join(timeout=1)))
+    node.stats = renderer.latency_stats
+    return node
+
+
+def write_fake_aplay(workdir, realtime=True):
+    sink = os.path.join(workdir, "aplay")
+    node_log = os.path.join(workdir, "sound-starts.log")
+    with open(sink, "w") as f:
+        f.write(AUDIO_SINK.format(python=sys.executable, log=node_log, realtime=realtime))
+    os.chmod(sink, 0o755)
+    open(node_log, "w").close()
+    return sink, node_log
+
+
+def start_sound(broker, esp32, args):
+    import sound
+    from sound_engine import NullSink
+
+    sound.SOUND_FOLDER = args.sound_dir
+    if args.audio == "engine":
+        state, thread = sound.start_engine(NullSink())
+    else:
+        sound.APLAY, node_log = write_fake_aplay(args.workdir, args.audio_realtime)
+        state = sound.SoundState()
+
+    client = broker.client("sound", state)
+    client.on_connect = sound.on_connect
+    client.on_message = sound.on_message
+    client.connect()
+    client.loop_start()
+
+    node = Node("sound", client)
+    if state.engine is not None:
+        node.starts = lambda: list(state.engine.starts)
+        node.stoppers.append(lambda: (state.stop(), thread.join(timeout=1)))
+        node.stats = state.engine.latency_stats
+    else:
+        node.starts = lambda: sound_starts(node_log)
+    return node
+
+
+def start_follow(broker, esp32, args):
+    import follow
+    from fake_devices import FakeCamera, StubDetector
+    from follow_governor import RateGovernor
+    from follow_pipeline import FollowPipeline
+
+    sleeping = threading.Event()
+    client = broker.client("follow")
+    pan = follow.PanPublisher(client, follow.MQTT_TOPIC_FOLLOW)
+    controller = follow.FollowController(client, follow.MQTT_TOPIC_FOLLOW, sleeping, pan=pan)
+    governor = RateGovernor()
+    client.user_data_set(follow.FollowState(controller, sleeping, governor))
+    client.on_connect = follow.on_connect
+    client.on_message = follow.on_message
+    client.connect()
+    client.loop_start()
+
+    camera = FakeCamera(fps=args.camera_fps)
+    camera.start()
+
+    def control(result):
+        if controller.handle(result):
+            governor.saw_person()
+
+    stop_event = threading.Event()
+    pipeline = FollowPipeline(camera.capture, follow.make_infer(StubDetector(args.detect_ms / 1000)), control,
+                              stop_event=stop_event, governor=governor)
+    pipeline.start()
+    thread = threading.Thread(target=pipeline.run, daemon=True)
+    thread.start()
+
+    node = Node("follow", client)
+    node.stoppers.append(lambda: (pipeline.stop(), thread.join(timeout=2), camera.stop()))
+    node.stats = pipeline.stats
+    return node
+
+
+STARTERS = {
+    "serial": start_serial,
+    "main": start_main,
+    "screen": start_screen,
+    "sound": start_sound,
+    "follow": start_follow,
+}
+
+
+def thread_cpu(tid):
+    try:
+        with open(f"/proc/self/task/{tid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return 0.0
+    return (int(fields[11]) + int(fields[12])) / CLK_TCK
+
+
+def nodes_cpu(nodes):
+    return {node.name: sum(thread_cpu(tid) for tid in node.tids) for node in nodes}
+
+
+def synth_traffic(duration, seed):
+    rng = random.Random(seed)
+    traffic = []
+    t = 0.5
+    touch = radar = False
+    while t < duration:
+        if rng.random() < 0.55:
+            touch = not touch
+            side = rng.random() < 0.5
+            traffic.append({"t": round(t, 4), "line": TOUCH_LINE.format(int(touch and side), int(touch and not side))})
+            t += rng.uniform(0.3, 3.0) if touch else rng.expovariate(1 / 2.0)
+        else:
+            radar = not radar
+            traffic.append({"t": round(t, 4), "line": f"Radar: {int(radar)}"})
+            t += rng.expovariate(1 / 1.5)
+    return traffic
+
+
+def load_traffic(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_traffic(path, traffic):
+    with open(path, "w") as f:
+        for entry in traffic:
+            f.write(json.dumps(entry) + "\n")
+
+
+def sound_starts(path):
+    starts = []
+    with open(path) as f:
+        for line in f:
+            t, _, name = line.strip().partition(" ")
+            starts.append((float(t), os.path.splitext(os.path.basename(name))[0]))
+    return starts
+
+
+def first_after(events, times, t, match):
+    for i in range(bisect.bisect_left(times, t), len(events)):
+        if events[i][1] == match:
+            return events[i][0]
+    return None
+
+
+def reaction_latencies(broker, sent, nodes):
+    sensor = [entry for entry in broker.log if entry[2] == "serial" and entry[3] in ("/touch", "/radar")]
+    caused = collections.defaultdict(list)
+    for t, seq, sender, topic, payload, cause in broker.log:
+        if sender == "main" and cause is not None:
+            caused[cause].append((t, topic, payload.decode("utf-8", errors="ignore")))
+
+    sinks = {}
+    if "screen" in nodes:
+        sinks["/screen"] = ("screen frame", nodes["screen"].pusher.frames)
+    if "sound" in nodes:
+        sinks["/sound"] = ("sound start", nodes["sound"].starts())
+    if "serial" in nodes:
+        received = [(t, line.decode("utf-8", errors="ignore")) for t, line in nodes["serial"].esp32.received]
+        for topic, prefix in (("/servo", "Servo: "), ("/haptic", "Haptic: ")):
+            sinks[topic] = (f"ESP32 {prefix.strip(': ').lower()}", [(t, line[len(prefix):]) for t, line in received
+                                                                    if line.startswith(prefix)])
+
+    sinks = {topic: (label, events, [when for when, _ in events]) for topic, (label, events) in sinks.items()}
+    latencies = collections.defaultdict(list)
+    missed = collections.Counter()
+    for (sent_at, line), (published_at, seq, _, topic, _, _) in zip(sent, sensor):
+        latencies[f"line -> {topic} publish"].append(published_at - sent_at)
+        for t, out_topic, payload in caused.get(seq, ()):
+            latencies[f"line -> main {out_topic}"].append(t - sent_at)
+            if out_topic not in sinks:
+                continue
+            label, events, times = sinks[out_topic]
+            shown = first_after(events, times, t, payload)
+            if shown is None:
+                missed[label] += 1
+            else:
+                latencies[f"line -> {label}"].append(shown - sent_at)
+    return latencies, missed
+
+
+def run_stack(args):
+    from fake_devices import FakeESP32
+
+    traffic = load_traffic(args.trace) if args.trace else synth_traffic(args.duration, args.seed)
+    names = [name for name in args.nodes.split(",") if name]
+    for name in names:
+        if name not in STARTERS:
+            raise SystemExit(f"Unknown node {name!r}, choose from {', '.join(NODES)}")
+    if args.trace_dir:
+        tracing.setup("stack", args.trace_dir)
+
+    broker = LocalBroker()
+    esp32 = FakeESP32(baudrate=SERIAL_BAUD if args.uart_delay else 0)
+    nodes = {}
+    out = open(args.log, "w") if args.log else open(os.devnull, "w")
+    with contextlib.redirect_stdout(out):
+        for name in names:
+            nodes[name] = start_node(name, STARTERS[name], broker, esp32, args)
+        if "serial" in nodes:
+            nodes["serial"].esp32 = esp32
+
+        cpu0 = nodes_cpu(nodes.values())
+        children0 = resource.getrusage(resource.RUSAGE_CHILDREN)
+        process0 = time.process_time()
+        log_start = len(broker.log)
+        start = time.monotonic()
+        sent = []
+        for entry in traffic:
+            delay = start + entry["t"] / args.speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            sent.append((time.monotonic(), entry["line"]))
+            esp32.send_line(entry["line"])
+        time.sleep(args.settle)
+        wall = time.monotonic() - start
+        cpu1 = nodes_cpu(nodes.values())
+        children1 = resource.getrusage(resource.RUSAGE_CHILDREN)
+        process = time.process_time() - process0
+
+        for node in nodes.values():
+            for stop in node.stoppers:
+                stop()
+            node.client.loop_stop()
+            node.client.disconnect()
+        esp32.close()
+    out.close()
+    tracing.shutdown()
+
+    cpu = {name: cpu1[name] - cpu0.get(name, 0.0) for name in cpu1}
+    if "sound" in cpu:
+        cpu["sound"] += (children1.ru_utime + children1.ru_stime) - (children0.ru_utime + children0.ru_stime)
+    cpu["harness"] = max(0.0, process - sum(v for k, v in cpu.items() if k != "sound"))
+    return {
+        "traffic": traffic, "sent": sent, "wall": wall, "broker": broker, "log_start": log_start,
+        "nodes": nodes, "cpu": cpu, "esp32": esp32,
+    }
+
+
+def report(result, args):
+    broker, nodes, wall = result["broker"], result["nodes"], result["wall"]
+    log = broker.log[result["log_start"]:]
+    print(f"Stack replay (wall clock): {len(result['sent'])} sensor lines over {wall:.1f} s "
+          f"(speed x{args.speed:g}), nodes: {', '.join(nodes)}")
+
+    counts = collections.Counter(entry[3] for entry in log)
+    senders = collections.defaultdict(set)
+    for entry in log:
+        senders[entry[3]].add(entry[2])
+    print("  per-topic rates:")
+    for topic, count in sorted(counts.items(), key=lambda item: -item[1]):
+        print(f"    {topic:<11} {count:6d} msgs  {count / wall:7.2f}/s  from {', '.join(sorted(senders[topic]))}")
+    print(f"  ESP32 received {len(result['esp32'].received)} command lines ({result['esp32'].bytes_received} bytes)")
+
+    latencies, missed = reaction_latencies(broker, result["sent"], nodes)
+    print("  reaction latency (from the ESP32 sensor line):")
+    for label in sorted(latencies):
+        print(f"    {label:<26} {summarize_ms(latencies[label])}")
+    for label, count in missed.items():
+        print(f"    {label:<26} {count} commands never reached the sink")
+
+    print("  CPU per node:")
+    for name, seconds in result["cpu"].items():
+        print(f"    {name:<8} {seconds:6.2f} s  ({seconds / wall * 100:5.1f}% of one core)")
+    for name, node in nodes.items():
+        stats = node.stats() if node.stats else None
+        errors = f", {node.client.errors} callback errors" if node.client.errors else ""
+        print(f"  {name}: {node.client.delivered} messages delivered{errors}" + (f", {stats}" if stats else ""))
+
+    if args.json:
+        summary = {
+            "wall_s": wall,
+            "rates": {topic: count / wall for topic, count in counts.items()},
+            "latency_ms": {label: {"n": len(v), "p50": percentile(v, 50) * 1000, "p99": percentile(v, 99) * 1000}
+                           for label, v in latencies.items()},
+            "cpu_s": result["cpu"],
+        }
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+def cmd_run(args):
+    with tempfile.TemporaryDirectory(prefix="stack-harness-") as args.workdir:
+        report(run_stack(args), args)
+
+
+def cmd_synth(args):
+    traffic = synth_traffic(args.duration, args.seed)
+    write_traffic(args.out, traffic)
+    print(f"Wrote {len(traffic)} sensor lines over {args.duration:.0f} s to {args.out}")
+
+
+def cmd_record(args):
+    import serial
+    from serial_codec import StreamDecoder
+
+    ser = serial.Serial(args.port, SERIAL_BAUD, timeout=0.2)
+    decoder = StreamDecoder()
+    traffic = []
+    start = time.monotonic()
+    try:
+        while time.monotonic() - start < args.duration:
+            data = ser.read(ser.in_waiting or 1)
+            now = time.monotonic() - start
+            for line in decoder.feed(data):
+                if line.startswith(("Touch:", "Radar:")):
+                    traffic.append({"t": round(now, 4), "line": line})
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ser.close()
+    write_traffic(args.out, traffic)
+    print(f"Recorded {len(traffic)} sensor lines to {args.out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the robot's MQTT nodes in-process against a stand-in broker and fake devices.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="Replay sensor traffic through the stack in wall-clock time and report rates, "
+                       "reaction latency and CPU.")
+    p.add_argument("--trace", help="Sensor traffic (JSON lines of t and line) to replay; defaults to synthetic traffic.")
+    p.add_argument("--duration", type=float, default=60.0, help="Length of the synthetic traffic in seconds.")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--speed", type=float, default=1.0,
+                   help="Replay this many times faster than recorded; nodes still run on the real clock.")
+    p.add_argument("--settle", type=float, default=4.0, help="Seconds to keep running after the last line.")
+    p.add_argument("--nodes", default=",".join(NODES), help="Comma-separated nodes to run.")
+    p.add_argument("--screen-dir", default=os.path.join(BASE_DIR, "screen"))
+    p.add_argument("--sound-dir", default=os.path.join(BASE_DIR, "sound"))
+    p.add_argument("--audio", choices=("engine", "aplay"), default="engine",
+                   help="Play into the preloaded engine with a null sink, or spawn a fake aplay per sound.")
+    p.add_argument("--audio-realtime", action=argparse.BooleanOptionalAction, default=True,
+                   help="Let the fake aplay take as long as the sound plays.")
+    p.add_argument("--uart-delay", action=argparse.BooleanOptionalAction, default=True,
+                   help="Drain the fake ESP32 at the real baud rate.")
+    p.add_argument("--camera-fps", type=float, default=30.0)
+    p.add_argument("--detect-ms", type=float, default=60.0, help="Latency of the stub person detector.")
+    p.add_argument("--log", help="Write the nodes' console output here instead of discarding it.")
+    p.add_argument("--json", help="Also write a machine-readable summary here.")
+    p.add_argument("--trace-dir", help="Record trace spans here; read them back with tracing.py report.")
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser("synth", help="Write synthetic sensor traffic for later replays.")
+    p.add_argument("--duration", type=float, default=300.0)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--out", required=True)
+    p.set_defaults(func=cmd_synth)
+
+    p = sub.add_parser("record", help="Record Touch:/Radar: lines from a real ESP32 serial port.")
+    p.add_argument("--port", default="/dev/serial0")
+    p.add_argument("--duration", type=float, default=600.0)
+    p.add_argument("--out", required=True)
+    p.set_defaults(func=cmd_record)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+import os
+import glob
+import mmap
+import time
+import random
+import struct
+import argparse
+import threading
+import collections
+from metrics import percentile
+
+TRACE_DIR_ENV = "ROBOT_TRACE_DIR"
+TRACE_CAPACITY_ENV = "ROBOT_TRACE_SPANS"
+TRACE_CAPACITY = 16384
+TRACE_MAGIC = b"SPANS001"
+HEADER = struct.Struct("<8sQQ")
+SPAN = struct.Struct("<QQQ16s32s")
+PROP_TRACE = "trace"
+PROP_SENT = "sent"
+HISTOGRAM_BOUNDS_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+enabled = False
+ring = None
+node_name = ""
+thread_nodes = {}
+local = threading.local()
+
+
+class TraceContext:
+    __slots__ = ("id", "sent", "received")
+
+    def __init__(self, trace_id, sent, received):
+        self.id = trace_id
+        self.sent = sent
+        self.received = received
+
+
+class SpanRing:
+    def __init__(self, path, capacity=TRACE_CAPACITY):
+        size = HEADER.size + capacity * SPAN.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            existing = os.fstat(fd).st_size
+            if existing != size:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        magic, old_capacity, count = HEADER.unpack_from(self.map, 0)
+        if magic != TRACE_MAGIC or old_capacity != capacity or existing != size:
+            count = 0
+        self.capacity = capacity
+        self.count = count
+        self.lock = threading.Lock()
+        HEADER.pack_into(self.map, 0, TRACE_MAGIC, capacity, count)
+
+    def write(self, trace_id, start, end, node, name):
+        with self.lock:
+            offset = HEADER.size + (self.count % self.capacity) * SPAN.size
+            SPAN.pack_into(self.map, offset, trace_id, int(start * 1e9), int(end * 1e9),
+                           node.encode()[:16], name.encode()[:32])
+            self.count += 1
+            HEADER.pack_into(self.map, 0, TRACE_MAGIC, self.capacity, self.count)
+
+    def close(self):
+        self.map.close()
+
+
+def read_spans(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        return []
+    magic, capacity, count = HEADER.unpack_from(data, 0)
+    if magic != TRACE_MAGIC:
+        return []
+    first = max(0, count - capacity)
+    spans = []
+    for i in range(first, count):
+        trace_id, start, end, node, name = SPAN.unpack_from(data, HEADER.size + (i % capacity) * SPAN.size)
+        spans.append((trace_id, start / 1e9, end / 1e9, node.rstrip(b"\0").decode(), name.rstrip(b"\0").decode()))
+    return spans
+
+
+def setup(node, directory=None):
+    global enabled, ring, node_name
+    directory = directory or os.environ.get(TRACE_DIR_ENV)
+    if not directory:
+        return False
+    os.makedirs(directory, exist_ok=True)
+    capacity = int(os.environ.get(TRACE_CAPACITY_ENV, TRACE_CAPACITY))
+    path = os.path.join(directory, f"{node}.spans")
+    ring = SpanRing(path, capacity)
+    node_name = node
+    enabled = True
+    print(f"Tracing enabled -> {path} ({capacity} spans)")
+    return True
+
+
+def name_threads(node, threads):
+    for thread in threads:
+        thread_nodes[thread.ident] = node
+
+
+def shutdown():
+    global enabled, ring
+    enabled = False
+    thread_nodes.clear()
+    if ring is not None:
+        ring.close()
+        ring = None
+
+
+def start():
+    now = time.monotonic()
+    return TraceContext(random.getrandbits(63) or 1, now, now)
+
+
+def received(msg):
+    props = getattr(msg, "properties", None)
+    pairs = getattr(props, "UserProperty", None) if props is not None else None
+    if not pairs:
+        local.ctx = None
+        return None
+    values = dict(pairs)
+    try:
+        ctx = TraceContext(int(values[PROP_TRACE], 16), float(values[PROP_SENT]), time.monotonic())
+    except (KeyError, ValueError):
+        local.ctx = None
+        return None
+    span(ctx, f"mqtt {msg.topic}", ctx.sent, ctx.received)
+    local.ctx = ctx
+    return ctx
+
+
+def current():
+    return getattr(local, "ctx", None)
+
+
+def finish(ctx, name):
+    span(ctx, name, ctx.received)
+    local.ctx = None
+
+
+def span(ctx, name, start_time, end_time=None):
+    if ring is None or ctx is None:
+        return
+    ring.write(ctx.id, start_time, time.monotonic() if end_time is None else end_time,
+               thread_nodes.get(threading.get_ident(), node_name), name)
+
+
+def outgoing(ctx=None):
+    ctx = ctx or current()
+    if ctx is None:
+        return None
+    from paho.mqtt.properties import Properties
+    from paho.mqtt.packettypes import PacketTypes
+
+    props = Properties(PacketTypes.PUBLISH)
+    props.UserProperty = [(PROP_TRACE, f"{ctx.id:016x}"), (PROP_SENT, repr(time.monotonic()))]
+    return props
+
+
+class TracedClient:
+    def __init__(self, client):
+        self.client = client
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        if properties is None:
+            properties = outgoing()
+        return self.client.publish(topic, payload, qos, retain, properties)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def traced(client):
+    return TracedClient(client) if enabled else client
+
+
+def load_spans(directory):
+    spans = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.spans"))):
+        spans.extend(read_spans(path))
+    return spans
+
+
+def histogram(values_ms, width=30):
+    counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+    for value in values_ms:
+        index = 0
+        while index < len(HISTOGRAM_BOUNDS_MS) and value > HISTOGRAM_BOUNDS_MS[index]:
+            index += 1
+        counts[index] += 1
+    peak = max(counts) or 1
+    lines = []
+    for index, count in enumerate(counts):
+        if not count:
+            continue
+        label = f"<= {HISTOGRAM_BOUNDS_MS[index]:g} ms" if index < len(HISTOGRAM_BOUNDS_MS) else \
+            f">  {HISTOGRAM_BOUNDS_MS[-1]:g} ms"
+        lines.append(f"      {label:>12} {count:6d} {'#' * max(1, round(count / peak * width))}")
+    return lines
+
+
+def summary(values_ms):
+    return (f"n={len(values_ms)} p50={percentile(values_ms, 50):.2f} ms p90={percentile(values_ms, 90):.2f} ms "
+            f"p99={percentile(values_ms, 99):.2f} ms max={max(values_ms):.2f} ms")
+
+
+def cmd_report(args):
+    spans = load_spans(args.dir)
+    if not spans:
+        print(f"No spans in {args.dir}")
+        return
+    traces = collections.defaultdict(list)
+    for span_entry in spans:
+        traces[span_entry[0]].append(span_entry)
+
+    if args.trace:
+        trace_id = int(args.trace, 16)
+        entries = sorted(traces.get(trace_id, ()), key=lambda s: s[1])
+        if not entries:
+            print(f"Trace {args.trace} not found")
+            return
+        origin = entries[0][1]
+        print(f"Trace {trace_id:016x}:")
+        for _, start_time, end_time, node, name in entries:
+            print(f"  +{(start_time - origin) * 1000:8.2f} ms  {(end_time - start_time) * 1000:8.2f} ms  "
+                  f"{node:<12} {name}")
+        return
+
+    hops = collections.defaultdict(list)
+    reach = collections.defaultdict(list)
+    for entries in traces.values():
+        origin = min(s[1] for s in entries)
+        for _, start_time, end_time, node, name in entries:
+            hops[(node, name)].append((end_time - start_time) * 1000)
+            reach[(node, name)].append((end_time - origin) * 1000)
+
+    print(f"{len(spans)} spans in {len(traces)} traces from {args.dir}")
+    print("Per-hop latency:")
+    for (node, name), values in sorted(hops.items(), key=lambda item: percentile(reach[item[0]], 50)):
+        print(f"  {node}: {name:<24} {summary(values)}")
+        if args.histogram:
+            for line in histogram(values):
+                print(line)
+    print("Time from the sensor line to the end of each hop:")
+    for (node, name), values in sorted(reach.items(), key=lambda item: percentile(item[1], 50)):
+        print(f"  {node}: {name:<24} {summary(values)}")
+
+
+def cmd_clear(args):
+    for path in glob.glob(os.path.join(args.dir, "*.spans")):
+        os.remove(path)
+        print(f"Removed {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read the span ring buffers written by the robot's MQTT nodes.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    default_dir = os.environ.get(TRACE_DIR_ENV, os.path.expanduser("~/RobotFriend/traces"))
+
+    p = sub.add_parser("report", help="Per-hop latency summaries and histograms.")
+    p.add_argument("--dir", default=default_dir)
+    p.add_argument("--histogram", action=argparse.BooleanOptionalAction, default=True)
+    p.add_argument("--trace", help="Print the timeline of one trace ID (hex).")
+    p.set_defaults(func=cmd_report)
+
+    p = sub.add_parser("clear", help="Delete the span files.")
+    p.add_argument("--dir", default=default_dir)
+    p.set_defaults(func=cmd_clear)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()